@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, ClientAccount, SavingsTransaction, ClientAuditLog, ClientEditRequest
+from .models import UserProfile, ClientAccount, SavingsTransaction, SavingsBalanceCheckpoint, ClientAuditLog, ClientEditRequest
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -33,8 +33,8 @@ class SavingsTransactionAdmin(admin.ModelAdmin):
     list_display = ['reference_number', 'client_account', 'transaction_type', 'amount', 'transaction_date', 'processed_by', 'is_reversed']
     list_filter = ['transaction_type', 'is_reversed', 'transaction_date']
     search_fields = ['reference_number', 'client_account__account_number', 'client_account__person1_first_name', 'client_account__person1_last_name']
-    readonly_fields = ['reference_number', 'transaction_date', 'is_reversed', 'reversed_by', 'reversal_date', 'reversal_reason']
-    fieldsets = (('Transaction Details', {'fields': ('reference_number', 'client_account', 'transaction_type', 'amount', 'transaction_date', 'processed_by', 'notes')}), ('Reversal Information', {'fields': ('is_reversed', 'reversed_by', 'reversal_date', 'reversal_reason'), 'classes': ('collapse',)}))
+    readonly_fields = ['reference_number', 'transaction_date', 'sequence', 'balance_after', 'is_reversed', 'reversed_by', 'reversal_date', 'reversal_reason', 'reversal_sequence', 'reversal_balance_after']
+    fieldsets = (('Transaction Details', {'fields': ('reference_number', 'client_account', 'transaction_type', 'amount', 'transaction_date', 'processed_by', 'notes')}), ('Ledger', {'fields': ('sequence', 'balance_after')}), ('Reversal Information', {'fields': ('is_reversed', 'reversed_by', 'reversal_date', 'reversal_reason', 'reversal_sequence', 'reversal_balance_after'), 'classes': ('collapse',)}))
 
     def save_model(self, request, obj, form, change):
         if not obj.processed_by:
@@ -83,9 +83,16 @@ class ClientAuditLogAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return request.user.is_superuser
 admin.site.unregister(User)
+class SavingsBalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['client_account', 'checkpoint_date', 'sequence', 'balance', 'created_at']
+    list_filter = ['checkpoint_date']
+    search_fields = ['client_account__account_number']
+    readonly_fields = ['client_account', 'checkpoint_date', 'sequence', 'balance', 'created_at']
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(ClientAccount, ClientAccountAdmin)
 admin.site.register(SavingsTransaction, SavingsTransactionAdmin)
 admin.site.register(ClientEditRequest, ClientEditRequestAdmin)
 admin.site.register(ClientAuditLog, ClientAuditLogAdmin)
+admin.site.register(SavingsBalanceCheckpoint, SavingsBalanceCheckpointAdmin)
 admin.site.register(UserProfile)
\ No newline at end of file
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from core.models import JobLock
+from client_accounts.models import SavingsTransaction
+
+class Command(BaseCommand):
+    help = 'Number savings postings per account and persist their running balances; only accounts with unsequenced rows unless --all'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild every account with savings history, not just the unsequenced ones')
+
+    def handle(self, *args, **options):
+        with JobLock.hold('savings-ledger-backfill') as acquired:
+            if not acquired:
+                self.stdout.write('Savings ledger backfill is running elsewhere, skipping')
+                return
+            started = time.perf_counter()
+            pending = SavingsTransaction.objects.all() if options['all'] else SavingsTransaction.objects.filter(Q(sequence__isnull=True) | Q(is_reversed=True, reversal_sequence__isnull=True))
+            accounts = events = 0
+            for client_account_id in pending.values_list('client_account', flat=True).distinct().order_by('client_account').iterator():
+                count, opening = SavingsTransaction.rebuild_ledger(client_account_id)
+                accounts += 1
+                events += count
+                if opening:
+                    self.stdout.write(self.style.WARNING(f'Account {client_account_id}: history does not net to the current balance, opening balance set to {opening}'))
+        self.stdout.write(self.style.SUCCESS(f'Savings ledger backfilled for {accounts} accounts ({events} entries) in {time.perf_counter() - started:.2f}s'))
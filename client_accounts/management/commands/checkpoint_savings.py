@@ -0,0 +1,34 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.models import JobLock
+from client_accounts.models import SavingsBalanceCheckpoint
+
+class Command(BaseCommand):
+    help = 'Record closing savings balance checkpoints for a date (or a range with --since); run nightly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Checkpoint date (YYYY-MM-DD), defaults to yesterday; days that have not ended are refused')
+        parser.add_argument('--since', help='Also record every day from this date (YYYY-MM-DD) up to --date')
+
+    def handle(self, *args, **options):
+        try:
+            end = datetime.date.fromisoformat(options['date']) if options['date'] else timezone.localdate() - datetime.timedelta(days=1)
+            day = datetime.date.fromisoformat(options['since']) if options['since'] else end
+        except ValueError:
+            raise CommandError('Dates must be YYYY-MM-DD')
+        if day > end:
+            raise CommandError('--since must not be after --date')
+        if end >= timezone.localdate():
+            raise CommandError(f'Cannot checkpoint {end} before the day has ended')
+        started = time.perf_counter()
+        rows = 0
+        while day <= end:
+            with JobLock.hold(f'savings-checkpoint:{day}') as acquired:
+                if acquired:
+                    rows += len(SavingsBalanceCheckpoint.record(day))
+                else:
+                    self.stdout.write(f'Checkpoint for {day} is being recorded elsewhere, skipping')
+            day += datetime.timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Savings checkpoints: {rows} rows in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,6 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+class Migration(migrations.Migration):
+    dependencies = [('client_accounts', '0007_alter_clientaccount_created_by')]
+    operations = [migrations.AddField(model_name='clientaccount', name='savings_sequence', field=models.PositiveIntegerField(default=0, editable=False)), migrations.AddField(model_name='savingstransaction', name='sequence', field=models.PositiveIntegerField(blank=True, editable=False, null=True)), migrations.AddField(model_name='savingstransaction', name='balance_after', field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True)), migrations.AddField(model_name='savingstransaction', name='reversal_sequence', field=models.PositiveIntegerField(blank=True, editable=False, null=True)), migrations.AddField(model_name='savingstransaction', name='reversal_balance_after', field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True)), migrations.AlterUniqueTogether(name='savingstransaction', unique_together={('client_account', 'sequence')}), migrations.AddIndex(model_name='savingstransaction', index=models.Index(fields=['client_account', 'transaction_date'], name='client_acco_client__39ab40_idx')), migrations.AddIndex(model_name='savingstransaction', index=models.Index(fields=['client_account', 'reversal_date'], name='client_acco_client__f7a1c1_idx')), migrations.CreateModel(name='SavingsBalanceCheckpoint', fields=[('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('checkpoint_date', models.DateField()), ('sequence', models.PositiveIntegerField()), ('balance', models.DecimalField(decimal_places=2, max_digits=14)), ('created_at', models.DateTimeField(auto_now_add=True)), ('client_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='client_accounts.clientaccount'))], options={'verbose_name': 'Savings Balance Checkpoint', 'verbose_name_plural': 'Savings Balance Checkpoints', 'ordering': ['-checkpoint_date'], 'unique_together': {('client_account', 'checkpoint_date')}})]
@@ -0,0 +1,6 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('client_accounts', '0008_savings_ledger')]
+    operations = [migrations.AlterField(model_name='clientauditlog', name='timestamp', field=models.DateTimeField(default=django.utils.timezone.now, editable=False))]
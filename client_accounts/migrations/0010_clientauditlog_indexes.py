@@ -0,0 +1,5 @@
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('client_accounts', '0009_clientauditlog_timestamp_default')]
+    operations = [migrations.AddIndex(model_name='clientauditlog', index=models.Index(fields=['timestamp'], name='client_acco_timesta_e49153_idx')), migrations.AddIndex(model_name='clientauditlog', index=models.Index(fields=['action', 'timestamp'], name='client_acco_action_97b5fb_idx')), migrations.AddIndex(model_name='clientauditlog', index=models.Index(fields=['client', 'timestamp'], name='client_acco_client__ecc65a_idx'))]
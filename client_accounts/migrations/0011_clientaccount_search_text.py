@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+SEARCH_FIELDS = ['account_number', 'person1_first_name', 'person1_last_name', 'person1_nin', 'person2_first_name', 'person2_last_name', 'person2_nin']
+
+def fill_search_text(apps, schema_editor):
+    ClientAccount = apps.get_model('client_accounts', 'ClientAccount')
+    batch = []
+    for account in ClientAccount.objects.only('pk', *SEARCH_FIELDS).iterator(chunk_size=2000):
+        account.search_text = ' '.join(' '.join(str(getattr(account, field) or '') for field in SEARCH_FIELDS).lower().split())[:500]
+        batch.append(account)
+        if len(batch) >= 2000:
+            ClientAccount.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    ClientAccount.objects.bulk_update(batch, ['search_text'])
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS client_acco_search_trgm_idx ON client_accounts_clientaccount USING gin (search_text gin_trgm_ops)')
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS client_acco_search_trgm_idx')
+
+class Migration(migrations.Migration):
+    dependencies = [('client_accounts', '0010_clientauditlog_indexes')]
+    operations = [migrations.AddField(model_name='clientaccount', name='search_text', field=models.CharField(blank=True, db_index=True, editable=False, max_length=500)), migrations.RunPython(fill_search_text, migrations.RunPython.noop), migrations.RunPython(create_trigram_index, drop_trigram_index)]
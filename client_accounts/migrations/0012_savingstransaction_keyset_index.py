@@ -0,0 +1,5 @@
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('client_accounts', '0011_clientaccount_search_text')]
+    operations = [migrations.AddIndex(model_name='savingstransaction', index=models.Index(fields=['transaction_date', 'id'], name='client_acco_transac_fcfb94_idx'))]
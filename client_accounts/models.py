@@ -1,10 +1,17 @@
-from django.db import models, transaction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.utils import timezone
 from decimal import Decimal, InvalidOperation
+from core import audit
+from core.models import NumberSequence
+import datetime
+import hashlib
 import random
 import string
+from collections import Counter
 JSONField = models.JSONField
 
 class UserProfile(models.Model):
@@ -62,11 +69,12 @@ class ClientAuditLog(models.Model):
     action = models.CharField(max_length=30, choices=ACTION_CHOICES)
     changed_data = JSONField(blank=True, null=True)
     performed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     note = models.TextField(blank=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [models.Index(fields=['timestamp']), models.Index(fields=['action', 'timestamp']), models.Index(fields=['client', 'timestamp'])]
         verbose_name = 'Client Audit Log'
         verbose_name_plural = 'Client Audit Logs'
 
@@ -86,6 +94,13 @@ class ClientAccount(models.Model):
     STATUS_CHOICES = [(STATUS_PENDING, 'Pending Approval'), (STATUS_ACTIVE, 'Active'), (STATUS_INACTIVE, 'Inactive'), (STATUS_SUSPENDED, 'Suspended'), (STATUS_CLOSED, 'Closed')]
     ACCOUNT_TYPES = [('SINGLE', 'Single Account'), ('JOINT', 'Joint Account')]
     GENDER_CHOICES = [('M', 'Male'), ('F', 'Female'), ('O', 'Other')]
+    SEARCH_FIELDS = ['account_number', 'person1_first_name', 'person1_last_name', 'person1_nin', 'person2_first_name', 'person2_last_name', 'person2_nin']
+    SEARCH_CACHE_KEY = 'client_accounts:search'
+    SEARCH_CACHE_TTL = 60
+    SEARCH_LIMIT = 10
+    TRIGRAM_MIN_LENGTH = 3
+    MIN_LOAN_SAVINGS = Decimal('100000.00')
+    CLEAN_FIELDS = {'account_type', 'account_status', 'person1_nin', 'person2_nin', 'person2_client', 'person2_first_name', 'person2_last_name', 'person2_contact'}
     account_number = models.CharField(max_length=30, unique=True, blank=True, editable=False)
     account_type = models.CharField(max_length=10, choices=ACCOUNT_TYPES)
     account_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
@@ -115,6 +130,7 @@ class ClientAccount(models.Model):
     savings_balance = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
     total_savings_deposited = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
     last_savings_date = models.DateTimeField(null=True, blank=True)
+    savings_sequence = models.PositiveIntegerField(default=0, editable=False)
     registration_date = models.DateTimeField(auto_now_add=True)
     loan_officer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='client_accounts', help_text='Loan officer responsible for this client')
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, null=False, blank=False, related_name='created_accounts', help_text='User who created this account')
@@ -123,6 +139,7 @@ class ClientAccount(models.Model):
     is_edit_pending = models.BooleanField(default=False)
     last_edited_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='edited_accounts')
     last_edited_date = models.DateTimeField(null=True, blank=True)
+    search_text = models.CharField(max_length=500, blank=True, editable=False, db_index=True)
 
     class Meta:
         ordering = ['-registration_date']
@@ -131,13 +148,11 @@ class ClientAccount(models.Model):
         verbose_name_plural = 'Client Accounts'
 
     def generate_account_number(self):
-        year = timezone.now().year
-        random_digits = ''.join(random.choices(string.digits, k=5))
-        account_num = f'HIL-ACC-{year}-{random_digits}'
-        while ClientAccount.objects.filter(account_number=account_num).exists():
-            random_digits = ''.join(random.choices(string.digits, k=5))
-            account_num = f'HIL-ACC-{year}-{random_digits}'
-        return account_num
+        return ClientAccount.generate_account_numbers()[0]
+
+    @classmethod
+    def generate_account_numbers(cls, count=1):
+        return NumberSequence.allocate(f'HIL-ACC-{timezone.now().year}', count, cls.objects, 'account_number')
 
     def save(self, *args, **kwargs):
         if not self.account_number:
@@ -160,13 +175,86 @@ class ClientAccount(models.Model):
             if self.loan_officer:
                 self.created_by = self.loan_officer
         try:
-            self.full_clean()
+            self.validate_for_save(kwargs.get('update_fields'))
         except ValidationError as e:
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f'Validation error saving ClientAccount {self.account_number}: {e}')
             raise e
+        update_fields = kwargs.get('update_fields')
+        searchable = update_fields is None or bool(set(update_fields) & set(self.SEARCH_FIELDS))
+        if searchable:
+            self.search_text = self.build_search_text()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_text'}
         super().save(*args, **kwargs)
+        if searchable or 'account_status' in update_fields:
+            self.invalidate_search()
+
+    @staticmethod
+    def normalize_search(value):
+        return ' '.join(str(value or '').lower().split())
+
+    def build_search_text(self):
+        return self.normalize_search(' '.join(str(getattr(self, field) or '') for field in self.SEARCH_FIELDS))[:500]
+
+    @classmethod
+    def search(cls, query, queryset=None):
+        # One normalized column instead of seven icontains. On Postgres a term long enough for trigrams is a trigram-indexed substring match,
+        # and a shorter one only matches the start of the text (account-number prefixes) so it stays on the btree index.
+        term = cls.normalize_search(query)
+        queryset = cls.objects.all() if queryset is None else queryset
+        if connection.vendor == 'postgresql':
+            match = models.Q(search_text__contains=term) if len(term) >= cls.TRIGRAM_MIN_LENGTH else models.Q(search_text__startswith=term)
+        else:
+            # Word-prefix match for the SQLite development databases; the ' term' half is a leading-wildcard LIKE and scans the whole table.
+            match = models.Q(search_text__startswith=term) | models.Q(search_text__contains=f' {term}')
+        exact = models.Q(account_number__iexact=query.strip()) | models.Q(person1_nin__iexact=query.strip()) | models.Q(person2_nin__iexact=query.strip())
+        return queryset.filter(match).annotate(search_rank=models.Case(models.When(exact, then=models.Value(0)), models.When(search_text__startswith=term, then=models.Value(1)), default=models.Value(2), output_field=models.IntegerField()))
+
+    @classmethod
+    def search_cache_key(cls, term, limit):
+        version = cache.get(f'{cls.SEARCH_CACHE_KEY}:version', 0)
+        return f"{cls.SEARCH_CACHE_KEY}:{version}:{limit}:{hashlib.md5(term.encode()).hexdigest()}"
+
+    @classmethod
+    def quick_search(cls, query, limit=SEARCH_LIMIT):
+        # Only the ranked ids are cached; rows are re-read by primary key so balances and status are always current.
+        term = cls.normalize_search(query)
+        key = cls.search_cache_key(term, limit)
+        ids = cache.get(key)
+        if ids is None:
+            ids = list(cls.search(query, cls.objects.filter(account_status=cls.STATUS_ACTIVE)).order_by('search_rank', 'account_number').values_list('pk', flat=True)[:limit])
+            cache.set(key, ids, cls.SEARCH_CACHE_TTL)
+        accounts = cls.objects.filter(account_status=cls.STATUS_ACTIVE).in_bulk(ids)
+        return [accounts[pk] for pk in ids if pk in accounts]
+
+    @classmethod
+    def invalidate_search(cls):
+        key = f'{cls.SEARCH_CACHE_KEY}:version'
+
+        def bump():
+            cache.add(key, 0, None)
+            cache.incr(key)
+        transaction.on_commit(bump)
+
+    def validate_for_save(self, update_fields=None):
+        """full_clean() for a full save; for update_fields saves, validate only those fields and run clean() only if they feed its cross-field checks."""
+        if update_fields is None:
+            return self.full_clean()
+        update_fields = {self._meta.get_field(name).name for name in update_fields}
+        exclude = [field.name for field in self._meta.concrete_fields if field.name not in update_fields]
+        errors = {}
+        checks = [lambda: self.clean_fields(exclude=exclude), lambda: self.validate_unique(exclude=exclude)]
+        if update_fields & self.CLEAN_FIELDS:
+            checks.insert(1, self.clean)
+        for check in checks:
+            try:
+                check()
+            except ValidationError as e:
+                errors = e.update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
 
     def clean(self):
         super().clean()
@@ -201,7 +289,7 @@ class ClientAccount(models.Model):
             return False
 
     def has_minimum_savings(self):
-        return self.savings_balance >= Decimal('100000.00')
+        return self.savings_balance >= self.MIN_LOAN_SAVINGS
 
     def get_max_loan_amount(self):
         if self.savings_balance <= 0:
@@ -215,7 +303,7 @@ class ClientAccount(models.Model):
             self.approved_by = approved_by_user
             self.approval_date = timezone.now()
             self.save()
-            ClientAuditLog.objects.create(client=self, action=ClientAuditLog.ACTION_ACCOUNT_APPROVE, changed_data={'status': {'old': old_status, 'new': self.STATUS_ACTIVE}}, performed_by=approved_by_user, note=f'Account approved by {approved_by_user.username}')
+            audit.record(ClientAuditLog, client=self, action=ClientAuditLog.ACTION_ACCOUNT_APPROVE, changed_data={'status': {'old': old_status, 'new': self.STATUS_ACTIVE}}, performed_by=approved_by_user, note=f'Account approved by {approved_by_user.username}')
             return True
         return False
 
@@ -224,7 +312,7 @@ class ClientAccount(models.Model):
             old_status = self.account_status
             self.account_status = self.STATUS_INACTIVE
             self.save()
-            ClientAuditLog.objects.create(client=self, action=ClientAuditLog.ACTION_ACCOUNT_REJECT, changed_data={'status': {'old': old_status, 'new': self.STATUS_INACTIVE}}, performed_by=rejected_by_user, note=f'Account rejected. Reason: {reason}')
+            audit.record(ClientAuditLog, client=self, action=ClientAuditLog.ACTION_ACCOUNT_REJECT, changed_data={'status': {'old': old_status, 'new': self.STATUS_INACTIVE}}, performed_by=rejected_by_user, note=f'Account rejected. Reason: {reason}')
             return True
         return False
 
@@ -249,7 +337,7 @@ class ClientAccount(models.Model):
             logger = logging.getLogger(__name__)
             logger.error(f'Validation error changing status for account {self.account_number}: {e}')
             raise ValidationError({'created_by': ['Account cannot be saved. Please ensure all required fields are filled.']})
-        ClientAuditLog.objects.create(client=self, action=ClientAuditLog.ACTION_STATUS_CHANGE, changed_data={'status': {'old': old_status, 'new': new_status}}, performed_by=changed_by_user, note=f'Account status changed. Reason: {reason}')
+        audit.record(ClientAuditLog, client=self, action=ClientAuditLog.ACTION_STATUS_CHANGE, changed_data={'status': {'old': old_status, 'new': new_status}}, performed_by=changed_by_user, note=f'Account status changed. Reason: {reason}')
 
     def __str__(self):
         if self.account_type == 'SINGLE':
@@ -260,11 +348,15 @@ class ClientAccount(models.Model):
 
     @property
     def full_account_name(self):
-        if self.account_type == 'SINGLE':
-            return f'{self.person1_first_name} {self.person1_last_name}'
+        return self.format_account_name(self.account_type, self.person1_first_name, self.person1_last_name, self.person2_first_name, self.person2_last_name)
+
+    @staticmethod
+    def format_account_name(account_type, person1_first_name, person1_last_name, person2_first_name, person2_last_name):
+        if account_type == 'SINGLE':
+            return f'{person1_first_name} {person1_last_name}'
         else:
-            person2_name = f'{self.person2_first_name} {self.person2_last_name}' if self.person2_first_name else 'Joint Holder'
-            return f'{self.person1_first_name} {self.person1_last_name} & {person2_name}'
+            person2_name = f'{person2_first_name} {person2_last_name}' if person2_first_name else 'Joint Holder'
+            return f'{person1_first_name} {person1_last_name} & {person2_name}'
 
     @property
     def can_create_joint_account(self):
@@ -276,16 +368,15 @@ class ClientAccount(models.Model):
         req = ClientEditRequest.objects.create(client=self, requested_by=requested_by, data=changes, status=ClientEditRequest.STATUS_PENDING)
         self.is_edit_pending = True
         self.save(update_fields=['is_edit_pending'])
-        ClientAuditLog.objects.create(client=self, action=ClientAuditLog.ACTION_EDIT_REQUEST, changed_data=changes, performed_by=requested_by, note='Edit request submitted')
+        audit.record(ClientAuditLog, client=self, action=ClientAuditLog.ACTION_EDIT_REQUEST, changed_data=changes, performed_by=requested_by, note='Edit request submitted')
         return req
 
     @property
     def total_loan_balance(self):
+        # Read from the loans app's ClientExposure row; select_related('exposure') makes it free in lists. No row means no loans yet.
         try:
-            from loans.models import LoanApplication
-            total = LoanApplication.objects.filter(client_account=self, status__in=['APPROVED', 'DISBURSED', 'ACTIVE']).aggregate(total=models.Sum('remaining_balance'))['total']
-            return total or Decimal('0.00')
-        except ImportError:
+            return self.exposure.outstanding_balance
+        except ObjectDoesNotExist:
             return Decimal('0.00')
 
     @property
@@ -348,7 +439,7 @@ class ClientEditRequest(models.Model):
         self.reviewed_at = timezone.now()
         self.review_comment = comment or ''
         self.save(update_fields=['status', 'reviewed_by', 'reviewed_at', 'review_comment'])
-        ClientAuditLog.objects.create(client=client, action=ClientAuditLog.ACTION_APPROVE_EDIT, changed_data=changed, performed_by=reviewer, note=f"EditRequest approved. {comment or ''}")
+        audit.record(ClientAuditLog, client=client, action=ClientAuditLog.ACTION_APPROVE_EDIT, changed_data=changed, performed_by=reviewer, note=f"EditRequest approved. {comment or ''}")
         return True
 
     def reject(self, reviewer: User, comment: str=''):
@@ -361,7 +452,7 @@ class ClientEditRequest(models.Model):
         self.save(update_fields=['status', 'reviewed_by', 'reviewed_at', 'review_comment'])
         self.client.is_edit_pending = False
         self.client.save(update_fields=['is_edit_pending'])
-        ClientAuditLog.objects.create(client=self.client, action=ClientAuditLog.ACTION_REJECT_EDIT, changed_data=self.data, performed_by=reviewer, note=f"EditRequest rejected. {comment or ''}")
+        audit.record(ClientAuditLog, client=self.client, action=ClientAuditLog.ACTION_REJECT_EDIT, changed_data=self.data, performed_by=reviewer, note=f"EditRequest rejected. {comment or ''}")
         return True
 
     @property
@@ -378,6 +469,7 @@ class ClientEditRequest(models.Model):
 
 class SavingsTransaction(models.Model):
     TRANSACTION_TYPES = [('DEPOSIT', 'Deposit'), ('WITHDRAWAL', 'Withdrawal')]
+    BULK_BATCH_SIZE = 500
     client_account = models.ForeignKey(ClientAccount, on_delete=models.CASCADE, related_name='savings_transactions')
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     amount = models.DecimalField(max_digits=14, decimal_places=2)
@@ -389,9 +481,15 @@ class SavingsTransaction(models.Model):
     reversed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reversed_transactions')
     reversal_date = models.DateTimeField(null=True, blank=True)
     reversal_reason = models.TextField(blank=True)
+    sequence = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    balance_after = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
+    reversal_sequence = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    reversal_balance_after = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-transaction_date']
+        unique_together = ['client_account', 'sequence']
+        indexes = [models.Index(fields=['client_account', 'transaction_date']), models.Index(fields=['client_account', 'reversal_date']), models.Index(fields=['transaction_date', 'id'])]
         verbose_name = 'Savings Transaction'
         verbose_name_plural = 'Savings Transactions'
 
@@ -417,15 +515,19 @@ class SavingsTransaction(models.Model):
                 client = ClientAccount.objects.select_for_update().get(pk=self.client_account.pk)
                 if self.transaction_type == 'WITHDRAWAL' and amount > client.savings_balance:
                     raise ValidationError('Insufficient balance for withdrawal.')
-                super().save(*args, **kwargs)
                 if self.transaction_type == 'DEPOSIT':
                     client.savings_balance = (client.savings_balance or Decimal('0.00')) + amount
                     client.total_savings_deposited = (client.total_savings_deposited or Decimal('0.00')) + amount
                 else:
                     client.savings_balance = client.savings_balance - amount
+                # The account row lock orders postings, so the sequence and running balance are taken under it.
+                client.savings_sequence += 1
+                self.sequence = client.savings_sequence
+                self.balance_after = client.savings_balance
+                super().save(*args, **kwargs)
                 client.last_savings_date = timezone.now()
-                client.save(update_fields=['savings_balance', 'total_savings_deposited', 'last_savings_date'])
-                ClientAuditLog.objects.create(client=client, action=ClientAuditLog.ACTION_SAVINGS_TX, changed_data={'transaction_type': self.transaction_type, 'amount': str(amount), 'balance_after': str(client.savings_balance), 'reference': self.reference_number}, performed_by=self.processed_by, note=f'Savings {self.transaction_type} of {amount}. Notes: {self.notes}')
+                client.save(update_fields=['savings_balance', 'total_savings_deposited', 'last_savings_date', 'savings_sequence'])
+                audit.record(ClientAuditLog, client=client, action=ClientAuditLog.ACTION_SAVINGS_TX, changed_data={'transaction_type': self.transaction_type, 'amount': str(amount), 'balance_after': str(client.savings_balance), 'reference': self.reference_number}, performed_by=self.processed_by, note=f'Savings {self.transaction_type} of {amount}. Notes: {self.notes}')
         else:
             super().save(*args, **kwargs)
 
@@ -440,13 +542,16 @@ class SavingsTransaction(models.Model):
                 client.savings_balance -= self.amount
             else:
                 client.savings_balance += self.amount
-            client.save(update_fields=['savings_balance'])
+            client.savings_sequence += 1
+            client.save(update_fields=['savings_balance', 'savings_sequence'])
             self.is_reversed = True
             self.reversed_by = reversed_by_user
             self.reversal_date = timezone.now()
             self.reversal_reason = reason
-            self.save(update_fields=['is_reversed', 'reversed_by', 'reversal_date', 'reversal_reason'])
-            ClientAuditLog.objects.create(client=client, action=ClientAuditLog.ACTION_SAVINGS_TX, changed_data={'action': 'REVERSAL', 'original_transaction': str(self.id), 'amount': str(self.amount), 'balance_after': str(client.savings_balance)}, performed_by=reversed_by_user, note=f'Transaction {self.reference_number} reversed. Reason: {reason}')
+            self.reversal_sequence = client.savings_sequence
+            self.reversal_balance_after = client.savings_balance
+            self.save(update_fields=['is_reversed', 'reversed_by', 'reversal_date', 'reversal_reason', 'reversal_sequence', 'reversal_balance_after'])
+            audit.record(ClientAuditLog, client=client, action=ClientAuditLog.ACTION_SAVINGS_TX, changed_data={'action': 'REVERSAL', 'original_transaction': str(self.id), 'amount': str(self.amount), 'balance_after': str(client.savings_balance)}, performed_by=reversed_by_user, note=f'Transaction {self.reference_number} reversed. Reason: {reason}')
         return True
 
     @property
@@ -462,9 +567,123 @@ class SavingsTransaction(models.Model):
             return 'Reversed'
         return 'Completed'
 
-    @property
-    def balance_after(self):
-        if self.transaction_type == 'DEPOSIT':
-            return self.client_account.savings_balance
-        else:
-            return self.client_account.savings_balance + self.amount
\ No newline at end of file
+    @classmethod
+    def post_deposits(cls, entries, processed_by, notes='', batch_size=BULK_BATCH_SIZE):
+        """Post a batch of (account, amount, reference) deposits all-or-nothing: lock the accounts in id order, validate every row, then bulk-write postings, audit rows and balances."""
+        errors, rows = [], []
+        for row, entry in enumerate(entries, 1):
+            try:
+                amount = Decimal(str(entry.get('amount') or '').replace(',', ''))
+            except InvalidOperation:
+                amount = None
+            if amount is None or not amount.is_finite() or amount <= 0 or amount != amount.quantize(Decimal('0.01')):
+                errors.append(f"Row {row}: invalid amount {entry.get('amount')!r}")
+                continue
+            rows.append((row, str(entry.get('account') or '').strip(), amount, str(entry.get('reference') or '').strip()))
+        if not rows and not errors:
+            raise ValidationError('No deposits to post.')
+        references = Counter(reference for *_, reference in rows if reference)
+        with transaction.atomic():
+            keys = {key for _, key, _, _ in rows}
+            accounts = {}
+            for account in ClientAccount.objects.select_for_update().filter(models.Q(account_number__in=keys) | models.Q(pk__in=[int(key) for key in keys if key.isdigit()])).order_by('pk'):
+                accounts[account.account_number] = accounts[str(account.pk)] = account
+            taken = set(cls.objects.filter(reference_number__in=list(references)).values_list('reference_number', flat=True))
+            for row, key, amount, reference in rows:
+                account = accounts.get(key)
+                if account is None:
+                    errors.append(f'Row {row}: account {key!r} not found')
+                elif account.account_status != ClientAccount.STATUS_ACTIVE:
+                    errors.append(f'Row {row}: account {account.account_number} is {account.get_account_status_display().lower()}')
+                if len(reference) > 50:
+                    errors.append(f'Row {row}: reference {reference!r} is longer than 50 characters')
+                elif references[reference] > 1 or reference in taken:
+                    errors.append(f'Row {row}: reference {reference!r} is already used')
+            if errors:
+                raise ValidationError(errors)
+            now = timezone.now()
+            postings, logs = [], []
+            for row, key, amount, reference in rows:
+                account = accounts[key]
+                account.savings_balance += amount
+                account.total_savings_deposited += amount
+                account.savings_sequence += 1
+                account.last_savings_date = now
+                posting = cls(client_account=account, transaction_type='DEPOSIT', amount=amount, processed_by=processed_by, notes=notes, reference_number=reference, sequence=account.savings_sequence, balance_after=account.savings_balance)
+                posting.reference_number = posting.reference_number or posting.generate_reference()
+                postings.append(posting)
+                logs.append(ClientAuditLog(client=account, action=ClientAuditLog.ACTION_SAVINGS_TX, changed_data={'transaction_type': 'DEPOSIT', 'amount': str(amount), 'balance_after': str(account.savings_balance), 'reference': posting.reference_number}, performed_by=processed_by, note=f'Savings DEPOSIT of {amount}. Notes: {notes}'))
+            cls.objects.bulk_create(postings, batch_size=batch_size)
+            audit.record_many(logs)
+            ClientAccount.objects.bulk_update({account.pk: account for account in accounts.values()}.values(), ['savings_balance', 'total_savings_deposited', 'savings_sequence', 'last_savings_date'], batch_size=batch_size)
+        return postings
+
+    @classmethod
+    def ledger_position(cls, client_account, at, after_sequence=0):
+        # Postings and reversals share the account's sequence, so the later of the two indexed lookups is the balance at that moment.
+        posting = cls.objects.filter(client_account=client_account, sequence__gt=after_sequence, transaction_date__lte=at).order_by('-sequence').values_list('sequence', 'balance_after').first()
+        reversal = cls.objects.filter(client_account=client_account, reversal_sequence__gt=after_sequence, reversal_date__lte=at).order_by('-reversal_sequence').values_list('reversal_sequence', 'reversal_balance_after').first()
+        return max(filter(None, [posting, reversal]), default=None)
+
+    @classmethod
+    def rebuild_ledger(cls, client_account_id):
+        """Renumber an account's postings and reversals in time order and rewrite their running balances, anchored on the current balance."""
+        with transaction.atomic():
+            balance = ClientAccount.objects.select_for_update().values_list('savings_balance', flat=True).get(pk=client_account_id)
+            rows = list(cls.objects.filter(client_account_id=client_account_id))
+            events = sorted([(row.transaction_date, 0, row.pk, row) for row in rows] + [(row.reversal_date or row.transaction_date, 1, row.pk, row) for row in rows if row.is_reversed], key=lambda event: event[:3])
+            signed = [(row.amount if row.transaction_type == 'DEPOSIT' else -row.amount) * (-1 if reversal else 1) for _, reversal, _, row in events]
+            opening = balance = balance - sum(signed, Decimal('0.00'))
+            for sequence, ((_, reversal, _, row), amount) in enumerate(zip(events, signed), 1):
+                balance += amount
+                if reversal:
+                    row.reversal_sequence, row.reversal_balance_after = sequence, balance
+                else:
+                    row.sequence, row.balance_after = sequence, balance
+            cls.objects.filter(client_account_id=client_account_id).update(sequence=None)
+            cls.objects.bulk_update(rows, ['sequence', 'balance_after', 'reversal_sequence', 'reversal_balance_after'], batch_size=500)
+            ClientAccount.objects.filter(pk=client_account_id).update(savings_sequence=len(events))
+        return len(events), opening
+
+class SavingsBalanceCheckpoint(models.Model):
+    client_account = models.ForeignKey(ClientAccount, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    checkpoint_date = models.DateField()
+    sequence = models.PositiveIntegerField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-checkpoint_date']
+        unique_together = ['client_account', 'checkpoint_date']
+        verbose_name = 'Savings Balance Checkpoint'
+        verbose_name_plural = 'Savings Balance Checkpoints'
+
+    def __str__(self):
+        return f'{self.client_account.account_number} @ {self.checkpoint_date}: {self.balance}'
+
+    @staticmethod
+    def end_of_day(day):
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time.max)) if settings.USE_TZ else datetime.datetime.combine(day, datetime.time.max)
+
+    @classmethod
+    def balance_as_of(cls, client_account, day):
+        checkpoint = cls.objects.filter(client_account=client_account, checkpoint_date__lte=day).order_by('-checkpoint_date').values_list('checkpoint_date', 'sequence', 'balance').first()
+        # Only a checkpoint of a day that has ended is final; one for today can already be behind later postings.
+        if checkpoint and checkpoint[0] == day and day < timezone.localdate():
+            return checkpoint[2]
+        position = SavingsTransaction.ledger_position(client_account, cls.end_of_day(day), checkpoint[1] if checkpoint else 0)
+        return position[1] if position else (checkpoint[2] if checkpoint else Decimal('0.00'))
+
+    @classmethod
+    @transaction.atomic
+    def record(cls, day):
+        # Closing position of every account that moved on the day; quieter accounts are covered by their latest earlier checkpoint.
+        if day >= timezone.localdate():
+            raise ValueError(f'Cannot checkpoint {day} before the day has ended')
+        closing = {}
+        for account, sequence, balance in SavingsTransaction.objects.filter(transaction_date__date=day, sequence__isnull=False).order_by('client_account', 'sequence').values_list('client_account', 'sequence', 'balance_after').iterator():
+            closing[account] = (sequence, balance)
+        for account, sequence, balance in SavingsTransaction.objects.filter(reversal_date__date=day, reversal_sequence__isnull=False).values_list('client_account', 'reversal_sequence', 'reversal_balance_after').iterator():
+            closing[account] = max(closing.get(account, (0, None)), (sequence, balance))
+        cls.objects.filter(checkpoint_date=day).delete()
+        return cls.objects.bulk_create([cls(client_account_id=account, checkpoint_date=day, sequence=sequence, balance=balance) for account, (sequence, balance) in closing.items()])
\ No newline at end of file
@@ -1 +1,189 @@
-from django.test import TestCase
\ No newline at end of file
+import datetime
+import io
+from unittest import mock
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .models import ClientAccount, ClientAuditLog, SavingsTransaction, SavingsBalanceCheckpoint
+
+class SavingsLedgerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.officer = User.objects.create_user('teller', password='secret', is_staff=True)
+        cls.account = ClientAccount.objects.create(account_type='SINGLE', person1_first_name='Jane', person1_last_name='Doe', person1_contact='0700000000', person1_address='Kampala', person1_area_code='256', person1_next_of_kin='John', person1_nin='CM000000000002', person1_gender='F', business_location='Kampala', business_sector='Retail', loan_officer=cls.officer, created_by=cls.officer)
+
+    def post(self, transaction_type, amount):
+        posting = SavingsTransaction(client_account=self.account, transaction_type=transaction_type, amount=Decimal(amount), processed_by=self.officer)
+        posting.save()
+        return posting
+
+    def ledger(self):
+        rows = SavingsTransaction.objects.filter(client_account=self.account)
+        return sorted([(row.sequence, row.balance_after) for row in rows] + [(row.reversal_sequence, row.reversal_balance_after) for row in rows if row.is_reversed])
+
+    def test_days_that_have_not_ended_are_never_final(self):
+        today = timezone.localdate()
+        self.post('DEPOSIT', '100.00')
+        with self.assertRaises(CommandError):
+            call_command('checkpoint_savings', date=today.isoformat(), stdout=io.StringIO())
+        # A same-day row written before checkpoints were limited to ended days.
+        SavingsBalanceCheckpoint.objects.create(client_account=self.account, checkpoint_date=today, sequence=1, balance=Decimal('100.00'))
+        self.post('DEPOSIT', '40.00')
+        self.assertEqual(SavingsBalanceCheckpoint.balance_as_of(self.account, today), Decimal('140.00'))
+        self.client.force_login(User.objects.create_superuser('ledger-admin', password='secret'))
+        response = self.client.get(reverse('accounts:api_savings_balance', args=[self.account.pk]), {'as_of': today.isoformat()})
+        self.assertEqual(response.json()['balance'], '140.00')
+
+    def test_postings_and_reversals_carry_sequence_and_running_balance(self):
+        self.post('DEPOSIT', '100.00')
+        deposit = self.post('DEPOSIT', '50.00')
+        self.post('WITHDRAWAL', '30.00')
+        deposit.reverse_transaction(self.officer, 'Duplicate')
+        expected = [(1, Decimal('100.00')), (2, Decimal('150.00')), (3, Decimal('120.00')), (4, Decimal('70.00'))]
+        self.assertEqual(self.ledger(), expected)
+        today = timezone.now().date()
+        with self.assertNumQueries(3):
+            self.assertEqual(SavingsBalanceCheckpoint.balance_as_of(self.account, today), Decimal('70.00'))
+        day = datetime.timedelta(days=1)
+        SavingsTransaction.objects.update(transaction_date=F('transaction_date') - day, reversal_date=F('reversal_date') - day)
+        call_command('checkpoint_savings', since=(today - 2 * day).isoformat(), stdout=io.StringIO())
+        self.assertEqual(SavingsBalanceCheckpoint.objects.filter(client_account=self.account).count(), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(SavingsBalanceCheckpoint.balance_as_of(self.account, today - day), Decimal('70.00'))
+        self.assertEqual(SavingsBalanceCheckpoint.balance_as_of(self.account, today - 2 * day), Decimal('0.00'))
+        SavingsTransaction.objects.update(sequence=None, balance_after=None, reversal_sequence=None, reversal_balance_after=None)
+        ClientAccount.objects.update(savings_sequence=0)
+        call_command('backfill_savings_ledger', stdout=io.StringIO())
+        self.assertEqual(self.ledger(), expected)
+        self.assertEqual((self.post('DEPOSIT', '5.00').sequence, ClientAccount.objects.get(pk=self.account.pk).savings_sequence), (5, 5))
+
+class BulkDepositTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.officer = User.objects.create_superuser('cashier', password='secret')
+        cls.accounts = [ClientAccount.objects.create(account_type='SINGLE', person1_first_name='Member', person1_last_name=str(index), person1_contact='0700000000', person1_address='Gulu', person1_area_code='256', person1_next_of_kin='Kin', person1_nin=f'CM10000000000{index}', person1_gender='F', business_location='Gulu', business_sector='Farming', account_status=ClientAccount.STATUS_ACTIVE, loan_officer=cls.officer, created_by=cls.officer) for index in range(3)]
+
+    def test_batch_cost_does_not_grow_with_deposits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SavingsTransaction(client_account=self.accounts[0], transaction_type='DEPOSIT', amount=Decimal('10.00'), processed_by=self.officer).save()
+        for size in [3, 60]:
+            entries = [{'account': self.accounts[index % 3].account_number, 'amount': '5.00', 'reference': f'GRP-{size}-{index}'} for index in range(size)]
+            with self.assertNumQueries(7), self.captureOnCommitCallbacks(execute=True):
+                postings = SavingsTransaction.post_deposits(entries, self.officer, notes='Group day')
+            self.assertEqual(len(postings), size)
+        balances = {account.pk: (account.savings_balance, account.savings_sequence) for account in ClientAccount.objects.filter(pk__in=[account.pk for account in self.accounts])}
+        self.assertEqual(balances[self.accounts[0].pk], (Decimal('115.00'), 22))
+        self.assertEqual(balances[self.accounts[2].pk], (Decimal('105.00'), 21))
+        self.assertEqual(list(SavingsTransaction.objects.filter(client_account=self.accounts[0]).order_by('-sequence').values_list('sequence', 'balance_after')[:2]), [(22, Decimal('115.00')), (21, Decimal('110.00'))])
+        self.assertEqual(ClientAuditLog.objects.filter(action=ClientAuditLog.ACTION_SAVINGS_TX).count(), 64)
+
+    def test_invalid_rows_reject_the_whole_batch(self):
+        SavingsTransaction.post_deposits([{'account': self.accounts[0].account_number, 'amount': '1.00', 'reference': 'USED-1'}], self.officer)
+        with self.assertRaises(ValidationError) as raised:
+            SavingsTransaction.post_deposits([{'account': self.accounts[1].account_number, 'amount': '5.00', 'reference': ''}, {'account': 'HIL-ACC-0000-99999', 'amount': '5.00'}, {'account': self.accounts[1].pk, 'amount': '-2'}, {'account': self.accounts[2].account_number, 'amount': '5.00', 'reference': 'USED-1'}], self.officer)
+        self.assertEqual(raised.exception.messages, ["Row 3: invalid amount '-2'", "Row 2: account 'HIL-ACC-0000-99999' not found", "Row 4: reference 'USED-1' is already used"])
+        self.assertEqual(SavingsTransaction.objects.count(), 1)
+        self.client.force_login(self.officer)
+        response = self.client.post(reverse('accounts:savings_bulk_deposit'), {'deposits': f'account_number,amount,reference\n{self.accounts[1].account_number},"1,500.00",\n{self.accounts[2].pk},20\n'})
+        self.assertRedirects(response, reverse('accounts:savings_list'), fetch_redirect_response=False)
+        data = self.client.post(reverse('accounts:api_savings_bulk_deposit'), {'deposits': [{'account': self.accounts[2].account_number, 'amount': '5'}]}, content_type='application/json').json()
+        self.assertEqual((data['posted'], data['transactions'][0]['balance_after']), (1, '25.00'))
+
+class ClientAccountValidationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.officer = User.objects.create_user('validator', password='secret')
+        cls.account = ClientAccount.objects.create(account_type='SINGLE', person1_first_name='Ann', person1_last_name='Okot', person1_contact='0700000001', person1_address='Lira', person1_area_code='256', person1_next_of_kin='Kin', person1_nin='CM200000000001', person1_gender='F', business_location='Lira', business_sector='Retail', account_status=ClientAccount.STATUS_ACTIVE, loan_officer=cls.officer, created_by=cls.officer)
+
+    def test_deposit_skips_nin_lookups(self):
+        with CaptureQueriesContext(connection) as queries:
+            SavingsTransaction(client_account=self.account, transaction_type='DEPOSIT', amount=Decimal('25.00'), processed_by=self.officer).save()
+            self.account.refresh_from_db()
+            self.account.submit_edit_request(self.officer, {'business_sector': 'Wholesale'})
+        self.assertFalse([query['sql'] for query in queries if self.account.person1_nin in query['sql']])
+        self.assertEqual((self.account.savings_balance, ClientAccount.objects.get(pk=self.account.pk).is_edit_pending), (Decimal('25.00'), True))
+
+    def test_scoped_saves_still_validate_what_they_write(self):
+        other = ClientAccount.objects.create(account_type='SINGLE', person1_first_name='Ben', person1_last_name='Okot', person1_contact='0700000002', person1_address='Lira', person1_area_code='256', person1_next_of_kin='Kin', person1_nin='CM200000000002', person1_gender='M', business_location='Lira', business_sector='Retail', loan_officer=self.officer, created_by=self.officer)
+        other.person1_nin = self.account.person1_nin
+        other.account_status = ClientAccount.STATUS_ACTIVE
+        with self.assertRaises(ValidationError) as raised:
+            other.save(update_fields=['account_status'])
+        self.assertIn('person1_nin', raised.exception.message_dict)
+        other.refresh_from_db()
+        other.business_sector = 'x' * 101
+        with self.assertRaises(ValidationError):
+            other.save(update_fields=['business_sector'])
+
+
+class AccountSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.officer = User.objects.create_superuser('searcher', password='secret')
+        people = [('Grace', 'Nakato', 'CM300000000001'), ('Nakato', 'Achieng', 'CM300000000002'), ('Peter', 'Grace', 'CM300000000003')]
+        cls.accounts = [ClientAccount.objects.create(account_type='SINGLE', person1_first_name=first, person1_last_name=last, person1_contact='0700000003', person1_address='Mbale', person1_area_code='256', person1_next_of_kin='Kin', person1_nin=nin, person1_gender='F', business_location='Mbale', business_sector='Retail', account_status=ClientAccount.STATUS_ACTIVE, loan_officer=cls.officer, created_by=cls.officer) for first, last, nin in people]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ranks_exact_identifiers_first_and_matches_full_names(self):
+        self.assertEqual(self.accounts[0].search_text, f'{self.accounts[0].account_number.lower()} grace nakato cm300000000001')
+        self.assertEqual(list(ClientAccount.search('cm300000000002').values_list('pk', flat=True)), [self.accounts[1].pk])
+        ranked = ClientAccount.search('nakato').order_by('search_rank', 'account_number')
+        self.assertEqual([(account.pk, account.search_rank) for account in ranked], [(self.accounts[0].pk, 2), (self.accounts[1].pk, 2)])
+        self.assertEqual([account.pk for account in ClientAccount.search('Grace  Nakato')], [self.accounts[0].pk])
+        self.assertEqual(ClientAccount.search(self.accounts[2].account_number).get().search_rank, 0)
+
+    def test_short_terms_on_postgres_only_match_the_start_of_the_text(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            short, long = ClientAccount.search('hi').query.where, ClientAccount.search('nakato').query.where
+        self.assertEqual([(lookup.lhs.target.name, lookup.lookup_name, lookup.rhs) for lookup in short.children], [('search_text', 'startswith', 'hi')])
+        self.assertEqual([(lookup.lhs.target.name, lookup.lookup_name, lookup.rhs) for lookup in long.children], [('search_text', 'contains', 'nakato')])
+
+    def test_quick_search_caches_ids_until_a_searchable_field_changes(self):
+        self.client.force_login(self.officer)
+        url = reverse('accounts:search_accounts')
+        self.assertEqual([row['id'] for row in self.client.get(url, {'q': 'grace'}).json()], [self.accounts[0].pk, self.accounts[2].pk])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(ClientAccount.quick_search('grace')), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            SavingsTransaction(client_account=self.accounts[0], transaction_type='DEPOSIT', amount=Decimal('40.00'), processed_by=self.officer).save()
+        self.assertEqual(self.client.get(url, {'q': 'grace'}).json()[0]['balance'], '40.00')
+        self.accounts[1].person1_first_name = 'Grace'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.accounts[1].save(update_fields=['person1_first_name'])
+        self.assertEqual(len(ClientAccount.quick_search('grace')), 3)
+
+    def test_account_api_pages_with_link_headers(self):
+        self.client.force_login(self.officer)
+        response = self.client.get(reverse('accounts:api_account_list'), {'limit': 2})
+        self.assertEqual([row['id'] for row in response.json()], [self.accounts[0].pk, self.accounts[1].pk])
+        self.assertIn('rel="next"', response['Link'])
+        response = self.client.get(reverse('accounts:api_account_list'), {'limit': 2, 'cursor': response['X-Next-Cursor']})
+        self.assertEqual(([row['id'] for row in response.json()], response['X-Next-Cursor']), ([self.accounts[2].pk], ''))
+        response = self.client.get(reverse('accounts:account_list'), {'search': 'nakato'})
+        self.assertEqual([account.pk for account in response.context['page_obj']], [self.accounts[1].pk, self.accounts[0].pk])
+        for name in ['savings_list', 'savings_transactions', 'audit_logs']:
+            self.assertEqual(self.client.get(reverse(f'accounts:{name}')).status_code, 200)
+
+    def test_audit_logs_filter_accounts_by_number_prefix(self):
+        ClientAuditLog.objects.bulk_create([ClientAuditLog(client=account, action=ClientAuditLog.ACTION_UPDATE, performed_by=self.officer) for account in self.accounts])
+        self.client.force_login(self.officer)
+        prefix = self.accounts[1].account_number.lower()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('accounts:audit_logs'), {'account': prefix})
+        self.assertEqual([log.client_id for log in response.context['page_obj']], [self.accounts[1].pk])
+        self.assertFalse([query for query in queries if 'DISTINCT' in query['sql']])
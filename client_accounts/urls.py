@@ -2,4 +2,4 @@ from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
 app_name = 'accounts'
-urlpatterns = [path('login/', auth_views.LoginView.as_view(template_name='client_accounts/login.html'), name='login'), path('logout/', auth_views.LogoutView.as_view(), name='logout'), path('', views.dashboard, name='dashboard'), path('dashboard/', views.dashboard, name='dashboard'), path('accounts/', views.account_list, name='account_list'), path('accounts/create/', views.account_create, name='account_create'), path('accounts/<int:pk>/', views.account_detail, name='account_detail'), path('accounts/<int:pk>/edit/', views.account_edit, name='account_edit'), path('accounts/<int:pk>/delete/', views.account_delete, name='account_delete'), path('accounts/<int:pk>/approve/', views.account_approve, name='account_approve'), path('accounts/<int:pk>/reject/', views.account_reject, name='account_reject'), path('accounts/<int:pk>/status/', views.account_change_status, name='account_change_status'), path('edit-requests/', views.edit_request_list, name='edit_request_list'), path('edit-requests/<int:pk>/', views.edit_request_detail, name='edit_request_detail'), path('edit-requests/<int:pk>/approve/', views.edit_request_approve, name='edit_request_approve'), path('edit-requests/<int:pk>/reject/', views.edit_request_reject, name='edit_request_reject'), path('savings/', views.savings_list, name='savings_list'), path('savings/deposit/', views.savings_deposit, name='savings_deposit'), path('savings/deposit/<int:account_id>/', views.savings_deposit, name='savings_deposit_account'), path('savings/withdrawal/', views.savings_withdrawal, name='savings_withdrawal'), path('savings/withdrawal/<int:account_id>/', views.savings_withdrawal, name='savings_withdrawal_account'), path('savings/transaction/<int:pk>/reverse/', views.transaction_reverse, name='transaction_reverse'), path('savings/transactions/', views.savings_transactions, name='savings_transactions'), path('accounts/<int:account_id>/savings/', views.account_savings, name='account_savings'), path('reports/', views.reports_dashboard, name='reports_dashboard'), path('reports/transactions/csv/', views.export_transactions_csv, name='export_transactions_csv'), path('reports/transactions/csv/<int:account_id>/', views.export_transactions_csv, name='export_transactions_csv_account'), path('reports/transactions/pdf/<int:account_id>/', views.export_transactions_pdf, name='export_transactions_pdf_account'), path('reports/accounts/pdf/', views.export_accounts_pdf, name='export_accounts_pdf'), path('reports/transactions/pdf/', views.export_transactions_pdf, name='export_transactions_pdf'), path('audit-logs/', views.audit_logs, name='audit_logs'), path('api/accounts/', views.api_account_list, name='api_account_list'), path('api/account/<int:pk>/', views.api_account_detail, name='api_account_detail'), path('api/savings/balance/<int:account_id>/', views.api_savings_balance, name='api_savings_balance'), path('api/search/', views.search_accounts, name='search_accounts'), path('loans/<int:pk>/approve/', views.approve_loan, name='approve_loan'), path('loans/<int:pk>/reject/', views.reject_loan, name='reject_loan'), path('loans/<int:pk>/disburse/', views.disburse_loan, name='disburse_loan')]
\ No newline at end of file
+urlpatterns = [path('login/', auth_views.LoginView.as_view(template_name='client_accounts/login.html'), name='login'), path('logout/', auth_views.LogoutView.as_view(), name='logout'), path('', views.dashboard, name='dashboard'), path('dashboard/', views.dashboard, name='dashboard'), path('accounts/', views.account_list, name='account_list'), path('accounts/create/', views.account_create, name='account_create'), path('accounts/<int:pk>/', views.account_detail, name='account_detail'), path('accounts/<int:pk>/edit/', views.account_edit, name='account_edit'), path('accounts/<int:pk>/delete/', views.account_delete, name='account_delete'), path('accounts/<int:pk>/approve/', views.account_approve, name='account_approve'), path('accounts/<int:pk>/reject/', views.account_reject, name='account_reject'), path('accounts/<int:pk>/status/', views.account_change_status, name='account_change_status'), path('edit-requests/', views.edit_request_list, name='edit_request_list'), path('edit-requests/<int:pk>/', views.edit_request_detail, name='edit_request_detail'), path('edit-requests/<int:pk>/approve/', views.edit_request_approve, name='edit_request_approve'), path('edit-requests/<int:pk>/reject/', views.edit_request_reject, name='edit_request_reject'), path('savings/', views.savings_list, name='savings_list'), path('savings/deposit/', views.savings_deposit, name='savings_deposit'), path('savings/deposit/<int:account_id>/', views.savings_deposit, name='savings_deposit_account'), path('savings/deposit/bulk/', views.savings_bulk_deposit, name='savings_bulk_deposit'), path('savings/withdrawal/', views.savings_withdrawal, name='savings_withdrawal'), path('savings/withdrawal/<int:account_id>/', views.savings_withdrawal, name='savings_withdrawal_account'), path('savings/transaction/<int:pk>/reverse/', views.transaction_reverse, name='transaction_reverse'), path('savings/transactions/', views.savings_transactions, name='savings_transactions'), path('accounts/<int:account_id>/savings/', views.account_savings, name='account_savings'), path('reports/', views.reports_dashboard, name='reports_dashboard'), path('reports/transactions/csv/', views.export_transactions_csv, name='export_transactions_csv'), path('reports/transactions/csv/<int:account_id>/', views.export_transactions_csv, name='export_transactions_csv_account'), path('reports/transactions/pdf/<int:account_id>/', views.export_transactions_pdf, name='export_transactions_pdf_account'), path('reports/accounts/csv/', views.export_accounts_csv, name='export_accounts_csv'), path('reports/accounts/pdf/', views.export_accounts_pdf, name='export_accounts_pdf'), path('reports/transactions/pdf/', views.export_transactions_pdf, name='export_transactions_pdf'), path('audit-logs/', views.audit_logs, name='audit_logs'), path('api/accounts/', views.api_account_list, name='api_account_list'), path('api/account/<int:pk>/', views.api_account_detail, name='api_account_detail'), path('api/savings/balance/<int:account_id>/', views.api_savings_balance, name='api_savings_balance'), path('api/savings/deposits/bulk/', views.api_savings_bulk_deposit, name='api_savings_bulk_deposit'), path('api/search/', views.search_accounts, name='search_accounts'), path('loans/<int:pk>/approve/', views.approve_loan, name='approve_loan'), path('loans/<int:pk>/reject/', views.reject_loan, name='reject_loan'), path('loans/<int:pk>/disburse/', views.disburse_loan, name='disburse_loan')]
\ No newline at end of file
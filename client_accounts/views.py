@@ -3,20 +3,26 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.db.models import Sum, Q, Count
-from .models import ClientAccount, SavingsTransaction, UserProfile, ClientEditRequest, ClientAuditLog
+from .models import ClientAccount, SavingsTransaction, SavingsBalanceCheckpoint, UserProfile, ClientEditRequest, ClientAuditLog
 from loans.models import LoanApplication
 from django.contrib.auth.models import User
 from decimal import Decimal
-import csv
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from functools import wraps
 from django.utils import timezone
-from django.core.paginator import Paginator
+import csv
+import datetime
+import io
 import json
 from django.views.decorators.http import require_POST
 from django.core.exceptions import ValidationError
+from core import audit
+from core.exports import choice_labels, stream_rows, streaming_csv_response
+from core.pagination import KeysetPaginator
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
 
 def role_required(allowed_roles):
 
@@ -81,17 +87,16 @@ def account_list(request):
     user_role = get_user_role(request)
     status_filter = request.GET.get('status', '')
     search_query = request.GET.get('search', '')
-    accounts = ClientAccount.objects.all()
+    accounts = ClientAccount.objects.select_related('exposure')
     if user_role == UserProfile.ROLE_STAFF or user_role == UserProfile.ROLE_LOAN_OFFICER:
         accounts = accounts.filter(loan_officer=request.user)
     if status_filter:
         accounts = accounts.filter(account_status=status_filter)
     if search_query:
-        accounts = accounts.filter(Q(account_number__icontains=search_query) | Q(person1_first_name__icontains=search_query) | Q(person1_last_name__icontains=search_query) | Q(person1_nin__icontains=search_query) | Q(person2_first_name__icontains=search_query) | Q(person2_last_name__icontains=search_query) | Q(person2_nin__icontains=search_query))
-    accounts = accounts.order_by('-registration_date')
-    paginator = Paginator(accounts, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        paginator = KeysetPaginator(ClientAccount.search(search_query, accounts), ['search_rank', '-registration_date', '-pk'], 20, estimate_count=True)
+    else:
+        paginator = KeysetPaginator(accounts, ['-registration_date', '-pk'], 20, estimate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'), request.GET)
     context = {'page_obj': page_obj, 'status_filter': status_filter, 'search_query': search_query, 'status_choices': ClientAccount.STATUS_CHOICES, 'user_role': user_role}
     return render(request, 'client_accounts/account_list.html', context)
 
@@ -124,7 +129,7 @@ def account_create(request):
                 account.account_status = ClientAccount.STATUS_PENDING
                 messages.success(request, f'Account created successfully. Waiting for admin approval.')
             account.save()
-            ClientAuditLog.objects.create(client=account, action=ClientAuditLog.ACTION_CREATE, performed_by=request.user, note=f'Account created by {request.user.username}')
+            audit.record(ClientAuditLog, client=account, action=ClientAuditLog.ACTION_CREATE, performed_by=request.user, note=f'Account created by {request.user.username}')
             return redirect('accounts:account_detail', pk=account.pk)
         except ValidationError as e:
             messages.error(request, f'Validation error: {e}')
@@ -289,25 +294,25 @@ def edit_request_reject(request, pk):
         messages.error(request, 'Failed to reject edit request.')
     return redirect('accounts:edit_request_detail', pk=pk)
 
-@login_required
-@role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_STAFF, UserProfile.ROLE_ACCOUNTANT, UserProfile.ROLE_LOAN_OFFICER])
-def savings_list(request):
-    user_role = get_user_role(request)
-    transactions = SavingsTransaction.objects.all().order_by('-transaction_date')
+def filter_savings_transactions(request, transactions, user_role):
     if user_role == UserProfile.ROLE_STAFF:
         transactions = transactions.filter(processed_by=request.user)
     elif user_role == UserProfile.ROLE_LOAN_OFFICER:
-        client_accounts = ClientAccount.objects.filter(loan_officer=request.user)
-        transactions = transactions.filter(client_account__in=client_accounts)
+        transactions = transactions.filter(client_account__loan_officer=request.user)
     account_filter = request.GET.get('account', '')
     type_filter = request.GET.get('type', '')
     if account_filter:
         transactions = transactions.filter(client_account__account_number__icontains=account_filter)
     if type_filter:
         transactions = transactions.filter(transaction_type=type_filter)
-    paginator = Paginator(transactions, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    return (transactions, account_filter, type_filter)
+
+@login_required
+@role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_STAFF, UserProfile.ROLE_ACCOUNTANT, UserProfile.ROLE_LOAN_OFFICER])
+def savings_list(request):
+    user_role = get_user_role(request)
+    transactions, account_filter, type_filter = filter_savings_transactions(request, SavingsTransaction.objects.select_related('client_account', 'processed_by'), user_role)
+    page_obj = KeysetPaginator(transactions, ['-transaction_date', '-pk'], 50, estimate_count=True).get_page(request.GET.get('cursor'), request.GET)
     return render(request, 'client_accounts/savings_list.html', {'page_obj': page_obj, 'account_filter': account_filter, 'type_filter': type_filter, 'user_role': user_role})
 
 @login_required
@@ -341,6 +346,28 @@ def savings_deposit(request, account_id=None):
     accounts = ClientAccount.objects.filter(account_status=ClientAccount.STATUS_ACTIVE)
     return render(request, 'client_accounts/savings_deposit.html', {'account': account, 'accounts': accounts, 'user_role': get_user_role(request)})
 
+def parse_bulk_deposits(text):
+    """Read account,amount,reference lines (an optional header row is skipped) into post_deposits entries."""
+    return [{'account': row[0], 'amount': row[1] if len(row) > 1 else '', 'reference': row[2] if len(row) > 2 else ''} for row in csv.reader(io.StringIO(text)) if any(cell.strip() for cell in row) and row[0].strip().lower() not in ('account', 'account_number')]
+
+@login_required
+@role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_STAFF, UserProfile.ROLE_ACCOUNTANT])
+def savings_bulk_deposit(request):
+    deposits = ''
+    if request.method == 'POST':
+        upload = request.FILES.get('csv_file')
+        deposits = upload.read().decode('utf-8-sig') if upload else request.POST.get('deposits', '')
+        try:
+            postings = SavingsTransaction.post_deposits(parse_bulk_deposits(deposits), request.user, request.POST.get('notes', ''))
+            messages.success(request, f'Posted {len(postings)} deposits totalling {sum((posting.amount for posting in postings), Decimal("0"))}.')
+            return redirect('accounts:savings_list')
+        except ValidationError as e:
+            for message in e.messages[:10]:
+                messages.error(request, message)
+            if len(e.messages) > 10:
+                messages.error(request, f'...and {len(e.messages) - 10} more errors. Nothing was posted.')
+    return render(request, 'client_accounts/savings_bulk_deposit.html', {'deposits': deposits, 'user_role': get_user_role(request)})
+
 @login_required
 @role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_STAFF, UserProfile.ROLE_ACCOUNTANT])
 def savings_withdrawal(request, account_id=None):
@@ -432,8 +459,19 @@ def api_account_list(request):
         accounts = accounts.filter(loan_officer=request.user)
     elif user_role == UserProfile.ROLE_LOAN_OFFICER:
         accounts = accounts.filter(loan_officer=request.user)
-    data = list(accounts.values('id', 'account_number', 'account_type', 'account_status', 'person1_first_name', 'person1_last_name', 'savings_balance'))
-    return JsonResponse(data, safe=False)
+    try:
+        limit = min(max(int(request.GET.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    page = KeysetPaginator(accounts.values('id', 'account_number', 'account_type', 'account_status', 'person1_first_name', 'person1_last_name', 'savings_balance'), ['id'], limit).get_page(request.GET.get('cursor'), request.GET)
+    response = JsonResponse(page.object_list, safe=False)
+    # The body stays a plain list; cursors for the neighbouring pages travel in headers.
+    links = [f'<{request.build_absolute_uri(page.next_link)}>; rel="next"'] if page.has_next() else []
+    links += [f'<{request.build_absolute_uri(page.previous_link)}>; rel="prev"'] if page.has_previous() else []
+    if links:
+        response['Link'] = ', '.join(links)
+    response['X-Next-Cursor'] = page.next_cursor or ''
+    return response
 
 @login_required
 @role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_STAFF, UserProfile.ROLE_MANAGER, UserProfile.ROLE_ACCOUNTANT, UserProfile.ROLE_LOAN_OFFICER])
@@ -452,39 +490,55 @@ def api_savings_balance(request, account_id):
     user_role = get_user_role(request)
     if user_role not in [UserProfile.ROLE_ADMIN] and account.loan_officer != request.user:
         return JsonResponse({'error': 'Permission denied'}, status=403)
+    as_of = request.GET.get('as_of')
+    if as_of:
+        try:
+            as_of = datetime.date.fromisoformat(as_of)
+        except ValueError:
+            return JsonResponse({'error': 'as_of must be YYYY-MM-DD'}, status=400)
+        return JsonResponse({'account_number': account.account_number, 'as_of': as_of.isoformat(), 'balance': str(SavingsBalanceCheckpoint.balance_as_of(account, as_of))})
     return JsonResponse({'account_number': account.account_number, 'balance': str(account.savings_balance), 'last_update': account.last_savings_date.isoformat() if account.last_savings_date else None})
 
+@login_required
+@role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_STAFF, UserProfile.ROLE_ACCOUNTANT])
+@require_POST
+def api_savings_bulk_deposit(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    deposits = payload.get('deposits') if isinstance(payload, dict) else payload
+    if not isinstance(deposits, list) or not all((isinstance(entry, dict) for entry in deposits)):
+        return JsonResponse({'error': 'deposits must be a list of {account, amount, reference} objects'}, status=400)
+    try:
+        postings = SavingsTransaction.post_deposits(deposits, request.user, payload.get('notes', '') if isinstance(payload, dict) else '')
+    except ValidationError as e:
+        return JsonResponse({'errors': e.messages}, status=400)
+    return JsonResponse({'posted': len(postings), 'total': str(sum((posting.amount for posting in postings), Decimal('0'))), 'transactions': [{'account_number': posting.client_account.account_number, 'reference': posting.reference_number, 'amount': str(posting.amount), 'balance_after': str(posting.balance_after)} for posting in postings]})
+
 @login_required
 @role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_MANAGER])
 def export_accounts_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="accounts_%s.csv"' % timezone.now().strftime('%Y%m%d')
-    writer = csv.writer(response)
-    writer.writerow(['Account Number', 'Account Type', 'Status', 'Primary Holder', 'Primary NIN', 'Primary Contact', 'Secondary Holder', 'Secondary NIN', 'Secondary Contact', 'Business Location', 'Business Sector', 'Savings Balance', 'Total Deposited', 'Registration Date'])
-    for acc in ClientAccount.objects.all().order_by('-registration_date'):
-        primary_holder = f'{acc.person1_first_name} {acc.person1_last_name}'
-        secondary_holder = f'{acc.person2_first_name} {acc.person2_last_name}' if acc.person2_first_name else ''
-        writer.writerow([acc.account_number, acc.get_account_type_display(), acc.get_account_status_display(), primary_holder, acc.person1_nin, acc.person1_contact, secondary_holder, acc.person2_nin or '', acc.person2_contact or '', acc.business_location, acc.business_sector, acc.savings_balance, acc.total_savings_deposited, acc.registration_date.strftime('%Y-%m-%d %H:%M:%S')])
-    return response
+    account_types, statuses = (choice_labels(ClientAccount, 'account_type'), choice_labels(ClientAccount, 'account_status'))
+    rows = stream_rows(ClientAccount.objects.order_by('-registration_date'), ['account_number', 'account_type', 'account_status', 'person1_first_name', 'person1_last_name', 'person1_nin', 'person1_contact', 'person2_first_name', 'person2_last_name', 'person2_nin', 'person2_contact', 'business_location', 'business_sector', 'savings_balance', 'total_savings_deposited', 'registration_date'])
+    header = ['Account Number', 'Account Type', 'Status', 'Primary Holder', 'Primary NIN', 'Primary Contact', 'Secondary Holder', 'Secondary NIN', 'Secondary Contact', 'Business Location', 'Business Sector', 'Savings Balance', 'Total Deposited', 'Registration Date']
+    return streaming_csv_response('accounts_%s.csv' % timezone.now().strftime('%Y%m%d'), header, ([number, account_types.get(account_type, account_type), statuses.get(status, status), f'{p1_first} {p1_last}', p1_nin, p1_contact, f'{p2_first} {p2_last}' if p2_first else '', p2_nin or '', p2_contact or '', location, sector, balance, deposited, registered.strftime('%Y-%m-%d %H:%M:%S')] for number, account_type, status, p1_first, p1_last, p1_nin, p1_contact, p2_first, p2_last, p2_nin, p2_contact, location, sector, balance, deposited, registered in rows))
 
 @login_required
 @role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_MANAGER])
 def export_transactions_csv(request, account_id=None):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="transactions_%s.csv"' % timezone.now().strftime('%Y%m%d')
+    transactions = SavingsTransaction.objects.order_by('-transaction_date')
     if account_id:
         account = get_object_or_404(ClientAccount, pk=account_id)
         filename = f"transactions_{account.account_number}_{timezone.now().strftime('%Y%m%d')}.csv"
-        transactions = SavingsTransaction.objects.filter(client_account=account)
+        transactions = transactions.filter(client_account=account)
     else:
         filename = f"transactions_all_{timezone.now().strftime('%Y%m%d')}.csv"
-        transactions = SavingsTransaction.objects.all()
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    writer = csv.writer(response)
-    writer.writerow(['Reference', 'Account Number', 'Transaction Type', 'Amount', 'Date', 'Processed By', 'Notes', 'Status'])
-    for tx in SavingsTransaction.objects.all().order_by('-transaction_date'):
-        writer.writerow([tx.reference_number, tx.client_account.account_number, tx.get_transaction_type_display(), tx.amount, tx.transaction_date.strftime('%Y-%m-%d %H:%M:%S'), tx.processed_by.username if tx.processed_by else '', tx.notes, tx.transaction_status])
-    return response
+    transactions = filter_savings_transactions(request, transactions, get_user_role(request))[0]
+    types = choice_labels(SavingsTransaction, 'transaction_type')
+    rows = stream_rows(transactions, ['reference_number', 'client_account__account_number', 'transaction_type', 'amount', 'transaction_date', 'processed_by__username', 'notes', 'is_reversed'])
+    header = ['Reference', 'Account Number', 'Transaction Type', 'Amount', 'Date', 'Processed By', 'Notes', 'Status']
+    return streaming_csv_response(filename, header, ([reference, account_number, types.get(transaction_type, transaction_type), amount, date.strftime('%Y-%m-%d %H:%M:%S'), username or '', notes, 'Reversed' if is_reversed else 'Completed'] for reference, account_number, transaction_type, amount, date, username, notes, is_reversed in rows))
 
 @login_required
 @role_required([UserProfile.ROLE_ADMIN])
@@ -497,18 +551,16 @@ def audit_logs(request):
     if action_filter:
         logs = logs.filter(action=action_filter)
     if account_filter:
-        logs = logs.filter(client__account_number__icontains=account_filter)
+        # Account numbers are stored upper-case, so a prefix match can use the account_number index.
+        logs = logs.filter(client__account_number__startswith=account_filter.strip().upper())
     if start_date:
         logs = logs.filter(timestamp__gte=start_date)
     if end_date:
         logs = logs.filter(timestamp__lte=end_date)
-    unique_users = logs.exclude(performed_by__isnull=True).values('performed_by').distinct().count()
-    paginator = Paginator(logs, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
     if request.GET.get('export') == 'csv':
         return export_audit_logs_csv(logs)
-    return render(request, 'client_accounts/audit_logs.html', {'page_obj': page_obj, 'action_filter': action_filter, 'account_filter': account_filter, 'start_date': start_date, 'end_date': end_date, 'unique_users': unique_users})
+    page_obj = KeysetPaginator(logs.select_related('client', 'performed_by'), ['-timestamp', '-pk'], 50).get_page(request.GET.get('cursor'), request.GET)
+    return render(request, 'client_accounts/audit_logs.html', {'page_obj': page_obj, 'action_filter': action_filter, 'account_filter': account_filter, 'start_date': start_date, 'end_date': end_date})
 
 @login_required
 @role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_STAFF, UserProfile.ROLE_MANAGER, UserProfile.ROLE_ACCOUNTANT, UserProfile.ROLE_LOAN_OFFICER])
@@ -516,7 +568,7 @@ def search_accounts(request):
     query = request.GET.get('q', '')
     if not query or len(query) < 2:
         return JsonResponse([], safe=False)
-    accounts = ClientAccount.objects.filter(Q(account_number__icontains=query) | Q(person1_first_name__icontains=query) | Q(person1_last_name__icontains=query) | Q(person1_nin__icontains=query) | Q(person2_first_name__icontains=query) | Q(person2_last_name__icontains=query) | Q(person2_nin__icontains=query)).filter(account_status=ClientAccount.STATUS_ACTIVE)[:10]
+    accounts = ClientAccount.quick_search(query)
     results = []
     for acc in accounts:
         results.append({'id': acc.id, 'account_number': acc.account_number, 'name': acc.full_account_name, 'balance': str(acc.savings_balance)})
@@ -587,23 +639,10 @@ def account_delete(request, pk):
 @login_required
 def savings_transactions(request):
     user_role = get_user_role(request)
-    transactions = SavingsTransaction.objects.all().order_by('-transaction_date')
-    if user_role == UserProfile.ROLE_STAFF:
-        transactions = transactions.filter(processed_by=request.user)
-    elif user_role == UserProfile.ROLE_LOAN_OFFICER:
-        client_accounts = ClientAccount.objects.filter(loan_officer=request.user)
-        transactions = transactions.filter(client_account__in=client_accounts)
-    account_filter = request.GET.get('account', '')
-    type_filter = request.GET.get('type', '')
-    if account_filter:
-        transactions = transactions.filter(client_account__account_number__icontains=account_filter)
-    if type_filter:
-        transactions = transactions.filter(transaction_type=type_filter)
-    paginator = Paginator(transactions, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    transactions, account_filter, type_filter = filter_savings_transactions(request, SavingsTransaction.objects.select_related('client_account', 'processed_by'), user_role)
+    page_obj = KeysetPaginator(transactions, ['-transaction_date', '-pk'], 50, estimate_count=True).get_page(request.GET.get('cursor'), request.GET)
     context = {'page_obj': page_obj, 'account_filter': account_filter, 'type_filter': type_filter, 'user_role': user_role}
-    return render(request, 'client_accounts/savings_transactions.html', context)
+    return render(request, 'client_accounts/savings_list.html', context)
 
 @login_required
 @role_required([UserProfile.ROLE_ADMIN])
@@ -666,13 +705,7 @@ def export_transactions_pdf(request, account_id=None):
     return response
 
 def export_audit_logs_csv(queryset):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="audit_logs_%s.csv"' % timezone.now().strftime('%Y%m%d_%H%M%S')
-    writer = csv.writer(response)
-    writer.writerow(['Timestamp', 'Account Number', 'Account Name', 'Action', 'Performed By', 'Performed By Email', 'Changed Fields', 'Notes'])
-    for log in queryset:
-        changed_fields = []
-        if log.changed_data:
-            changed_fields = list(log.changed_data.keys())
-        writer.writerow([log.timestamp.strftime('%Y-%m-%d %H:%M:%S'), log.client.account_number if log.client else '', log.client.full_account_name if log.client else '', log.get_action_display(), log.performed_by.get_full_name() if log.performed_by else 'System', log.performed_by.email if log.performed_by else '', ', '.join(changed_fields), log.note or ''])
-    return response
\ No newline at end of file
+    actions = choice_labels(ClientAuditLog, 'action')
+    rows = stream_rows(queryset, ['timestamp', 'client__account_number', 'client__account_type', 'client__person1_first_name', 'client__person1_last_name', 'client__person2_first_name', 'client__person2_last_name', 'action', 'performed_by_id', 'performed_by__first_name', 'performed_by__last_name', 'performed_by__email', 'changed_data', 'note'])
+    header = ['Timestamp', 'Account Number', 'Account Name', 'Action', 'Performed By', 'Performed By Email', 'Changed Fields', 'Notes']
+    return streaming_csv_response('audit_logs_%s.csv' % timezone.now().strftime('%Y%m%d_%H%M%S'), header, ([timestamp.strftime('%Y-%m-%d %H:%M:%S'), account_number or '', ClientAccount.format_account_name(account_type, p1_first, p1_last, p2_first, p2_last) if account_number else '', actions.get(action, action), f'{first_name} {last_name}'.strip() if user_id else 'System', email or '', ', '.join(changed_data or {}), note or ''] for timestamp, account_number, account_type, p1_first, p1_last, p2_first, p2_last, action, user_id, first_name, last_name, email, changed_data, note in rows))
@@ -0,0 +1,199 @@
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+BATCH_SIZE = 500
+AUDIT_MODELS = ['client_accounts.ClientAuditLog', 'reports.ActivityLog']
+DEFAULT_RETENTION_MONTHS = 12
+_state = threading.local()
+
+class SpoolEncoder(DjangoJSONEncoder):
+    """Keeps full microsecond timestamps, which DjangoJSONEncoder rounds to milliseconds."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+class AuditBuffer:
+    """Audit rows recorded inside one transaction (or savepoint), written together once it commits."""
+
+    def __init__(self, key, using):
+        self.key = key
+        self.using = using
+        self.instances = []
+
+    def flush(self):
+        buffers = getattr(_state, 'buffers', {})
+        if buffers.get(self.key) is self:
+            del buffers[self.key]
+        instances, self.instances = self.instances, []
+        write(instances, self.using)
+
+def spool_path():
+    return getattr(settings, 'AUDIT_SPOOL_PATH', None)
+
+def fallback_path():
+    return spool_path() or os.path.join(settings.BASE_DIR, 'audit.spool')
+
+def archive_dir():
+    return getattr(settings, 'AUDIT_ARCHIVE_DIR', None) or os.path.join(settings.BASE_DIR, 'archive', 'audit')
+
+def month_start(value, months_back=0):
+    index = value.year * 12 + value.month - 1 - months_back
+    return timezone.make_aware(datetime.datetime(index // 12, index % 12 + 1, 1))
+
+def record(model, using=DEFAULT_DB_ALIAS, **fields):
+    return record_many([model(**fields)], using)[0]
+
+def record_many(instances, using=DEFAULT_DB_ALIAS):
+    # Rows wait for the transaction that produced them: rolled-back work leaves no audit trail and row locks are released before the insert.
+    instances = list(instances)
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        write(instances, using)
+        return instances
+    buffers = _state.__dict__.setdefault('buffers', {})
+    key = (using, tuple(connection.savepoint_ids))
+    buffer = buffers.get(key)
+    # A rollback discards the on_commit hook but not the buffer, so one whose hook is gone is stale.
+    if buffer is None or not any(entry[1] == buffer.flush for entry in connection.run_on_commit):
+        buffer = buffers[key] = AuditBuffer(key, using)
+        transaction.on_commit(buffer.flush, using=using)
+    buffer.instances.extend(instances)
+    return instances
+
+def write(instances, using=DEFAULT_DB_ALIAS):
+    if not instances:
+        return
+    if spool_path():
+        spool(instances)
+        return
+    grouped = defaultdict(list)
+    for instance in instances:
+        grouped[type(instance)].append(instance)
+    for model, rows in grouped.items():
+        try:
+            model.objects.using(using).bulk_create(rows, batch_size=BATCH_SIZE)
+        except DatabaseError:
+            # The business transaction has already committed; keep its audit rows on disk for load_audit_spool rather than lose them.
+            logger.exception('Audit write failed, spooling %d %s rows to %s', len(rows), model._meta.label, fallback_path())
+            spool(rows, fallback_path())
+
+def serialize(instance):
+    return {'model': instance._meta.label_lower, 'fields': {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields if not field.primary_key}}
+
+def lock_exclusive(fd):
+    """Block until this process holds an exclusive lock on the open file: flock on POSIX, the file's first byte via msvcrt on Windows."""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                # LK_LOCK itself retries for about ten seconds before giving up, so keep waiting like flock does.
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+def spool(instances, path=None):
+    path = path or spool_path()
+    data = ''.join(json.dumps(serialize(instance), cls=SpoolEncoder) + '\n' for instance in instances).encode()
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        try:
+            lock_exclusive(fd)
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            # The loader renames the spool away before draining it; if that happened while we waited, append to the new file instead.
+            if current and os.path.samestat(os.fstat(fd), current):
+                os.write(fd, data)
+                os.fsync(fd)
+                return
+        finally:
+            os.close(fd)
+
+def load_spool(path=None, batch_size=BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+    """Import spooled audit rows in batches; returns (loaded, skipped). Claimed files left by an interrupted run are retried first."""
+    path = path or fallback_path()
+    if os.path.exists(path):
+        os.rename(path, f"{path}.{timezone.now().strftime('%Y%m%d%H%M%S%f')}.loading")
+    loaded = skipped = 0
+    for claimed in sorted(glob.glob(f'{glob.escape(path)}.*.loading')):
+        with open(claimed, 'rb') as spooled:
+            # Waits out a writer that opened the file before the rename.
+            lock_exclusive(spooled.fileno())
+            with transaction.atomic(using=using):
+                pending = defaultdict(list)
+                for number, line in enumerate(spooled, 1):
+                    try:
+                        entry = json.loads(line)
+                        model = apps.get_model(entry['model'])
+                        pending[model].append(model(**entry['fields']))
+                    except (ValueError, KeyError, LookupError, TypeError):
+                        logger.warning('Skipping unreadable audit spool line %d in %s', number, claimed)
+                        skipped += 1
+                        continue
+                    if len(pending[model]) >= batch_size:
+                        model.objects.using(using).bulk_create(pending.pop(model), batch_size=batch_size)
+                        loaded += batch_size
+                for model, rows in pending.items():
+                    model.objects.using(using).bulk_create(rows, batch_size=batch_size)
+                    loaded += len(rows)
+        os.remove(claimed)
+    return loaded, skipped
+
+def archivable_months(model, cutoff):
+    return [month_start(month) for month in model.objects.filter(timestamp__lt=cutoff).datetimes('timestamp', 'month')]
+
+def archive_month(model, month, directory=None, batch_size=BATCH_SIZE):
+    """Move one month of audit rows into a gzipped JSON-lines file (the spool format) and delete them; returns the AuditArchive row, or None if the month is empty."""
+    from core.models import AuditArchive
+    start, end = month_start(month), month_start(month, -1)
+    rows = model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    # Rows that reach the month after this point (a late spool load) stay behind for the next run's part.
+    last_pk = rows.aggregate(last=Max('pk'))['last']
+    if last_pk is None:
+        return None
+    rows = rows.filter(pk__lte=last_pk)
+    label = model._meta.label_lower
+    part = (AuditArchive.objects.filter(model_label=label, month=start.date()).aggregate(part=Max('part'))['part'] or 0) + 1
+    path = os.path.join(directory or archive_dir(), label, f'{start:%Y-%m}-{part}.jsonl.gz')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count, first, last = 0, None, None
+    with open(f'{path}.tmp', 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as compressed:
+            for instance in rows.order_by('pk').iterator(chunk_size=batch_size):
+                compressed.write((json.dumps(serialize(instance), cls=SpoolEncoder) + '\n').encode())
+                count += 1
+                first = min(first or instance.timestamp, instance.timestamp)
+                last = max(last or instance.timestamp, instance.timestamp)
+        raw.flush()
+        os.fsync(raw.fileno())
+    digest = hashlib.sha256()
+    with open(f'{path}.tmp', 'rb') as written:
+        for chunk in iter(lambda: written.read(1 << 20), b''):
+            digest.update(chunk)
+    os.replace(f'{path}.tmp', path)
+    with transaction.atomic():
+        archive = AuditArchive.objects.create(model_label=label, month=start.date(), part=part, path=path, row_count=count, sha256=digest.hexdigest(), first_timestamp=first, last_timestamp=last)
+        rows.delete()
+    return archive
@@ -0,0 +1,33 @@
+import csv
+from django.http import StreamingHttpResponse
+
+DEFAULT_CHUNK_SIZE = 2000
+
+class Echo:
+    """File-like object that hands each written line straight back to the caller."""
+
+    def write(self, value):
+        return value
+
+def choice_labels(model, field_name):
+    return {value: str(label) for value, label in model._meta.get_field(field_name).flatchoices}
+
+def stream_rows(queryset, fields, chunk_size=DEFAULT_CHUNK_SIZE):
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+def streaming_csv_response(filename, header, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+
+    def content():
+        yield writer.writerow(header)
+        lines = []
+        for row in rows:
+            lines.append(writer.writerow(row))
+            if len(lines) >= chunk_size:
+                yield ''.join(lines)
+                lines = []
+        if lines:
+            yield ''.join(lines)
+    response = StreamingHttpResponse(content(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
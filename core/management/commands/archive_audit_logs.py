@@ -0,0 +1,34 @@
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core import audit
+from core.models import JobLock
+
+class Command(BaseCommand):
+    help = 'Move whole months of ClientAuditLog and ActivityLog rows older than the retention window into gzipped archive files; run monthly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=getattr(settings, 'AUDIT_RETENTION_MONTHS', audit.DEFAULT_RETENTION_MONTHS), help='Months of audit history to keep in the database')
+        parser.add_argument('--dir', help='Archive directory, defaults to AUDIT_ARCHIVE_DIR')
+        parser.add_argument('--batch-size', type=int, default=audit.BATCH_SIZE, help='Rows fetched per query while writing an archive')
+
+    def handle(self, *args, **options):
+        if options['months'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--months and --batch-size must be positive')
+        cutoff = audit.month_start(timezone.localtime(), options['months'])
+        with JobLock.hold('audit-archive') as acquired:
+            if not acquired:
+                self.stdout.write('Audit archival is running elsewhere, skipping')
+                return
+            started = time.perf_counter()
+            archived = 0
+            for label in audit.AUDIT_MODELS:
+                model = apps.get_model(label)
+                for month in audit.archivable_months(model, cutoff):
+                    archive = audit.archive_month(model, month, options['dir'], options['batch_size'])
+                    if archive:
+                        archived += archive.row_count
+                        self.stdout.write(f'{archive.model_label} {month:%Y-%m}: {archive.row_count} rows -> {archive.path}')
+        self.stdout.write(self.style.SUCCESS(f'Audit archive: {archived} rows older than {cutoff:%Y-%m-%d} archived in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core import audit
+from core.models import JobLock
+
+class Command(BaseCommand):
+    help = 'Batch-import audit rows spooled to AUDIT_SPOOL_PATH (or left there by a failed audit write); run every few minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Spool file, defaults to AUDIT_SPOOL_PATH')
+        parser.add_argument('--batch-size', type=int, default=audit.BATCH_SIZE, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        with JobLock.hold('audit-spool-load') as acquired:
+            if not acquired:
+                self.stdout.write('Audit spool is being loaded elsewhere, skipping')
+                return
+            started = time.perf_counter()
+            loaded, skipped = audit.load_spool(options['path'], options['batch_size'])
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} unreadable spool lines'))
+        self.stdout.write(self.style.SUCCESS(f'Audit spool: {loaded} rows loaded in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,6 @@
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    initial = True
+    dependencies = []
+    operations = [migrations.CreateModel(name='NumberSequence', fields=[('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('key', models.CharField(max_length=50, unique=True)), ('last_value', models.BigIntegerField(default=0)), ('updated_at', models.DateTimeField(auto_now=True))], options={'ordering': ['key']})]
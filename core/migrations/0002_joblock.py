@@ -0,0 +1,5 @@
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('core', '0001_initial')]
+    operations = [migrations.CreateModel(name='JobLock', fields=[('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('name', models.CharField(max_length=100, unique=True)), ('holder', models.CharField(blank=True, max_length=100)), ('locked_until', models.DateTimeField(blank=True, null=True)), ('updated_at', models.DateTimeField(auto_now=True))], options={'ordering': ['name']})]
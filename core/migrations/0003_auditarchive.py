@@ -0,0 +1,5 @@
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('core', '0002_joblock')]
+    operations = [migrations.CreateModel(name='AuditArchive', fields=[('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('model_label', models.CharField(max_length=100)), ('month', models.DateField()), ('part', models.PositiveIntegerField(default=1)), ('path', models.CharField(max_length=500, unique=True)), ('row_count', models.PositiveIntegerField(default=0)), ('sha256', models.CharField(max_length=64)), ('first_timestamp', models.DateTimeField(blank=True, null=True)), ('last_timestamp', models.DateTimeField(blank=True, null=True)), ('created_at', models.DateTimeField(auto_now_add=True))], options={'ordering': ['model_label', '-month', '-part'], 'unique_together': {('model_label', 'month', 'part')}})]
@@ -1 +1,104 @@
-from django.db import models
\ No newline at end of file
+import datetime
+import os
+import socket
+from contextlib import contextmanager
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+class NumberSequence(models.Model):
+    key = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['key']
+
+    def __str__(self):
+        return f'{self.key}: {self.last_value}'
+
+    @classmethod
+    def reserve(cls, key, count=1, seed=None):
+        """Reserve `count` consecutive, gap-free numbers for `key` inside the caller's transaction.
+
+        The UPDATE locks the counter row until that transaction ends, so postings that number the same key serialize and a
+        rolled-back posting releases its numbers for the next one. Reserve as late in the posting as possible.
+        """
+        if count < 1:
+            return range(0)
+        with transaction.atomic():
+            if not cls.objects.filter(key=key).update(last_value=F('last_value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(key=key, last_value=(seed() if seed else 0) + count)
+                except IntegrityError:
+                    cls.objects.filter(key=key).update(last_value=F('last_value') + count)
+            last_value = cls.objects.filter(key=key).values_list('last_value', flat=True).get()
+        return range(last_value - count + 1, last_value + 1)
+
+    @classmethod
+    def allocate(cls, prefix, count=1, queryset=None, field=None, width=5):
+        seed = (lambda: cls.highest_issued(queryset, field, prefix)) if queryset is not None else None
+        return [f'{prefix}-{number:0{width}d}' for number in cls.reserve(prefix, count, seed)]
+
+    @staticmethod
+    def highest_issued(queryset, field, prefix):
+        suffixes = (value[len(prefix) + 1:] for value in queryset.filter(**{f'{field}__startswith': f'{prefix}-'}).values_list(field, flat=True).iterator())
+        return max((int(suffix) for suffix in suffixes if suffix.isdigit()), default=0)
+
+class JobLock(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f'{self.name}: {self.holder or "free"}'
+
+    @classmethod
+    def acquire(cls, name, holder, ttl):
+        now = timezone.now()
+        if cls.objects.filter(name=name).filter(models.Q(locked_until__isnull=True) | models.Q(locked_until__lte=now)).update(holder=holder, locked_until=now + ttl, updated_at=now):
+            return True
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, holder=holder, locked_until=now + ttl)
+        except IntegrityError:
+            return False
+        return True
+
+    @classmethod
+    def release(cls, name, holder):
+        return cls.objects.filter(name=name, holder=holder).update(holder='', locked_until=None, updated_at=timezone.now())
+
+    @classmethod
+    @contextmanager
+    def hold(cls, name, ttl=datetime.timedelta(hours=1)):
+        holder = f'{socket.gethostname()}:{os.getpid()}'[:100]
+        acquired = cls.acquire(name, holder, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cls.release(name, holder)
+
+class AuditArchive(models.Model):
+    model_label = models.CharField(max_length=100)
+    month = models.DateField()
+    part = models.PositiveIntegerField(default=1)
+    path = models.CharField(max_length=500, unique=True)
+    row_count = models.PositiveIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    first_timestamp = models.DateTimeField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['model_label', '-month', '-part']
+        unique_together = ['model_label', 'month', 'part']
+
+    def __str__(self):
+        return f'{self.model_label} {self.month:%Y-%m} part {self.part}: {self.row_count} rows'
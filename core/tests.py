@@ -1 +1,139 @@
-from django.test import TestCase
\ No newline at end of file
+import datetime
+import gzip
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from reports.models import ActivityLog
+from . import audit
+from .exports import stream_rows, streaming_csv_response
+from .models import AuditArchive, NumberSequence
+from .pagination import BACKWARD, KeysetPaginator, encode_cursor
+
+class NumberSequenceTests(TestCase):
+
+    def test_reserves_contiguous_blocks(self):
+        self.assertEqual(list(NumberSequence.reserve('TEST', 3)), [1, 2, 3])
+        self.assertEqual(list(NumberSequence.reserve('TEST', 2)), [4, 5])
+        self.assertEqual(NumberSequence.allocate('TEST'), ['TEST-00006'])
+
+    def test_new_key_seeds_from_highest_issued_number(self):
+        User.objects.bulk_create([User(username='SEQ-00007'), User(username='SEQ-00003'), User(username='SEQ-legacy')])
+        self.assertEqual(NumberSequence.allocate('SEQ', 2, User.objects, 'username'), ['SEQ-00008', 'SEQ-00009'])
+
+
+    def test_rolled_back_reservations_are_reissued(self):
+        self.assertEqual(NumberSequence.allocate('GAP'), ['GAP-00001'])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(NumberSequence.allocate('GAP', 2), ['GAP-00002', 'GAP-00003'])
+            raise RuntimeError('posting failed')
+        self.assertEqual(NumberSequence.allocate('GAP'), ['GAP-00002'])
+
+class StreamingExportTests(TestCase):
+
+    def test_streams_filtered_rows_in_chunks(self):
+        User.objects.bulk_create([User(username=f'export{i}', email=f'export{i}@example.com') for i in range(5)] + [User(username='other')])
+        response = streaming_csv_response('users.csv', ['Username', 'Email'], stream_rows(User.objects.filter(username__startswith='export').order_by('username'), ['username', 'email']), chunk_size=2)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="users.csv"')
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(chunks[0], 'Username,Email\r\n')
+        self.assertEqual([chunk.count('\n') for chunk in chunks[1:]], [2, 2, 1])
+        self.assertNotIn('other', ''.join(chunks))
+
+class KeysetPaginatorTests(TestCase):
+
+    def test_walks_forward_and_back_through_ties_without_offsets(self):
+        joined = timezone.now()
+        User.objects.bulk_create([User(username=f'page{index:02d}', date_joined=joined - datetime.timedelta(days=index // 3)) for index in range(11)])
+        paginator = KeysetPaginator(User.objects.filter(username__startswith='page'), ['-date_joined'], per_page=4)
+        expected = list(User.objects.filter(username__startswith='page').order_by('-date_joined', '-pk').values_list('username', flat=True))
+        pages, page = [], paginator.get_page()
+        while True:
+            pages.append([user.username for user in page])
+            if not page.has_next():
+                break
+            with self.assertNumQueries(1):
+                page = paginator.get_page(page.next_cursor)
+        self.assertEqual([len(names) for names in pages], [4, 4, 3])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([user.username for user in paginator.get_page(page.previous_cursor)], pages[1])
+        last = paginator.get_page(encode_cursor(None, BACKWARD))
+        self.assertEqual(([user.username for user in last], last.has_next(), last.has_previous()), (expected[-4:], False, True))
+        self.assertEqual([user.username for user in paginator.get_page('not-a-cursor')], pages[0])
+        self.assertEqual([user.username for user in paginator.get_page(encode_cursor(['garbage', 'x'], BACKWARD))], pages[0])
+        self.assertEqual(paginator.count, 11)
+
+
+class AuditSinkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('auditor')
+
+    def test_buffers_until_commit_and_drops_rolled_back_rows(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for index in range(3):
+                audit.record(ActivityLog, user=self.user, action=f'Posted {index}')
+            try:
+                with transaction.atomic():
+                    audit.record(ActivityLog, user=self.user, action='Rolled back')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual((len(callbacks), ActivityLog.objects.count()), (1, 0))
+        with self.assertNumQueries(1):
+            callbacks[0]()
+        self.assertEqual(sorted(ActivityLog.objects.values_list('action', flat=True)), ['Posted 0', 'Posted 1', 'Posted 2'])
+
+    def test_spool_mode_appends_to_file_and_loader_imports_it(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'audit.spool')
+            with override_settings(AUDIT_SPOOL_PATH=path):
+                with self.captureOnCommitCallbacks(execute=True):
+                    recorded = [audit.record(ActivityLog, user=self.user, action=f'Spooled {index}', extra_info={'index': index}) for index in range(5)]
+                with open(path, 'a') as spooled:
+                    spooled.write('not json\n')
+                self.assertFalse(ActivityLog.objects.exists())
+                out = io.StringIO()
+                call_command('load_audit_spool', batch_size=2, stdout=out)
+            self.assertFalse(os.listdir(directory))
+        self.assertIn('5 rows loaded', out.getvalue())
+        self.assertIn('Skipped 1', out.getvalue())
+        self.assertEqual(list(ActivityLog.objects.order_by('extra_info__index').values_list('action', 'timestamp')), [(entry.action, entry.timestamp) for entry in recorded])
+
+    def test_imports_and_locks_without_fcntl(self):
+        fake_msvcrt = mock.Mock(LK_LOCK=1)
+        fake_msvcrt.locking.side_effect = [OSError('busy'), None]
+        # Importing a fresh copy rebinds core.audit, so both the module table and the package attribute are restored afterwards.
+        with mock.patch.dict(sys.modules, {'fcntl': None, 'msvcrt': fake_msvcrt}), mock.patch.object(sys.modules['core'], 'audit', audit):
+            sys.modules.pop('core.audit')
+            portable = importlib.import_module('core.audit')
+            with tempfile.TemporaryFile() as spooled:
+                portable.lock_exclusive(spooled.fileno())
+        self.assertEqual(fake_msvcrt.locking.call_count, 2)
+        self.assertIsNot(portable, audit)
+        self.assertIs(importlib.import_module('core.audit'), audit)
+
+    def test_retention_archives_whole_old_months(self):
+        now = timezone.now()
+        old = audit.month_start(now, 14) + datetime.timedelta(days=3)
+        ActivityLog.objects.bulk_create([ActivityLog(user=self.user, action=f'Old {index}', timestamp=old + datetime.timedelta(hours=index)) for index in range(3)] + [ActivityLog(user=self.user, action='Recent', timestamp=now)])
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('archive_audit_logs', months=12, dir=directory, stdout=io.StringIO())
+            archive = AuditArchive.objects.get()
+            with gzip.open(archive.path, 'rt') as archived:
+                actions = [json.loads(line)['fields']['action'] for line in archived]
+            call_command('archive_audit_logs', months=12, dir=directory, stdout=io.StringIO())
+        self.assertEqual((archive.model_label, archive.month, archive.row_count), ('reports.activitylog', old.date().replace(day=1), 3))
+        self.assertEqual(actions, ['Old 0', 'Old 1', 'Old 2'])
+        self.assertEqual(list(ActivityLog.objects.values_list('action', flat=True)), ['Recent'])
+        self.assertEqual(AuditArchive.objects.count(), 1)
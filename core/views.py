@@ -155,15 +155,11 @@ def loan_officer_dashboard(request):
         return redirect('core:login')
     my_clients = ClientAccount.objects.filter(loan_officer=request.user)
     active_clients = my_clients.filter(account_status=ClientAccount.STATUS_ACTIVE)
-    eligible_for_loan = []
-    for client in active_clients:
-        if client.has_minimum_savings():
-            max_loan = client.get_max_loan_amount()
-            eligible_for_loan.append({'client': client, 'max_loan': max_loan, 'current_loan_balance': client.total_loan_balance, 'available_limit': client.available_loan_limit})
+    eligible_for_loan = [{'client': client, 'max_loan': client.get_max_loan_amount(), 'current_loan_balance': client.total_loan_balance, 'available_limit': client.available_loan_limit} for client in active_clients.filter(savings_balance__gte=ClientAccount.MIN_LOAN_SAVINGS).select_related('exposure')[:10]]
     my_clients_loans = LoanApplication.objects.filter(client__in=my_clients)
     pending_loans = my_clients_loans.filter(status='SUBMITTED')
     active_loans = my_clients_loans.filter(status__in=['APPROVED', 'DISBURSED'])
-    context = {'user_role': user_role, 'total_clients': my_clients.count(), 'active_clients': active_clients.count(), 'eligible_for_loan': eligible_for_loan[:10], 'pending_loans': pending_loans, 'active_loans': active_loans}
+    context = {'user_role': user_role, 'total_clients': my_clients.count(), 'active_clients': active_clients.count(), 'eligible_for_loan': eligible_for_loan, 'pending_loans': pending_loans, 'active_loans': active_loans}
     return render(request, 'core/loan_officer_dashboard.html', context)
 
 def home(request):
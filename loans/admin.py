@@ -1,8 +1,11 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
+from django.db import transaction
 from django.db.models import Sum
-from .models import LoanProduct, LoanApplication, Guarantor, LoanTransaction, Loan, LoanRepaymentSchedule
+from .models import LoanProduct, LoanApplication, Guarantor, LoanTransaction, Loan, LoanRepaymentSchedule, DisbursementBatch, PaymentWebhook, PortfolioDailySnapshot
+from .services import ClientExposureService, PaymentWebhookService
 
 class GuarantorInline(admin.TabularInline):
     model = LoanApplication.guarantors.through
@@ -88,15 +91,24 @@ class LoanAdmin(admin.ModelAdmin):
     days_overdue_display.short_description = 'Days Overdue'
 
     def mark_as_closed(self, request, queryset):
-        updated = queryset.update(status='CLOSED', closed_at=timezone.now())
+        updated = self.update_status(queryset, status='CLOSED', closed_at=timezone.now())
         self.message_user(request, f'{updated} loans marked as closed.')
     mark_as_closed.short_description = 'Mark selected loans as closed'
 
     def mark_as_defaulted(self, request, queryset):
-        updated = queryset.update(status='DEFAULTED')
+        updated = self.update_status(queryset, status='DEFAULTED')
         self.message_user(request, f'{updated} loans marked as defaulted.')
     mark_as_defaulted.short_description = 'Mark selected loans as defaulted'
 
+    @staticmethod
+    @transaction.atomic
+    def update_status(queryset, **values):
+        # queryset.update() skips the post_save signal, so the clients' exposure rows are refreshed here; the ids are read first because the changelist filter may no longer match afterwards.
+        loan_ids = list(queryset.values_list('pk', flat=True))
+        updated = Loan.objects.filter(pk__in=loan_ids).update(**values)
+        ClientExposureService.refresh_loans(loan_ids)
+        return updated
+
     def generate_statements(self, request, queryset):
         self.message_user(request, f'Statements generated for {queryset.count()} loans.')
     generate_statements.short_description = 'Generate statements for selected loans'
@@ -131,6 +143,31 @@ class LoanTransactionAdmin(admin.ModelAdmin):
             transaction.save()
         self.message_user(request, f'{transactions_to_reverse.count()} transactions reversed.')
     reverse_transactions.short_description = 'Reverse selected transactions'
+
+@admin.register(DisbursementBatch)
+class DisbursementBatchAdmin(admin.ModelAdmin):
+    list_display = ['batch_number', 'disbursement_date', 'payment_method', 'requested_count', 'disbursed_count', 'failed_count', 'total_disbursed', 'status', 'created_by', 'created_at']
+    list_filter = ['status', 'payment_method', 'disbursement_date']
+    search_fields = ['batch_number', 'notes']
+    readonly_fields = ['batch_number', 'requested_count', 'disbursed_count', 'failed_count', 'total_principal', 'total_disbursed', 'errors', 'created_by', 'created_at', 'completed_at']
+
+@admin.register(PaymentWebhook)
+class PaymentWebhookAdmin(admin.ModelAdmin):
+    list_display = ['reference', 'provider', 'loan_number', 'amount', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'provider', 'received_at']
+    search_fields = ['reference', 'loan_number', 'error']
+    readonly_fields = ['provider', 'reference', 'loan_number', 'amount', 'payment_method', 'payload', 'loan', 'attempts', 'received_at', 'processed_at']
+    actions = ['requeue_webhooks']
+
+    def requeue_webhooks(self, request, queryset):
+        self.message_user(request, f'{PaymentWebhookService.requeue(queryset)} webhooks requeued.')
+    requeue_webhooks.short_description = 'Requeue failed webhooks'
+@admin.register(PortfolioDailySnapshot)
+class PortfolioDailySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['snapshot_date', 'loan_product', 'loan_officer', 'status', 'loan_count', 'outstanding_balance', 'overdue_amount', 'disbursed_amount', 'collected_amount']
+    list_filter = ['snapshot_date', 'status', 'loan_product']
+    date_hierarchy = 'snapshot_date'
+
 admin.site.site_header = 'Haliqua Investments Loan Management'
 admin.site.site_title = 'Haliqua Loans Admin'
-admin.site.index_title = 'Welcome to Haliqua Loan Administration'
\ No newline at end of file
+admin.site.index_title = 'Welcome to Haliqua Loan Administration'
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class LoansConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'loans'
\ No newline at end of file
+    name = 'loans'
+
+    def ready(self):
+        from . import signals
@@ -114,7 +114,7 @@ class LoanApprovalForm(forms.ModelForm):
             self.fields['approved_interest_rate'].initial = instance.loan_product.annual_interest_rate
             self.fields['approved_term_days'].initial = instance.requested_term_days
             if not instance.credit_score:
-                instance.credit_score = instance.calculate_credit_score()
+                instance.refresh_credit_score()
                 self.fields['credit_score'].initial = instance.credit_score
 
     def clean(self):
@@ -0,0 +1,47 @@
+import datetime
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.models import JobLock
+from loans.services import EndOfDayService
+
+class Command(BaseCommand):
+    help = 'Run the end-of-day loan book update: installment statuses, arrears and late fees'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='As-of date (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--chunk-size', type=int, default=EndOfDayService.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--recorded-by', help='Username recorded on posted late fees, defaults to the first superuser')
+        parser.add_argument('--skip-fees', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            as_of_date = datetime.date.fromisoformat(options['date']) if options['date'] else timezone.now().date()
+        except ValueError:
+            raise CommandError(f"Invalid --date {options['date']!r}, expected YYYY-MM-DD")
+        recorded_by = None
+        if not options['skip_fees']:
+            recorded_by = User.objects.filter(username=options['recorded_by']).first() if options['recorded_by'] else User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+            if recorded_by is None:
+                raise CommandError('No user available to record late fees; pass --recorded-by or --skip-fees')
+        chunk_size = options['chunk_size']
+        with JobLock.hold('end-of-day') as acquired:
+            if not acquired:
+                self.stdout.write('End of day is running elsewhere, skipping')
+                return
+            grace_periods = EndOfDayService.grace_periods()
+            self.stdout.write(f'End of day for {as_of_date}')
+            self.run_phase('Installment statuses', chunk_size, lambda ids: EndOfDayService.update_installment_statuses(ids, as_of_date, grace_periods))
+            self.run_phase('Loan arrears', chunk_size, lambda ids: EndOfDayService.update_loan_arrears(ids, as_of_date))
+            if not options['skip_fees']:
+                self.run_phase('Late fees', chunk_size, lambda ids: EndOfDayService.post_late_fees(ids, as_of_date, grace_periods, recorded_by))
+        self.stdout.write(self.style.SUCCESS(f'End of day for {as_of_date} complete'))
+
+    def run_phase(self, name, chunk_size, step):
+        started = time.perf_counter()
+        rows = chunks = 0
+        for loan_ids in EndOfDayService.loan_id_chunks(chunk_size):
+            rows += step(loan_ids)
+            chunks += 1
+        self.stdout.write(f'{name}: {rows} rows in {chunks} chunks, {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,40 @@
+import datetime
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from loans.services import BulkPaymentImportService
+
+class Command(BaseCommand):
+    help = 'Validate or apply a CSV of loan payments in chunks (dry run unless --apply)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--apply', action='store_true', help='Post the payments once the whole file validates; without it the file is only validated')
+        parser.add_argument('--date', help='Default payment date (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--payment-method', default='CASH')
+        parser.add_argument('--chunk-size', type=int, default=BulkPaymentImportService.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--recorded-by', help='Username recorded on the payments, defaults to the first superuser')
+        parser.add_argument('--errors', help='Write the per-row error report to this CSV path')
+
+    def handle(self, *args, **options):
+        try:
+            payment_date = datetime.date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError(f"Invalid --date {options['date']!r}, expected YYYY-MM-DD")
+        recorded_by = User.objects.filter(username=options['recorded_by']).first() if options['recorded_by'] else User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        if recorded_by is None:
+            raise CommandError('No user available to record payments; pass --recorded-by')
+        try:
+            with open(options['path'], 'rb') as source:
+                report = BulkPaymentImportService.import_csv(source, recorded_by, payment_method=options['payment_method'], payment_date=payment_date, dry_run=not options['apply'], chunk_size=options['chunk_size'], progress=self.progress)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as output:
+                BulkPaymentImportService.write_error_report(report['errors'], output)
+        if report['refused']:
+            raise CommandError(f"{len(report['errors'])} of {report['rows']} rows failed validation, nothing applied" + (f"; see {options['errors']}" if options['errors'] else ''))
+        outcome = f"{report['valid']} valid" if report['dry_run'] else f"{report['applied']} applied"
+        self.stdout.write(self.style.SUCCESS(f"{report['rows']} rows, {outcome}, {len(report['errors'])} errors, total {report['total_amount']:,.2f} in {report['elapsed']:.2f}s"))
+
+    def progress(self, report):
+        self.stdout.write(f"chunk {report['chunks']}: {report['rows']} rows, {len(report['errors'])} errors, {report['elapsed']:.2f}s")
@@ -0,0 +1,31 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from loans.services import PaymentWebhookService
+
+class Command(BaseCommand):
+    help = 'Drain queued payment webhooks in batches and allocate them to loans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PaymentWebhookService.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--recorded-by', help='Username recorded on the payments, defaults to the first superuser')
+        parser.add_argument('--watch', action='store_true', help='Keep polling for new webhooks instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep between polls with --watch')
+
+    def handle(self, *args, **options):
+        recorded_by = User.objects.filter(username=options['recorded_by']).first() if options['recorded_by'] else User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        if recorded_by is None:
+            raise CommandError('No user available to record payments; pass --recorded-by')
+        processed = failed = 0
+        while True:
+            started = time.perf_counter()
+            result = PaymentWebhookService.process_batch(recorded_by, options['batch_size'])
+            if result['processed'] or result['failed']:
+                processed += result['processed']
+                failed += result['failed']
+                self.stdout.write(f"Batch: {result['processed']} processed, {result['failed']} failed, {time.perf_counter() - started:.2f}s")
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Webhook queue drained: {processed} processed, {failed} failed'))
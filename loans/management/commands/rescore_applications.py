@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.models import JobLock
+from loans.models import LoanApplication
+from loans.services import CreditScoringService
+
+class Command(BaseCommand):
+    help = 'Recompute credit_score and risk_rating for pending loan applications in batches; run nightly or after scoring rules change'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CreditScoringService.DEFAULT_BATCH_SIZE, help='Applications scored per query')
+        parser.add_argument('--status', action='append', choices=[status for status, _ in LoanApplication.APPLICATION_STATUS], help='Statuses to rescore (repeatable), defaults to submitted and under review')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        with JobLock.hold('credit-rescore') as acquired:
+            if not acquired:
+                self.stdout.write('Credit rescoring is running elsewhere, skipping')
+                return
+            started = time.perf_counter()
+            result = CreditScoringService.score_pending(options['batch_size'], options['status'])
+        self.stdout.write(self.style.SUCCESS(f"Credit scores: {result['scored']} applications scored, {result['updated']} changed in {time.perf_counter() - started:.2f}s"))
@@ -0,0 +1,7 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+class Migration(migrations.Migration):
+    dependencies = [migrations.swappable_dependency(settings.AUTH_USER_MODEL), ('loans', '0011_collateraldocument_loan_loanapplicationdocument_and_more')]
+    operations = [migrations.CreateModel(name='DisbursementBatch', fields=[('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('batch_number', models.CharField(editable=False, max_length=50, unique=True)), ('disbursement_date', models.DateField()), ('payment_method', models.CharField(max_length=20)), ('requested_count', models.IntegerField(default=0)), ('disbursed_count', models.IntegerField(default=0)), ('failed_count', models.IntegerField(default=0)), ('total_principal', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('total_disbursed', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('status', models.CharField(choices=[('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('PARTIAL', 'Partially Completed'), ('FAILED', 'Failed')], default='PROCESSING', max_length=15)), ('errors', models.JSONField(blank=True, default=list)), ('notes', models.TextField(blank=True)), ('created_at', models.DateTimeField(auto_now_add=True)), ('completed_at', models.DateTimeField(blank=True, null=True)), ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='disbursement_batches', to=settings.AUTH_USER_MODEL))], options={'ordering': ['-created_at']}), migrations.AddField(model_name='loan', name='disbursement_batch', field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loans', to='loans.disbursementbatch'))]
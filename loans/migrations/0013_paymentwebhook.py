@@ -0,0 +1,6 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+class Migration(migrations.Migration):
+    dependencies = [('loans', '0012_disbursementbatch_loan_disbursement_batch')]
+    operations = [migrations.CreateModel(name='PaymentWebhook', fields=[('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('provider', models.CharField(default='MOBILE_MONEY', max_length=30)), ('reference', models.CharField(max_length=100)), ('loan_number', models.CharField(blank=True, max_length=50)), ('amount', models.DecimalField(decimal_places=2, max_digits=15)), ('payment_method', models.CharField(default='MOBILE_MONEY', max_length=20)), ('payload', models.JSONField(default=dict)), ('status', models.CharField(choices=[('RECEIVED', 'Received'), ('PROCESSED', 'Processed'), ('FAILED', 'Failed')], default='RECEIVED', max_length=10)), ('error', models.TextField(blank=True)), ('attempts', models.IntegerField(default=0)), ('received_at', models.DateTimeField(auto_now_add=True)), ('processed_at', models.DateTimeField(blank=True, null=True)), ('loan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='webhooks', to='loans.loan'))], options={'ordering': ['-received_at'], 'indexes': [models.Index(fields=['status', 'id'], name='loans_payme_status_c8b14d_idx')], 'unique_together': {('provider', 'reference')}})]
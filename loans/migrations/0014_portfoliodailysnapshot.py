@@ -0,0 +1,7 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+class Migration(migrations.Migration):
+    dependencies = [migrations.swappable_dependency(settings.AUTH_USER_MODEL), ('loans', '0013_paymentwebhook')]
+    operations = [migrations.CreateModel(name='PortfolioDailySnapshot', fields=[('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('snapshot_date', models.DateField()), ('status', models.CharField(choices=[('PENDING_DISBURSEMENT', 'Pending Disbursement'), ('ACTIVE', 'Active'), ('OVERDUE', 'Overdue'), ('DEFAULTED', 'Defaulted'), ('CLOSED', 'Closed'), ('WRITTEN_OFF', 'Written Off')], max_length=25)), ('loan_count', models.IntegerField(default=0)), ('principal_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('outstanding_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('overdue_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('par_1_30', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('par_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('par_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('par_over_90', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('disbursed_count', models.IntegerField(default=0)), ('disbursed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('due_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('collected_principal', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('collected_interest', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('collected_fees', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('collected_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('created_at', models.DateTimeField(auto_now_add=True)), ('loan_officer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='portfolio_snapshots', to=settings.AUTH_USER_MODEL)), ('loan_product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='snapshots', to='loans.loanproduct'))], options={'ordering': ['-snapshot_date', 'loan_product', 'loan_officer', 'status'], 'unique_together': {('snapshot_date', 'loan_product', 'loan_officer', 'status')}})]
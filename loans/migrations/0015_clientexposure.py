@@ -0,0 +1,25 @@
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+import django.db.models.deletion
+
+def fill_exposure(apps, schema_editor):
+    ClientAccount = apps.get_model('client_accounts', 'ClientAccount')
+    ClientExposure = apps.get_model('loans', 'ClientExposure')
+    Loan = apps.get_model('loans', 'Loan')
+    LoanTransaction = apps.get_model('loans', 'LoanTransaction')
+    open_loans = Q(status__in=['ACTIVE', 'OVERDUE'])
+    totals = {row.pop('client_id'): row for row in Loan.objects.order_by().values('client_id').annotate(outstanding_balance=Sum('remaining_balance', filter=open_loans), active_loan_count=Count('pk', filter=open_loans), defaulted_loan_count=Count('pk', filter=Q(status='DEFAULTED')), overdue_amount=Sum('overdue_amount', filter=open_loans))}
+    last_payments = dict(LoanTransaction.objects.filter(transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT', 'EARLY_REPAYMENT']).order_by().values_list('loan__client_id').annotate(last=Max('value_date')))
+    rows = []
+    for client_id in ClientAccount.objects.values_list('pk', flat=True).iterator(chunk_size=2000):
+        row = totals.get(client_id, {})
+        rows.append(ClientExposure(client_id=client_id, outstanding_balance=row.get('outstanding_balance') or Decimal('0'), active_loan_count=row.get('active_loan_count', 0), defaulted_loan_count=row.get('defaulted_loan_count', 0), overdue_amount=row.get('overdue_amount') or Decimal('0'), last_payment_date=last_payments.get(client_id)))
+        if len(rows) >= 2000:
+            ClientExposure.objects.bulk_create(rows)
+            rows = []
+    ClientExposure.objects.bulk_create(rows)
+
+class Migration(migrations.Migration):
+    dependencies = [('client_accounts', '0012_savingstransaction_keyset_index'), ('loans', '0014_portfoliodailysnapshot')]
+    operations = [migrations.CreateModel(name='ClientExposure', fields=[('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='exposure', serialize=False, to='client_accounts.clientaccount')), ('outstanding_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('active_loan_count', models.IntegerField(default=0)), ('defaulted_loan_count', models.IntegerField(default=0)), ('overdue_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)), ('last_payment_date', models.DateField(blank=True, null=True)), ('updated_at', models.DateTimeField(auto_now=True))]), migrations.RunPython(fill_exposure, migrations.RunPython.noop)]
@@ -2,7 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from client_accounts.models import ClientAccount
-from decimal import Decimal, ROUND_HALF_UP
+from core.models import NumberSequence
+from decimal import Decimal, ROUND_HALF_UP, ROUND_FLOOR, localcontext
 import datetime
 from dateutil.relativedelta import relativedelta
 import uuid
@@ -61,6 +62,7 @@ class Loan(models.Model):
     days_overdue = models.IntegerField(default=0)
     status = models.CharField(max_length=25, choices=LOAN_STATUS, default='PENDING_DISBURSEMENT')
     disbursed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='disbursed_loans')
+    disbursement_batch = models.ForeignKey('DisbursementBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='loans')
     loan_officer = models.ForeignKey(User, on_delete=models.PROTECT, related_name='managed_loans')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -70,11 +72,13 @@ class Loan(models.Model):
         ordering = ['-disbursement_date']
         indexes = [models.Index(fields=['status', 'next_payment_date']), models.Index(fields=['client', 'status'])]
 
+    @classmethod
+    def generate_loan_numbers(cls, count=1):
+        return NumberSequence.allocate(f'LN-{datetime.datetime.now():%Y%m}', count, cls.objects, 'loan_number')
+
     def save(self, *args, **kwargs):
         if not self.loan_number:
-            year_month = datetime.datetime.now().strftime('%Y%m')
-            last_loan = Loan.objects.filter(loan_number__startswith=f'LN-{year_month}').count()
-            self.loan_number = f'LN-{year_month}-{last_loan + 1:05d}'
+            self.loan_number = Loan.generate_loan_numbers()[0]
         if self.disbursement_date and (not self.maturity_date):
             self.maturity_date = self.disbursement_date + datetime.timedelta(days=self.term_days)
         if self.status == 'ACTIVE' and self.next_payment_date:
@@ -84,6 +88,34 @@ class Loan(models.Model):
                 self.days_overdue = (today - self.next_payment_date).days
         super().save(*args, **kwargs)
 
+class DisbursementBatch(models.Model):
+    BATCH_STATUS = [('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('PARTIAL', 'Partially Completed'), ('FAILED', 'Failed')]
+    batch_number = models.CharField(max_length=50, unique=True, editable=False)
+    disbursement_date = models.DateField()
+    payment_method = models.CharField(max_length=20)
+    requested_count = models.IntegerField(default=0)
+    disbursed_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    total_principal = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_disbursed = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    status = models.CharField(max_length=15, choices=BATCH_STATUS, default='PROCESSING')
+    errors = models.JSONField(default=list, blank=True)
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='disbursement_batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.batch_number} ({self.disbursed_count}/{self.requested_count})'
+
+    def save(self, *args, **kwargs):
+        if not self.batch_number:
+            self.batch_number = NumberSequence.allocate(f'DSB-{datetime.datetime.now():%Y%m%d}')[0]
+        super().save(*args, **kwargs)
+
 class LoanApplication(models.Model):
     APPLICATION_STATUS = [('DRAFT', 'Draft'), ('SUBMITTED', 'Submitted'), ('UNDER_REVIEW', 'Under Review'), ('APPROVED', 'Approved'), ('CONDITIONALLY_APPROVED', 'Conditionally Approved'), ('REJECTED', 'Rejected'), ('CANCELLED', 'Cancelled')]
     application_id = models.CharField(max_length=20, unique=True, editable=False)
@@ -123,53 +155,26 @@ class LoanApplication(models.Model):
         ordering = ['-application_date']
         indexes = [models.Index(fields=['status', 'application_date']), models.Index(fields=['client', 'status'])]
 
+    @classmethod
+    def generate_application_ids(cls, count=1):
+        return NumberSequence.allocate(f'HALQ-{datetime.datetime.now():%Y%m}', count, cls.objects, 'application_id')
+
     def save(self, *args, **kwargs):
         if not self.application_id:
-            year_month = datetime.datetime.now().strftime('%Y%m')
-            last_id = LoanApplication.objects.filter(application_id__startswith=f'HALQ-{year_month}').count()
-            self.application_id = f'HALQ-{year_month}-{last_id + 1:05d}'
+            self.application_id = LoanApplication.generate_application_ids()[0]
         if not self.application_number:
             self.application_number = f"LA{datetime.datetime.now().strftime('%y%m%d')}{uuid.uuid4().hex[:6].upper()}"
         super().save(*args, **kwargs)
 
     def calculate_credit_score(self):
-        score = 100
-        account_age_days = (datetime.datetime.now().date() - self.client.created_at.date()).days
-        if account_age_days > 365:
-            score += 20
-        elif account_age_days > 180:
-            score += 15
-        elif account_age_days > 90:
-            score += 10
-        elif account_age_days > 30:
-            score += 5
-        savings_percent = self.client.current_balance / self.requested_amount * 100 if self.requested_amount > 0 else 0
-        if savings_percent >= 50:
-            score += 30
-        elif savings_percent >= 30:
-            score += 20
-        elif savings_percent >= 20:
-            score += 10
-        elif savings_percent >= 10:
-            score += 5
-        existing_loans = self.client.loans.filter(status__in=['ACTIVE', 'OVERDUE'])
-        total_existing_debt = sum((loan.remaining_balance for loan in existing_loans))
-        debt_to_income_ratio = (total_existing_debt + self.requested_amount) / self.client.monthly_income if self.client.monthly_income > 0 else 0
-        if debt_to_income_ratio > 0.8:
-            score -= 40
-        elif debt_to_income_ratio > 0.6:
-            score -= 25
-        elif debt_to_income_ratio > 0.4:
-            score -= 10
-        if self.collateral_value:
-            collateral_ratio = self.collateral_value / self.requested_amount if self.requested_amount > 0 else 0
-            if collateral_ratio >= 1.5:
-                score += 25
-            elif collateral_ratio >= 1.2:
-                score += 15
-            elif collateral_ratio >= 1.0:
-                score += 5
-        return max(0, min(100, score))
+        from loans.services.credit_scoring import CreditScoringService
+        return CreditScoringService.score_application(self)
+
+    def refresh_credit_score(self):
+        from loans.services.credit_scoring import CreditScoringService
+        self.credit_score = Decimal(self.calculate_credit_score())
+        self.risk_rating = CreditScoringService.determine_risk_rating(self.credit_score)
+        return self.credit_score
 
 class CollateralDocument(models.Model):
     loan_application = models.ForeignKey(LoanApplication, on_delete=models.CASCADE, related_name='collateral_documents')
@@ -266,13 +271,80 @@ class LoanTransaction(models.Model):
         ordering = ['-transaction_date']
         indexes = [models.Index(fields=['loan', 'transaction_date']), models.Index(fields=['transaction_type', 'value_date'])]
 
+    @classmethod
+    def generate_transaction_ids(cls, count=1):
+        return NumberSequence.allocate(f'TXN-{datetime.datetime.now():%Y%m%d}', count, cls.objects, 'transaction_id')
+
     def save(self, *args, **kwargs):
         if not self.transaction_id:
-            date_str = datetime.datetime.now().strftime('%Y%m%d')
-            last_txn = LoanTransaction.objects.filter(transaction_id__startswith=f'TXN-{date_str}').count()
-            self.transaction_id = f'TXN-{date_str}-{last_txn + 1:05d}'
+            self.transaction_id = LoanTransaction.generate_transaction_ids()[0]
         super().save(*args, **kwargs)
 
+class PaymentWebhook(models.Model):
+    WEBHOOK_STATUS = [('RECEIVED', 'Received'), ('PROCESSED', 'Processed'), ('FAILED', 'Failed')]
+    provider = models.CharField(max_length=30, default='MOBILE_MONEY')
+    reference = models.CharField(max_length=100)
+    loan_number = models.CharField(max_length=50, blank=True)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    payment_method = models.CharField(max_length=20, default='MOBILE_MONEY')
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=WEBHOOK_STATUS, default='RECEIVED')
+    loan = models.ForeignKey(Loan, on_delete=models.SET_NULL, null=True, blank=True, related_name='webhooks')
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-received_at']
+        unique_together = ['provider', 'reference']
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return f'{self.provider} {self.reference} ({self.status})'
+
+class PortfolioDailySnapshot(models.Model):
+    snapshot_date = models.DateField()
+    loan_product = models.ForeignKey(LoanProduct, on_delete=models.PROTECT, related_name='snapshots')
+    loan_officer = models.ForeignKey(User, on_delete=models.PROTECT, related_name='portfolio_snapshots')
+    status = models.CharField(max_length=25, choices=Loan.LOAN_STATUS)
+    loan_count = models.IntegerField(default=0)
+    principal_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    outstanding_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    overdue_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    par_1_30 = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    par_31_60 = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    par_61_90 = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    par_over_90 = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    disbursed_count = models.IntegerField(default=0)
+    disbursed_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    due_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    collected_principal = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    collected_interest = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    collected_fees = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    collected_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-snapshot_date', 'loan_product', 'loan_officer', 'status']
+        unique_together = ['snapshot_date', 'loan_product', 'loan_officer', 'status']
+
+    def __str__(self):
+        return f'{self.snapshot_date} {self.loan_product_id}/{self.loan_officer_id}/{self.status}: {self.loan_count} loans'
+
+class ClientExposure(models.Model):
+    """Per-client loan totals, refreshed by ClientExposureService wherever a loan's balance or status changes; reconcile_exposure repairs drift."""
+    client = models.OneToOneField(ClientAccount, on_delete=models.CASCADE, primary_key=True, related_name='exposure')
+    outstanding_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    active_loan_count = models.IntegerField(default=0)
+    defaulted_loan_count = models.IntegerField(default=0)
+    overdue_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_payment_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.client_id}: {self.outstanding_balance} across {self.active_loan_count} loans'
+
 class Guarantor(models.Model):
     GUARANTOR_TYPES = [('INDIVIDUAL', 'Individual'), ('COMPANY', 'Company'), ('GROUP', 'Group')]
     guarantor_id = models.CharField(max_length=50, unique=True, editable=False)
@@ -297,11 +369,13 @@ class Guarantor(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='guarantors_created')
 
+    @classmethod
+    def generate_guarantor_ids(cls, count=1):
+        return NumberSequence.allocate(f'GTR-{datetime.datetime.now():%Y}', count, cls.objects, 'guarantor_id')
+
     def save(self, *args, **kwargs):
         if not self.guarantor_id:
-            year = datetime.datetime.now().strftime('%Y')
-            last_guarantor = Guarantor.objects.filter(guarantor_id__startswith=f'GTR-{year}').count()
-            self.guarantor_id = f'GTR-{year}-{last_guarantor + 1:05d}'
+            self.guarantor_id = Guarantor.generate_guarantor_ids()[0]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -331,15 +405,29 @@ class InterestCalculationService:
         if interest_type == 'FLAT':
             interest = principal * daily_rate * Decimal(str(interest_days))
         else:
-            interest = Decimal('0')
-            remaining = principal
-            daily_rate_decimal = daily_rate
-            for day in range(term_days):
-                daily_interest = remaining * daily_rate_decimal
-                interest += daily_interest
-                remaining -= principal / Decimal(str(term_days))
+            interest = InterestCalculationService.calculate_reducing_interest(principal, daily_rate, term_days)
         return interest.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+    @staticmethod
+    def calculate_reducing_interest(principal, daily_rate, term_days):
+        if term_days <= 0:
+            return Decimal('0')
+        daily_principal = principal / Decimal(str(term_days))
+        with localcontext() as ctx:
+            ctx.prec = 60
+            days = Decimal(term_days)
+            interest = daily_rate * (principal * days - daily_principal * days * (days - 1) / 2)
+            cents = interest * 100
+            tolerance = (days * days + 1) * (abs(Decimal(principal)) + 1) * Decimal('1e-23')
+            if abs(cents - cents.to_integral_value(rounding=ROUND_FLOOR) - Decimal('0.5')) > tolerance:
+                return interest
+        interest = Decimal('0')
+        remaining = principal
+        for day in range(term_days):
+            interest += remaining * daily_rate
+            remaining -= daily_principal
+        return interest
+
 class AmortizationService:
 
     @staticmethod
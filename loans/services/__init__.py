@@ -1,9 +1,20 @@
 from .interest_calculation import InterestCalculationService
 from .credit_scoring import CreditScoringService
 from .payment_processing import PaymentProcessingService
+from .bulk_payment_import import BulkPaymentImportService
+from .webhook_ingestion import PaymentWebhookService
 from .loan_disbursement import LoanDisbursementService
+from .bulk_disbursement import BulkDisbursementService
 from .amortization import AmortizationService
+from .batch_amortization import BatchAmortizationService
 from .late_fee import LateFeeService
+from .end_of_day import EndOfDayService
+from .aging import LoanAgingService
+from .portfolio_snapshot import PortfolioSnapshotService
+from .collections import CollectionsAnalyticsService
 from .reports import ReportService
+from .dashboard_metrics import DashboardMetricsService
+from .exposure import ClientExposureService
+from .eligibility import ClientEligibilityService
 from .notifications import NotificationService
-__all__ = ['InterestCalculationService', 'CreditScoringService', 'PaymentProcessingService', 'LoanDisbursementService', 'AmortizationService', 'LateFeeService', 'ReportService', 'NotificationService']
\ No newline at end of file
+__all__ = ['InterestCalculationService', 'CreditScoringService', 'PaymentProcessingService', 'BulkPaymentImportService', 'PaymentWebhookService', 'LoanDisbursementService', 'BulkDisbursementService', 'AmortizationService', 'BatchAmortizationService', 'LateFeeService', 'EndOfDayService', 'LoanAgingService', 'PortfolioSnapshotService', 'CollectionsAnalyticsService', 'ReportService', 'DashboardMetricsService', 'ClientExposureService', 'ClientEligibilityService', 'NotificationService']
\ No newline at end of file
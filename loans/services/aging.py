@@ -0,0 +1,61 @@
+from decimal import Decimal
+from django.db.models import Avg, Case, CharField, Count, Q, Sum, Value, When
+
+class LoanAgingService:
+    OPEN_STATUSES = ['ACTIVE', 'OVERDUE']
+    BUCKETS = [('1-30', 1, 30), ('31-60', 31, 60), ('61-90', 61, 90), ('90+', 91, None)]
+    PAR_THRESHOLDS = [30, 60, 90]
+    CURRENT = 'current'
+
+    @staticmethod
+    def bucket_filter(low, high):
+        return Q(days_overdue__gte=low) & (Q(days_overdue__lte=high) if high else Q())
+
+    @classmethod
+    def bucket_range(cls, bucket):
+        return next(((low, high) for name, low, high in cls.BUCKETS if name == bucket), None)
+
+    @classmethod
+    def open_loans(cls):
+        from loans.models import Loan
+        return Loan.objects.filter(status__in=cls.OPEN_STATUSES)
+
+    @classmethod
+    def annotate_buckets(cls, queryset):
+        return queryset.annotate(aging_bucket=Case(*[When(cls.bucket_filter(low, high), then=Value(name)) for name, low, high in cls.BUCKETS], default=Value(cls.CURRENT), output_field=CharField()))
+
+    @classmethod
+    def aggregates(cls):
+        overdue = Q(days_overdue__gt=0)
+        aggregates = {'loan_count': Count('pk'), 'outstanding': Sum('remaining_balance'), 'overdue_count': Count('pk', filter=overdue), 'overdue_balance': Sum('remaining_balance', filter=overdue), 'arrears_amount': Sum('overdue_amount', filter=overdue), 'avg_days': Avg('days_overdue', filter=overdue)}
+        for days in cls.PAR_THRESHOLDS:
+            aggregates[f'par_{days}_count'] = Count('pk', filter=Q(days_overdue__gt=days))
+            aggregates[f'par_{days}_amount'] = Sum('remaining_balance', filter=Q(days_overdue__gt=days))
+        return aggregates
+
+    @classmethod
+    def with_ratios(cls, row):
+        outstanding = row['outstanding'] or Decimal('0')
+        for days in cls.PAR_THRESHOLDS:
+            amount = row[f'par_{days}_amount'] or Decimal('0')
+            row[f'par_{days}_amount'] = amount
+            row[f'par_{days}_ratio'] = (amount / outstanding * 100).quantize(Decimal('0.01')) if outstanding else Decimal('0')
+        row.update({field: row[field] or Decimal('0') for field in ['outstanding', 'overdue_balance', 'arrears_amount']})
+        row['avg_days'] = row['avg_days'] or 0
+        return row
+
+    @classmethod
+    def summary(cls, queryset):
+        # One pass over the open book: bucket counts and balances, PAR numerators and the outstanding denominator.
+        buckets = {}
+        for index, (name, low, high) in enumerate(cls.BUCKETS):
+            buckets[f'bucket_{index}_count'] = Count('pk', filter=cls.bucket_filter(low, high))
+            buckets[f'bucket_{index}_amount'] = Sum('remaining_balance', filter=cls.bucket_filter(low, high))
+        row = queryset.aggregate(**cls.aggregates(), **buckets)
+        row['buckets'] = [{'name': name, 'count': row.pop(f'bucket_{index}_count'), 'amount': row.pop(f'bucket_{index}_amount') or Decimal('0')} for index, (name, low, high) in enumerate(cls.BUCKETS)]
+        return cls.with_ratios(row)
+
+    @classmethod
+    def by_officer(cls, queryset):
+        rows = queryset.values('loan_officer', 'loan_officer__username', 'loan_officer__first_name', 'loan_officer__last_name').annotate(**cls.aggregates()).filter(overdue_count__gt=0).order_by('-overdue_balance')
+        return [cls.with_ratios(row) for row in rows]
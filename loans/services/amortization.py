@@ -1,8 +1,85 @@
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import timedelta
 from dateutil.relativedelta import relativedelta
+from .interest_calculation import InterestCalculationService
 
 class AmortizationService:
+    SCHEDULE_GRACE_PERIOD_DAYS = 5
+
+    @staticmethod
+    def flat_installment_plan(term_days):
+        if term_days <= 30:
+            return (4, 7)
+        elif term_days <= 90:
+            return (12, term_days // 12)
+        return (term_days // 30, 30)
+
+    @classmethod
+    def flat_interest_rows(cls, loan):
+        total_interest = InterestCalculationService.calculate_flat_interest(loan.principal_amount, loan.interest_rate, loan.term_days, method=loan.loan_product.interest_calculation_method)
+        total_repayment = loan.principal_amount + total_interest
+        installments, days_per_installment = cls.flat_installment_plan(loan.term_days)
+        installment_amount = (total_repayment / Decimal(str(installments))).quantize(Decimal('0.01'))
+        installment_principal = (loan.principal_amount / Decimal(str(installments))).quantize(Decimal('0.01'))
+        installment_interest = (total_interest / Decimal(str(installments))).quantize(Decimal('0.01'))
+        rows = []
+        current_date = loan.disbursement_date
+        for i in range(1, installments + 1):
+            current_date = current_date + timedelta(days=days_per_installment)
+            rows.append({'installment_number': i, 'due_date': current_date, 'principal_amount': installment_principal, 'interest_amount': installment_interest, 'total_amount': installment_amount})
+        return rows
+
+    @classmethod
+    def reducing_balance_rows(cls, loan, due_dates=None):
+        monthly_rate = loan.interest_rate / Decimal('100') / Decimal('12')
+        months = max(loan.term_days // 30, 1)
+        if monthly_rate == Decimal('0'):
+            monthly_payment = loan.principal_amount / Decimal(str(months))
+        else:
+            factor = (Decimal('1') + monthly_rate) ** Decimal(str(months))
+            monthly_payment = loan.principal_amount * monthly_rate * factor / (factor - Decimal('1'))
+        rows = []
+        remaining_balance = loan.principal_amount
+        current_date = loan.disbursement_date
+        for i in range(1, months + 1):
+            # Callers that already hold the dates (the batch engine's fallback) pass them in rather than stepping relativedelta again.
+            current_date = due_dates[i - 1] if due_dates else current_date + relativedelta(months=1)
+            interest_amount = remaining_balance * monthly_rate
+            principal_amount = max(monthly_payment - interest_amount, Decimal('0'))
+            remaining_balance -= principal_amount
+            if i == months:
+                principal_amount += remaining_balance
+                remaining_balance = Decimal('0')
+            rows.append({'installment_number': i, 'due_date': current_date, 'principal_amount': principal_amount.quantize(Decimal('0.01')), 'interest_amount': interest_amount.quantize(Decimal('0.01')), 'total_amount': (principal_amount + interest_amount).quantize(Decimal('0.01'))})
+        return rows
+
+    @classmethod
+    def schedule_rows(cls, loan):
+        if loan.loan_product.interest_type == 'FLAT':
+            return cls.flat_interest_rows(loan)
+        return cls.reducing_balance_rows(loan)
+
+    @classmethod
+    def create_repayment_schedule(cls, loan):
+        return cls._save_schedule(loan, cls.schedule_rows(loan))
+
+    @classmethod
+    def create_flat_interest_schedule(cls, loan):
+        return cls._save_schedule(loan, cls.flat_interest_rows(loan))
+
+    @classmethod
+    def create_reducing_balance_schedule(cls, loan):
+        return cls._save_schedule(loan, cls.reducing_balance_rows(loan))
+
+    @classmethod
+    def _save_schedule(cls, loan, rows):
+        from loans.models import LoanRepaymentSchedule
+        schedule_entries = [LoanRepaymentSchedule.objects.create(loan=loan, status='PENDING', grace_period_days=cls.SCHEDULE_GRACE_PERIOD_DAYS, **row) for row in rows]
+        if schedule_entries:
+            loan.first_payment_date = schedule_entries[0].due_date
+            loan.next_payment_date = schedule_entries[0].due_date
+            loan.save()
+        return schedule_entries
 
     @staticmethod
     def generate_schedule(principal, annual_rate, term_months, start_date, frequency='monthly'):
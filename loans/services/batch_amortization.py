@@ -0,0 +1,178 @@
+import datetime
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from .amortization import AmortizationService
+from .interest_calculation import InterestCalculationService
+from .exposure import ClientExposureService
+
+class BatchAmortizationService:
+    DEFAULT_BATCH_SIZE = 500
+    INT64_LIMIT = 2 ** 62
+
+    MONEY_FIELDS = [('principal_cents', 'principal_amount'), ('interest_cents', 'interest_amount'), ('total_cents', 'total_amount')]
+
+    @classmethod
+    def compute_schedules(cls, loans):
+        """The same rows as AmortizationService.schedule_rows, one list per loan."""
+        return [[cls.decimal_row(row) for row in rows] for rows in cls.compute_cents(loans)]
+
+    @classmethod
+    def compute_cents(cls, loans):
+        """Schedules with amounts kept as integer cents (principal_cents, interest_cents, total_cents) straight off the NumPy arrays; Decimals are only made where rows become model instances."""
+        loans = list(loans)
+        schedules = [None] * len(loans)
+        flat, reducing = ([], [])
+        for index, loan in enumerate(loans):
+            if loan.disbursement_date is None:
+                raise ValueError(f'Loan {loan.loan_number or loan.pk} has no disbursement date')
+            cents = (cls._cents(loan.principal_amount), cls._cents(loan.interest_rate))
+            if None in cents:
+                schedules[index] = cls.cents_rows(AmortizationService.schedule_rows(loan))
+            else:
+                (flat if loan.loan_product.interest_type == 'FLAT' else reducing).append((index, *cents))
+        for group, build in ((flat, cls._flat_schedules), (reducing, cls._reducing_schedules)):
+            if group:
+                indexes, principal, rate = zip(*group)
+                for index, rows in zip(indexes, build([loans[i] for i in indexes], list(principal), list(rate))):
+                    schedules[index] = rows
+        return schedules
+
+    @classmethod
+    def decimal_row(cls, row):
+        decimal_row = {'installment_number': row['installment_number'], 'due_date': row['due_date']}
+        for cents, field in cls.MONEY_FIELDS:
+            decimal_row[field] = Decimal(row[cents]).scaleb(-2)
+        return decimal_row
+
+    @classmethod
+    def cents_rows(cls, rows):
+        return [{'installment_number': row['installment_number'], 'due_date': row['due_date'], **{cents: int(row[field].scaleb(2)) for cents, field in cls.MONEY_FIELDS}} for row in rows]
+
+    @classmethod
+    def build_entries(cls, loans, schedules):
+        from loans.models import LoanRepaymentSchedule
+        return [LoanRepaymentSchedule(loan=loan, status='PENDING', grace_period_days=AmortizationService.SCHEDULE_GRACE_PERIOD_DAYS, **cls.decimal_row(row)) for loan, rows in zip(loans, schedules) for row in rows]
+
+    @classmethod
+    def create_repayment_schedules(cls, loans, batch_size=None):
+        from loans.models import Loan, LoanRepaymentSchedule
+        batch_size = batch_size or cls.DEFAULT_BATCH_SIZE
+        loans = list(loans)
+        today = datetime.date.today()
+        created = {}
+        for start in range(0, len(loans), batch_size):
+            batch = loans[start:start + batch_size]
+            schedules = cls.compute_cents(batch)
+            entries = {loan.pk: cls.build_entries([loan], [rows]) for loan, rows in zip(batch, schedules)}
+            scheduled, adjusted = ([], [])
+            for loan, rows in zip(batch, schedules):
+                if not rows:
+                    continue
+                loan.first_payment_date = rows[0]['due_date']
+                loan.next_payment_date = rows[0]['due_date']
+                scheduled.append(loan)
+                if not loan.maturity_date or (loan.status == 'ACTIVE' and today > loan.next_payment_date):
+                    loan.maturity_date = loan.maturity_date or loan.disbursement_date + datetime.timedelta(days=loan.term_days)
+                    if loan.status == 'ACTIVE' and today > loan.next_payment_date:
+                        loan.status = 'OVERDUE'
+                        loan.days_overdue = (today - loan.next_payment_date).days
+                    adjusted.append(loan)
+            with transaction.atomic():
+                LoanRepaymentSchedule.objects.bulk_create([entry for rows in entries.values() for entry in rows])
+                # The payment dates are already on the instances, so they ride along with the maturity and status fixes in one bulk_update.
+                Loan.objects.bulk_update(scheduled, ['first_payment_date', 'next_payment_date', 'maturity_date', 'status', 'days_overdue'], batch_size=batch_size)
+                ClientExposureService.refresh({loan.client_id for loan in adjusted})
+            created.update(entries)
+        return created
+
+    @classmethod
+    def _flat_schedules(cls, loans, principal, rate):
+        terms = [loan.term_days for loan in loans]
+        dtype = np.int64 if max(map(abs, principal)) * max(map(abs, rate)) * max(max(map(abs, terms)), 1) * 2 < cls.INT64_LIMIT else object
+        principal = np.array(principal, dtype=dtype)
+        rate = np.array(rate, dtype=dtype)
+        term = np.array(terms, dtype=np.int64)
+        days_in_year = np.array([InterestCalculationService.DAY_COUNT_METHODS.get(loan.loan_product.interest_calculation_method, InterestCalculationService.DAY_COUNT_METHODS['ACTUAL_365'])['days_in_year'] for loan in loans], dtype=np.int64)
+        numerator = principal * rate * np.maximum(term, 0)
+        denominator = 10000 * days_in_year
+        interest = np.where((term <= 0) | (principal <= 0), 0, (2 * numerator + denominator) // (2 * denominator))
+        installments = np.where(term <= 30, 4, np.where(term <= 90, 12, term // 30))
+        step = np.where(term <= 30, 7, np.where(term <= 90, term // 12, 30))
+        amount = cls._divide_half_even(principal + interest, installments)
+        principal_part = cls._divide_half_even(principal, installments)
+        interest_part = cls._divide_half_even(interest, installments)
+        loan_index, number = cls._expand(installments)
+        starts = np.array([loan.disbursement_date for loan in loans], dtype='datetime64[D]')
+        due_dates = (starts[loan_index] + (step[loan_index] * number).astype('timedelta64[D]')).astype(object).tolist()
+        ends = np.cumsum(installments).tolist()
+        return [[{'installment_number': k, 'due_date': due_date, 'principal_cents': p, 'interest_cents': i, 'total_cents': a} for k, due_date in enumerate(due_dates[end - count:end], 1)] for count, end, p, i, a in zip(installments.tolist(), ends, principal_part.tolist(), interest_part.tolist(), amount.tolist())]
+
+    @classmethod
+    def _reducing_schedules(cls, loans, principal, rate):
+        principal = np.array(principal, dtype=np.float64)
+        rate = np.array(rate, dtype=np.float64) / 10000 / 12
+        months = np.maximum(np.array([loan.term_days for loan in loans], dtype=np.int64) // 30, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.expm1(months * np.log1p(rate))
+            payment = np.where(rate == 0, principal / months, principal * rate * (growth + 1) / growth)
+        ambiguous = ~np.isfinite(payment)
+        payment[ambiguous] = 0
+        width = int(months.max())
+        interest = np.zeros((len(loans), width))
+        principal_part = np.zeros((len(loans), width))
+        tolerance = np.abs(principal) * months * 1e-15 + 1e-09
+        remaining = principal.copy()
+        for k in range(width):
+            interest[:, k] = remaining * rate
+            step = payment - interest[:, k]
+            ambiguous |= (k < months) & (np.abs(step) < tolerance)
+            principal_part[:, k] = np.maximum(step, 0)
+            remaining = remaining - principal_part[:, k]
+            last = months == k + 1
+            principal_part[last, k] += remaining[last]
+            remaining[last] = 0
+        total = principal_part + interest
+        mask = np.arange(width) < months[:, None]
+        for values in (principal_part, interest, total):
+            ambiguous |= (mask & (np.abs(values - np.floor(values) - 0.5) < tolerance[:, None])).any(axis=1)
+        principal_cents, interest_cents, total_cents = (np.rint(values).astype(np.int64).tolist() for values in (principal_part, interest, total))
+        due_dates = cls._monthly_due_dates(loans, width)
+        schedules = []
+        for index, (loan, n, fallback) in enumerate(zip(loans, months.tolist(), ambiguous.tolist())):
+            if fallback:
+                schedules.append(cls.cents_rows(AmortizationService.reducing_balance_rows(loan, due_dates[index][:n])))
+                continue
+            schedules.append([{'installment_number': k, 'due_date': due_date, 'principal_cents': p, 'interest_cents': i, 'total_cents': t} for k, due_date, p, i, t in zip(range(1, n + 1), due_dates[index], principal_cents[index], interest_cents[index], total_cents[index])])
+        return schedules
+
+    @staticmethod
+    def _monthly_due_dates(loans, width):
+        starts = np.array([loan.disbursement_date for loan in loans], dtype='datetime64[D]')
+        start_months = starts.astype('datetime64[M]')
+        first_day = (starts - start_months.astype('datetime64[D]')).astype(np.int64) + 1
+        months = start_months[:, None] + np.arange(1, width + 1)
+        month_starts = months.astype('datetime64[D]')
+        month_lengths = ((months + 1).astype('datetime64[D]') - month_starts).astype(np.int64)
+        days = np.minimum.accumulate(np.minimum(month_lengths, first_day[:, None]), axis=1)
+        return (month_starts + (days - 1).astype('timedelta64[D]')).astype(object).tolist()
+
+    @staticmethod
+    def _expand(counts):
+        loan_index = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        return (loan_index, np.arange(len(loan_index)) - offsets + 1)
+
+    @staticmethod
+    def _divide_half_even(values, divisor):
+        quotient = values // divisor
+        doubled_remainder = 2 * (values - quotient * divisor)
+        round_up = (doubled_remainder > divisor) | (doubled_remainder == divisor) & (quotient % 2 == 1)
+        return quotient + round_up.astype(np.int64)
+
+    @staticmethod
+    def _cents(value):
+        cents = Decimal(value) * 100
+        if cents != cents.to_integral_value():
+            return None
+        return int(cents)
@@ -0,0 +1,156 @@
+import datetime
+from decimal import Decimal
+from django.db import transaction, DatabaseError
+from django.db.models import Case, When, Value, DateField, OuterRef, Subquery
+from django.utils import timezone
+from .batch_amortization import BatchAmortizationService
+from .dashboard_metrics import DashboardMetricsService
+from .exposure import ClientExposureService
+
+class BulkDisbursementService:
+    DEFAULT_CHUNK_SIZE = 250
+
+    @classmethod
+    def validate_applications(cls, application_ids):
+        from loans.models import Loan, LoanApplication
+        applications = list(LoanApplication.objects.filter(pk__in=application_ids).select_related('loan_product').order_by('pk'))
+        disbursed = set(Loan.objects.filter(application_id__in=application_ids).values_list('application_id', flat=True))
+        valid, errors = ([], cls.missing_errors('Application', application_ids, applications))
+        for application in applications:
+            if application.status != 'APPROVED':
+                errors.append(f'Application {application.application_number} is not approved (status: {application.status})')
+            elif application.pk in disbursed:
+                errors.append(f'Application {application.application_number} has already been disbursed')
+            elif not application.approved_amount or application.approved_amount <= 0 or not application.approved_term_days or application.approved_interest_rate is None:
+                errors.append(f'Application {application.application_number} has no approved amount, term or rate')
+            else:
+                valid.append(application)
+        return (valid, errors)
+
+    @classmethod
+    def validate_loans(cls, loan_ids):
+        from loans.models import Loan
+        loans = list(Loan.objects.filter(pk__in=loan_ids).select_related('loan_product', 'application').order_by('pk'))
+        valid, errors = ([], cls.missing_errors('Loan', loan_ids, loans))
+        for loan in loans:
+            if loan.status != 'PENDING_DISBURSEMENT':
+                errors.append(f'Loan {loan.loan_number} is not pending disbursement (status: {loan.status})')
+            elif loan.principal_amount <= 0 or loan.term_days <= 0:
+                errors.append(f'Loan {loan.loan_number} has no principal or term')
+            else:
+                valid.append(loan)
+        return (valid, errors)
+
+    @staticmethod
+    def missing_errors(label, ids, found):
+        return [f'{label} with ID {pk} not found' for pk in sorted(set(map(int, ids)) - {obj.pk for obj in found})]
+
+    @classmethod
+    def disburse_applications(cls, application_ids, disbursed_by, disbursement_date, payment_method, **options):
+        applications, errors = cls.validate_applications(application_ids)
+        return cls.run(applications, errors, cls.disburse_application_chunk, disbursed_by, disbursement_date, payment_method, **options)
+
+    @classmethod
+    def disburse_loans(cls, loan_ids, disbursed_by, disbursement_date, payment_method, **options):
+        loans, errors = cls.validate_loans(loan_ids)
+        return cls.run(loans, errors, cls.disburse_loan_chunk, disbursed_by, disbursement_date, payment_method, **options)
+
+    @classmethod
+    def run(cls, items, errors, disburse_chunk, disbursed_by, disbursement_date, payment_method, reference_prefix='', details=None, notes='', chunk_size=None, validate_only=False):
+        from loans.models import DisbursementBatch
+        report = {'batch': None, 'requested': len(items) + len(errors), 'valid': len(items), 'disbursed': 0, 'total_principal': Decimal('0'), 'total_disbursed': Decimal('0'), 'errors': errors, 'loans': []}
+        if validate_only or not items:
+            return report
+        batch = DisbursementBatch.objects.create(disbursement_date=disbursement_date, payment_method=payment_method, requested_count=report['requested'], notes=notes, created_by=disbursed_by)
+        chunk_size = chunk_size or cls.DEFAULT_CHUNK_SIZE
+        # Chunks commit one by one, so whatever stops the run still has to leave the batch with the counts and status of what went through.
+        try:
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                try:
+                    with transaction.atomic():
+                        loans, transactions = disburse_chunk(chunk, batch, disbursed_by, reference_prefix, details or {}, notes)
+                        ClientExposureService.refresh({loan.client_id for loan in loans})
+                except (ValueError, DatabaseError) as e:
+                    errors.append(f'Items {start + 1}-{start + len(chunk)} were not disbursed: {e}')
+                    continue
+                except Exception as e:
+                    errors.append(f'Items {start + 1}-{len(items)} were not disbursed: run aborted ({type(e).__name__}: {e})')
+                    raise
+                report['loans'] += loans
+                report['disbursed'] += len(loans)
+                report['total_principal'] += sum((loan.principal_amount for loan in loans), Decimal('0'))
+                report['total_disbursed'] += sum((loan_transaction.amount for loan_transaction in transactions), Decimal('0'))
+        finally:
+            batch.disbursed_count = report['disbursed']
+            batch.failed_count = report['requested'] - report['disbursed']
+            batch.total_principal = report['total_principal']
+            batch.total_disbursed = report['total_disbursed']
+            batch.errors = errors
+            batch.status = 'COMPLETED' if not batch.failed_count else 'PARTIAL' if batch.disbursed_count else 'FAILED'
+            batch.completed_at = timezone.now()
+            batch.save()
+            DashboardMetricsService.invalidate()
+        report['batch'] = batch
+        return report
+
+    @classmethod
+    def disburse_application_chunk(cls, applications, batch, disbursed_by, reference_prefix, details, notes):
+        from loans.models import Loan, LoanApplication
+        locked = list(LoanApplication.objects.select_for_update(of=('self',)).filter(pk__in=[application.pk for application in applications], status='APPROVED', loan__isnull=True).values_list('pk', flat=True))
+        if len(locked) != len(applications):
+            raise ValueError('applications changed since validation')
+        date = batch.disbursement_date
+        loans = [Loan(application=application, loan_number=loan_number, client_id=application.client_id, loan_product=application.loan_product, principal_amount=application.approved_amount, interest_rate=application.approved_interest_rate, term_days=application.approved_term_days, disbursement_date=date, maturity_date=date + datetime.timedelta(days=application.approved_term_days), disbursed_by=disbursed_by, disbursement_batch=batch, loan_officer_id=application.loan_officer_id, status='ACTIVE', remaining_balance=application.total_repayment_amount, total_interest_amount=application.total_interest_amount, total_repayment_amount=application.total_repayment_amount, processing_fee_amount=application.processing_fee_amount) for application, loan_number in zip(applications, Loan.generate_loan_numbers(len(applications)))]
+        schedules = BatchAmortizationService.compute_cents(loans)
+        for loan, rows in zip(loans, schedules):
+            loan.first_payment_date = loan.next_payment_date = rows[0]['due_date'] if rows else None
+        Loan.objects.bulk_create(loans)
+        cls.create_schedules(loans, schedules)
+        transactions = cls.create_transactions(loans, batch, disbursed_by, reference_prefix, details, notes, key=lambda loan: loan.application_id)
+        LoanApplication.objects.filter(pk__in=locked).update(status='DISBURSED')
+        return (loans, transactions)
+
+    @classmethod
+    def disburse_loan_chunk(cls, loans, batch, disbursed_by, reference_prefix, details, notes):
+        from loans.models import Loan, LoanApplication, LoanRepaymentSchedule
+        ids = [loan.pk for loan in loans]
+        if len(Loan.objects.select_for_update().filter(pk__in=ids, status='PENDING_DISBURSEMENT').values_list('pk', flat=True)) != len(loans):
+            raise ValueError('loans changed since validation')
+        date = batch.disbursement_date
+        scheduled = set(LoanRepaymentSchedule.objects.filter(loan_id__in=ids).values_list('loan_id', flat=True).distinct())
+        for loan in loans:
+            loan.disbursement_date = date
+            loan.maturity_date = date + datetime.timedelta(days=loan.term_days)
+            loan.status = 'ACTIVE'
+            loan.disbursed_by = disbursed_by
+            loan.disbursement_batch = batch
+        unscheduled = [loan for loan in loans if loan.pk not in scheduled]
+        schedules = BatchAmortizationService.compute_cents(unscheduled)
+        cls.create_schedules(unscheduled, schedules)
+        first_due_date = Subquery(LoanRepaymentSchedule.objects.filter(loan=OuterRef('pk')).order_by('due_date', 'installment_number').values('due_date')[:1])
+        maturity_date = Case(*[When(term_days=term, then=Value(date + datetime.timedelta(days=term))) for term in {loan.term_days for loan in loans}], output_field=DateField())
+        Loan.objects.filter(pk__in=ids).update(status='ACTIVE', disbursement_date=date, maturity_date=maturity_date, disbursed_by=disbursed_by, disbursement_batch=batch, first_payment_date=first_due_date, next_payment_date=first_due_date)
+        for loan, rows in zip(unscheduled, schedules):
+            loan.first_payment_date = loan.next_payment_date = rows[0]['due_date'] if rows else None
+        transactions = cls.create_transactions(loans, batch, disbursed_by, reference_prefix, details, notes, key=lambda loan: loan.pk)
+        LoanApplication.objects.filter(loan__in=ids).update(status='DISBURSED')
+        return (loans, transactions)
+
+    @staticmethod
+    def create_schedules(loans, schedules):
+        from loans.models import LoanRepaymentSchedule
+        LoanRepaymentSchedule.objects.bulk_create(BatchAmortizationService.build_entries(loans, schedules))
+
+    @staticmethod
+    def create_transactions(loans, batch, disbursed_by, reference_prefix, details, notes, key):
+        from loans.models import LoanTransaction
+        transaction_date = timezone.make_aware(datetime.datetime.combine(batch.disbursement_date, datetime.time.min))
+        transactions = []
+        for loan, transaction_id in zip(loans, LoanTransaction.generate_transaction_ids(len(loans))):
+            detail = details.get(key(loan), {})
+            loan_notes = detail.get('notes') or notes
+            amount = loan.application.net_disbursement_amount or loan.principal_amount - loan.processing_fee_amount
+            transactions.append(LoanTransaction(transaction_id=transaction_id, loan=loan, transaction_type='DISBURSEMENT', payment_method=batch.payment_method, amount=amount, principal_amount=loan.principal_amount, fee_amount=loan.processing_fee_amount, transaction_date=transaction_date, value_date=batch.disbursement_date, notes=f'Bulk loan disbursement {batch.batch_number}' + (f': {loan_notes}' if loan_notes else ''), recorded_by=disbursed_by, reference_number=detail.get('reference') or f'{reference_prefix}{loan.loan_number}'))
+        LoanTransaction.objects.bulk_create(transactions)
+        return transactions
@@ -0,0 +1,158 @@
+import csv
+import datetime
+import io
+import time
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .payment_processing import PaymentProcessingService
+
+class BulkPaymentImportService:
+    DEFAULT_CHUNK_SIZE = 500
+    PAYABLE_STATUSES = ['ACTIVE', 'OVERDUE']
+    COLUMN_ALIASES = {'loan': ['loan_number', 'loan_application_number'], 'amount': ['amount', 'payment_amount'], 'reference_number': ['transaction_reference', 'reference_number', 'reference'], 'payment_method': ['payment_method'], 'payment_date': ['payment_date'], 'notes': ['notes']}
+    ERROR_COLUMNS = ['row', 'loan', 'amount', 'error']
+    ERROR_REPORT_LIMIT = 500
+
+    @classmethod
+    def read_rows(cls, source):
+        source = getattr(source, 'file', source)
+        source.seek(0)
+        stream = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+        try:
+            reader = csv.DictReader(stream)
+            columns = {name: next((alias for alias in aliases if alias in (reader.fieldnames or [])), None) for name, aliases in cls.COLUMN_ALIASES.items()}
+            if columns['loan'] is None or columns['amount'] is None:
+                raise ValueError('CSV must contain a loan_number and an amount column')
+            for row_number, row in enumerate(reader, start=2):
+                yield dict({name: (row.get(column) or '').strip() if column else '' for name, column in columns.items()}, row=row_number)
+        finally:
+            stream.detach()
+
+    @staticmethod
+    def chunked(rows, chunk_size):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @classmethod
+    def resolve_loans(cls, references):
+        from loans.models import Loan
+        loans = {}
+        for loan in Loan.objects.filter(Q(loan_number__in=references) | Q(application__application_number__in=references)).select_related('application').only('pk', 'loan_number', 'status', 'remaining_balance', 'application__application_number'):
+            loans[loan.loan_number] = loans[loan.application.application_number] = loan
+        return loans
+
+    @classmethod
+    def validate_row(cls, row, loans, balances, payment_method, payment_date):
+        from loans.models import LoanTransaction
+        if not row['loan'] or not row['amount']:
+            raise ValueError('Missing loan number or amount')
+        try:
+            amount = Decimal(row['amount'].replace(',', ''))
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount {row['amount']!r}")
+        if not amount.is_finite() or amount <= 0 or amount != amount.quantize(PaymentProcessingService.CENT):
+            raise ValueError(f"Invalid amount {row['amount']!r}")
+        loan = loans.get(row['loan'])
+        if loan is None:
+            raise ValueError(f"Loan {row['loan']} not found")
+        if loan.status not in cls.PAYABLE_STATUSES:
+            raise ValueError(f'Loan {loan.loan_number} is {loan.status}, not active')
+        method = (row['payment_method'] or payment_method).upper()
+        if method not in dict(LoanTransaction.PAYMENT_METHODS):
+            raise ValueError(f'Unknown payment method {method!r}')
+        try:
+            value_date = datetime.date.fromisoformat(row['payment_date']) if row['payment_date'] else payment_date
+        except ValueError:
+            raise ValueError(f"Invalid payment date {row['payment_date']!r}, expected YYYY-MM-DD")
+        balance = balances.setdefault(loan.pk, loan.remaining_balance)
+        if amount > balance:
+            raise ValueError(f'Payment {amount} exceeds remaining balance {balance}')
+        balances[loan.pk] = balance - amount
+        return {'loan': loan.pk, 'amount': amount, 'payment_date': value_date, 'payment_method': method, 'reference_number': row['reference_number'][:100], 'notes': row['notes'] or f"Bulk payment import - row {row['row']}"}
+
+    @classmethod
+    def import_csv(cls, source, received_by, **options):
+        return cls.run(CsvRows(source), received_by, **options)
+
+    @classmethod
+    def run(cls, rows, received_by, payment_method='CASH', payment_date=None, dry_run=True, chunk_size=None, progress=None):
+        """Validate the rows, or apply them in chunks. Applying reads the rows twice: a full validation pass runs first and nothing is posted if any row fails it."""
+        payment_date = payment_date or timezone.now().date()
+        options = {'payment_method': payment_method, 'payment_date': payment_date, 'chunk_size': chunk_size or cls.DEFAULT_CHUNK_SIZE, 'progress': progress}
+        report = cls.process(rows, received_by, apply=False, **options)
+        if dry_run:
+            return report
+        if report['errors']:
+            report.update(dry_run=False, refused=True)
+            return report
+        return cls.process(rows, received_by, apply=True, **options)
+
+    @classmethod
+    def process(cls, rows, received_by, apply, payment_method, payment_date, chunk_size, progress):
+        started = time.perf_counter()
+        report = {'dry_run': not apply, 'refused': False, 'rows': 0, 'valid': 0, 'applied': 0, 'total_amount': Decimal('0'), 'chunks': 0, 'errors': [], 'elapsed': 0.0}
+        balances = {}
+        for chunk in cls.chunked(rows, chunk_size):
+            loans = cls.resolve_loans({row['loan'] for row in chunk if row['loan']})
+            payments, valid_rows = ([], [])
+            for row in chunk:
+                try:
+                    payments.append(cls.validate_row(row, loans, balances, payment_method, payment_date))
+                    valid_rows.append(row)
+                except ValueError as error:
+                    cls.add_error(report, row, error)
+            report['rows'] += len(chunk)
+            report['valid'] += len(payments)
+            if apply and payments:
+                # Rows still get re-checked here: a payment posted elsewhere since the validation pass can push a row over the balance.
+                for row, payment, result in zip(valid_rows, payments, cls.apply_chunk(payments, received_by)):
+                    if isinstance(result, Exception):
+                        cls.add_error(report, row, result)
+                        continue
+                    report['applied'] += 1
+                    report['total_amount'] += payment['amount']
+            elif not apply:
+                report['total_amount'] += sum((payment['amount'] for payment in payments), Decimal('0'))
+            report['chunks'] += 1
+            report['elapsed'] = time.perf_counter() - started
+            if progress:
+                progress(report)
+        report['errors'].sort(key=lambda error: error['row'])
+        report['elapsed'] = time.perf_counter() - started
+        return report
+
+    @classmethod
+    @transaction.atomic
+    def apply_chunk(cls, payments, received_by):
+        from loans.models import LoanPayment
+        results = PaymentProcessingService.process_payments(payments, received_by)
+        LoanPayment.objects.bulk_create([LoanPayment(loan=result['loan'], installment=result['transactions'][0].installment, transaction=result['transactions'][0], amount=result['total_paid'], principal_amount=result['principal'], interest_amount=result['interest'], late_fee_amount=result['late_fees'], status='PAID') for result in results if not isinstance(result, Exception)])
+        return results
+
+    @staticmethod
+    def add_error(report, row, error):
+        report['errors'].append({'row': row['row'], 'loan': row['loan'], 'amount': row['amount'], 'error': str(error)})
+
+    @classmethod
+    def write_error_report(cls, errors, output):
+        writer = csv.DictWriter(output, fieldnames=cls.ERROR_COLUMNS)
+        writer.writeheader()
+        writer.writerows(errors)
+        return output
+
+class CsvRows:
+    """The rows of an uploaded CSV; each iteration re-reads the file from the start, so an import can be validated in full before it is applied."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def __iter__(self):
+        return BulkPaymentImportService.read_rows(self.source)
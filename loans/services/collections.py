@@ -0,0 +1,45 @@
+import calendar
+from decimal import Decimal
+from datetime import timedelta
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+class CollectionsAnalyticsService:
+    COLLECTION_TYPES = ['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT']
+
+    @classmethod
+    def payments(cls, start_date, end_date):
+        from loans.models import LoanTransaction
+        return LoanTransaction.objects.filter(transaction_type__in=cls.COLLECTION_TYPES, value_date__range=[start_date, end_date])
+
+    @staticmethod
+    def window_total(days, start_date, end_date):
+        rows = [row for day, row in days.items() if start_date <= day <= end_date]
+        return {'total': sum((row['total'] for row in rows), Decimal('0')), 'count': sum((row['count'] for row in rows))}
+
+    @classmethod
+    def analytics(cls, start_date, end_date, today=None):
+        # Three grouped queries whatever the range: the daily series (widened to cover this week and month, and rolled up into weeks here), then the method and officer splits.
+        today = today or timezone.now().date()
+        week_start = today - timedelta(days=today.weekday())
+        month_start = today.replace(day=1)
+        month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+        week_end = week_start + timedelta(days=6)
+        days = {row['value_date']: row for row in cls.payments(min(start_date, week_start, month_start), max(end_date, month_end, week_end)).filter(Q(value_date__range=[start_date, end_date]) | Q(value_date__range=[min(week_start, month_start), max(week_end, month_end)])).values('value_date').annotate(total=Sum('amount'), count=Count('pk')).order_by('value_date')}
+        by_day, by_week = [], {}
+        day = start_date
+        while day <= end_date:
+            row = days.get(day, {'total': Decimal('0'), 'count': 0})
+            by_day.append({'date': day, 'total': row['total'], 'count': row['count']})
+            week = by_week.setdefault(day - timedelta(days=day.weekday()), {'week': day - timedelta(days=day.weekday()), 'total': Decimal('0'), 'count': 0})
+            week['total'] += row['total']
+            week['count'] += row['count']
+            day += timedelta(days=1)
+        period = cls.window_total(days, start_date, end_date)
+        payments = cls.payments(start_date, end_date)
+        by_method = list(payments.values('payment_method').annotate(total=Sum('amount'), count=Count('pk')).order_by('-total'))
+        for method in by_method:
+            method['percentage'] = method['total'] / period['total'] * 100 if period['total'] else 0
+        by_officer = list(payments.values('recorded_by', 'recorded_by__username', 'recorded_by__first_name', 'recorded_by__last_name').annotate(total=Sum('amount'), count=Count('pk')).order_by('-total'))
+        day_count = (end_date - start_date).days + 1
+        return {'period': {'start': start_date, 'end': end_date}, 'summary': {'total_collected': period['total'], 'total_transactions': period['count'], 'average_daily': period['total'] / day_count if day_count > 0 else Decimal('0')}, 'by_day': by_day, 'by_week': list(by_week.values()), 'by_method': by_method, 'by_officer': by_officer, 'today': cls.window_total(days, today, today), 'week': cls.window_total(days, week_start, week_end), 'month': cls.window_total(days, month_start, month_end)}
@@ -1,7 +1,20 @@
 from decimal import Decimal
+import numpy as np
+from django.db import transaction
 from django.utils import timezone
 
 class CreditScoringService:
+    PENDING_STATUSES = ['SUBMITTED', 'UNDER_REVIEW']
+    DEFAULT_BATCH_SIZE = 1000
+    INT64_LIMIT = 2 ** 62
+    BASE_SCORE = 100
+    # Ladders from LoanApplication's original scoring, highest rung first; the first rung that matches wins, as in the elif chains.
+    ACCOUNT_AGE_POINTS = [(365, 20), (180, 15), (90, 10), (30, 5)]
+    SAVINGS_PERCENT_POINTS = [(50, 30), (30, 20), (20, 10), (10, 5)]
+    DEBT_TO_INCOME_POINTS = [(Decimal('0.8'), -40), (Decimal('0.6'), -25), (Decimal('0.4'), -10)]
+    COLLATERAL_RATIO_POINTS = [(Decimal('1.5'), 25), (Decimal('1.2'), 15), (Decimal('1.0'), 5)]
+    RISK_RATINGS = [(80, 'A'), (60, 'B'), (40, 'C')]
+    LOWEST_RATING = 'D'
 
     @classmethod
     def calculate_credit_score(cls, client, loan_amount: Decimal) -> Decimal:
@@ -17,4 +30,73 @@ class CreditScoringService:
         elif credit_score >= Decimal('40'):
             return 'C'
         else:
-            return 'D'
\ No newline at end of file
+            return 'D'
+
+    @staticmethod
+    def _cents(value):
+        return int(Decimal(value or 0) * 100)
+
+    @classmethod
+    def features(cls, rows, today=None):
+        """rows: (requested_amount, collateral_value, registration_date, savings_balance) per application; amounts become integer cents so every rung compares exactly."""
+        today = today or timezone.localdate()
+        requested, collateral, ages, savings = [], [], [], []
+        for requested_amount, collateral_value, registration_date, savings_balance in rows:
+            requested.append(cls._cents(requested_amount))
+            collateral.append(cls._cents(collateral_value))
+            ages.append((today - timezone.localtime(registration_date).date()).days if registration_date else 0)
+            savings.append(cls._cents(savings_balance))
+        # ClientAccount records no income, so the ladder's own monthly_income > 0 guard keeps debt-to-income at 0 and outstanding debt is not fetched.
+        zeros = [0] * len(requested)
+        magnitude = max(map(abs, requested + collateral + savings), default=0)
+        dtype = np.int64 if magnitude * 100 < cls.INT64_LIMIT else object
+        return {'requested': np.array(requested, dtype=dtype), 'collateral': np.array(collateral, dtype=dtype), 'savings': np.array(savings, dtype=dtype), 'debt': np.array(zeros, dtype=dtype), 'income': np.array(zeros, dtype=dtype), 'age_days': np.array(ages, dtype=np.int64)}
+
+    @staticmethod
+    def _ladder(conditions, points):
+        return np.select([np.asarray(condition, dtype=bool) for condition in conditions], points, 0) if conditions else 0
+
+    @classmethod
+    def score_features(cls, features):
+        requested, savings, collateral, debt, income = (features[name] for name in ('requested', 'savings', 'collateral', 'debt', 'income'))
+        age = features['age_days']
+        positive, has_income = requested > 0, income > 0
+        score = np.full(len(age), cls.BASE_SCORE, dtype=np.int64)
+        score += cls._ladder([age > days for days, _ in cls.ACCOUNT_AGE_POINTS], [points for _, points in cls.ACCOUNT_AGE_POINTS])
+        score += cls._ladder([positive & (savings * 100 >= percent * requested) for percent, _ in cls.SAVINGS_PERCENT_POINTS], [points for _, points in cls.SAVINGS_PERCENT_POINTS])
+        # Ratios are compared cross-multiplied by each threshold's exact fraction, so a boundary case never depends on float division.
+        score += cls._ladder([has_income & ((debt + requested) * threshold.as_integer_ratio()[1] > threshold.as_integer_ratio()[0] * income) for threshold, _ in cls.DEBT_TO_INCOME_POINTS], [points for _, points in cls.DEBT_TO_INCOME_POINTS])
+        score += cls._ladder([positive & (collateral != 0) & (collateral * threshold.as_integer_ratio()[1] >= threshold.as_integer_ratio()[0] * requested) for threshold, _ in cls.COLLATERAL_RATIO_POINTS], [points for _, points in cls.COLLATERAL_RATIO_POINTS])
+        return np.clip(score, 0, 100)
+
+    @classmethod
+    def risk_ratings(cls, scores):
+        return np.select([scores >= floor for floor, _ in cls.RISK_RATINGS], [rating for _, rating in cls.RISK_RATINGS], cls.LOWEST_RATING)
+
+    @classmethod
+    def score_application(cls, application):
+        client = application.client
+        scores = cls.score_features(cls.features([(application.requested_amount, application.collateral_value, client.registration_date, client.savings_balance)]))
+        return int(scores[0])
+
+    @classmethod
+    def score_pending(cls, batch_size=None, statuses=None, today=None):
+        """Rescore every pending application in primary-key batches: one query per batch for the features and one bulk_update for the rows whose score or rating moved."""
+        from loans.models import LoanApplication
+        batch_size = batch_size or cls.DEFAULT_BATCH_SIZE
+        pending = LoanApplication.objects.filter(status__in=statuses or cls.PENDING_STATUSES).order_by('pk')
+        scored = updated = last_pk = 0
+        while True:
+            rows = list(pending.filter(pk__gt=last_pk).values_list('pk', 'credit_score', 'risk_rating', 'requested_amount', 'collateral_value', 'client__registration_date', 'client__savings_balance')[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            scores = cls.score_features(cls.features([row[3:] for row in rows], today))
+            ratings = cls.risk_ratings(scores)
+            changed = [LoanApplication(pk=pk, credit_score=Decimal(int(score)), risk_rating=str(rating)) for (pk, credit_score, risk_rating, *_), score, rating in zip(rows, scores, ratings) if credit_score != int(score) or risk_rating != rating]
+            if changed:
+                with transaction.atomic():
+                    LoanApplication.objects.bulk_update(changed, ['credit_score', 'risk_rating'])
+            scored += len(rows)
+            updated += len(changed)
+        return {'scored': scored, 'updated': updated}
@@ -0,0 +1,42 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum, Q
+from django.utils import timezone
+
+class DashboardMetricsService:
+    CACHE_KEY = 'loans:dashboard-metrics'
+    CACHE_TTL = 60
+    PORTFOLIO_STATUSES = ['ACTIVE', 'OVERDUE']
+    PENDING_APPLICATION_STATUSES = ['SUBMITTED', 'UNDER_REVIEW']
+    COLLECTION_TYPES = ['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT']
+
+    @classmethod
+    def cache_key(cls, today):
+        return f'{cls.CACHE_KEY}:{today.isoformat()}'
+
+    @classmethod
+    def metrics(cls, today=None):
+        today = today or timezone.now().date()
+        key = cls.cache_key(today)
+        metrics = cache.get(key)
+        if metrics is None:
+            metrics = cls.compute(today)
+            cache.set(key, metrics, cls.CACHE_TTL)
+        return metrics
+
+    @classmethod
+    def compute(cls, today):
+        from loans.models import Loan, LoanApplication, LoanTransaction
+        zero = Decimal('0')
+        loans = Loan.objects.aggregate(total_loans=Count('pk'), active_loans=Count('pk', filter=Q(status='ACTIVE')), overdue_loans=Count('pk', filter=Q(status='OVERDUE')), total_portfolio=Sum('remaining_balance', filter=Q(status__in=cls.PORTFOLIO_STATUSES)), overdue_amount=Sum('overdue_amount', filter=Q(status='OVERDUE')), total_disbursed=Sum('principal_amount'), disbursements_today=Sum('principal_amount', filter=Q(disbursement_date=today)))
+        transactions = LoanTransaction.objects.filter(transaction_type__in=cls.COLLECTION_TYPES).aggregate(total_interest_earned=Sum('amount', filter=Q(transaction_type='INTEREST_PAYMENT')), payments_today=Sum('amount', filter=Q(value_date=today)))
+        applications = LoanApplication.objects.aggregate(pending_applications=Count('pk', filter=Q(status__in=cls.PENDING_APPLICATION_STATUSES)), applications_today=Count('pk', filter=Q(application_date__date=today)))
+        metrics = {**loans, **transactions, **applications}
+        for field in ['total_portfolio', 'overdue_amount', 'total_disbursed', 'disbursements_today', 'total_interest_earned', 'payments_today']:
+            metrics[field] = metrics[field] or zero
+        return metrics
+
+    @classmethod
+    def invalidate(cls):
+        transaction.on_commit(lambda: cache.delete(cls.cache_key(timezone.now().date())))
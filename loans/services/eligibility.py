@@ -0,0 +1,36 @@
+import hashlib
+import json
+from decimal import Decimal
+
+class ClientEligibilityService:
+    SAVINGS_MULTIPLIER = Decimal('3')
+    INCOME_MULTIPLIER = Decimal('6')
+    MAX_CLIENTS = 5000
+    FIELDS = ['id', 'savings_balance', 'account_status', 'exposure__outstanding_balance', 'exposure__overdue_amount', 'exposure__active_loan_count']
+
+    @classmethod
+    def assess(cls, savings_balance, existing_debt, monthly_income=None):
+        max_loan_by_savings = savings_balance * cls.SAVINGS_MULTIPLIER
+        max_loan_by_income = monthly_income * cls.INCOME_MULTIPLIER if monthly_income else Decimal('0')
+        # ClientAccount records no income, so the income cap only binds when a caller supplies one.
+        eligible_amount = min(max_loan_by_savings, max_loan_by_income) if monthly_income else max_loan_by_savings
+        return {'max_loan_by_savings': max_loan_by_savings, 'max_loan_by_income': max_loan_by_income, 'eligible_amount': eligible_amount, 'available_amount': max(Decimal('0'), eligible_amount - existing_debt)}
+
+    @classmethod
+    def rows(cls, clients):
+        """The one query behind a batch: every input comes from ClientAccount joined to its ClientExposure row."""
+        return clients.order_by('pk').values(*cls.FIELDS)
+
+    @classmethod
+    def summarize(cls, row):
+        from client_accounts.models import ClientAccount
+        debt = row['exposure__outstanding_balance'] or Decimal('0')
+        assessment = cls.assess(row['savings_balance'], debt)
+        entry = {'id': row['id'], 'savings': float(row['savings_balance']), 'debt': float(debt), 'overdue': float(row['exposure__overdue_amount'] or 0), 'loans': row['exposure__active_loan_count'] or 0, 'eligible': float(assessment['eligible_amount']), 'available': float(assessment['available_amount']), 'ok': row['account_status'] == ClientAccount.STATUS_ACTIVE and row['savings_balance'] >= ClientAccount.MIN_LOAN_SAVINGS and assessment['available_amount'] > 0}
+        # The version changes exactly when the client's answer does, so callers can cache entries per client and compare.
+        entry['v'] = hashlib.blake2b(json.dumps(entry, sort_keys=True).encode(), digest_size=6).hexdigest()
+        return entry
+
+    @staticmethod
+    def etag(entries):
+        return '"%s"' % hashlib.blake2b(','.join(f"{entry['id']}:{entry['v']}" for entry in entries).encode(), digest_size=12).hexdigest()
@@ -0,0 +1,84 @@
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Q, F, Sum, Min, Case, When, Value, DecimalField
+from django.utils import timezone
+from .dashboard_metrics import DashboardMetricsService
+from .exposure import ClientExposureService
+
+class EndOfDayService:
+    DEFAULT_CHUNK_SIZE = 1000
+    OPEN_LOAN_STATUSES = ['ACTIVE', 'OVERDUE']
+    UNPAID_INSTALLMENT_STATUSES = ['PENDING', 'DUE', 'PARTIALLY_PAID', 'OVERDUE']
+
+    @classmethod
+    def loan_id_chunks(cls, chunk_size=None):
+        from loans.models import Loan
+        chunk_size = chunk_size or cls.DEFAULT_CHUNK_SIZE
+        last_id = 0
+        while True:
+            ids = list(Loan.objects.filter(status__in=cls.OPEN_LOAN_STATUSES, pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    @classmethod
+    def past_grace_filter(cls, as_of_date, grace_periods):
+        condition = Q(pk__in=[])
+        for grace in grace_periods:
+            condition |= Q(grace_period_days=grace, due_date__lt=as_of_date - datetime.timedelta(days=grace))
+        return condition
+
+    @classmethod
+    def grace_periods(cls):
+        from loans.models import LoanRepaymentSchedule
+        return list(LoanRepaymentSchedule.objects.filter(loan__status__in=cls.OPEN_LOAN_STATUSES).exclude(status='PAID').values_list('grace_period_days', flat=True).distinct())
+
+    @classmethod
+    @transaction.atomic
+    def update_installment_statuses(cls, loan_ids, as_of_date, grace_periods):
+        from loans.models import LoanRepaymentSchedule
+        installments = LoanRepaymentSchedule.objects.filter(loan_id__in=loan_ids)
+        overdue = installments.filter(cls.past_grace_filter(as_of_date, grace_periods), status__in=['PENDING', 'DUE']).update(status='OVERDUE')
+        due = installments.filter(status='PENDING', due_date__lte=as_of_date).update(status='DUE')
+        return overdue + due
+
+    @classmethod
+    @transaction.atomic
+    def update_loan_arrears(cls, loan_ids, as_of_date):
+        from loans.models import Loan, LoanRepaymentSchedule
+        arrears = LoanRepaymentSchedule.objects.filter(loan_id__in=loan_ids, status__in=cls.UNPAID_INSTALLMENT_STATUSES, due_date__lt=as_of_date).values('loan_id').annotate(amount=Sum(F('total_amount') - F('total_paid')), oldest_due_date=Min('due_date')).filter(amount__gt=0)
+        arrears = {row['loan_id']: (row['amount'], (as_of_date - row['oldest_due_date']).days, 'OVERDUE') for row in arrears}
+        current = Loan.objects.filter(pk__in=arrears).values_list('pk', 'overdue_amount', 'days_overdue', 'status')
+        overdue_loans = [Loan(pk=pk, overdue_amount=arrears[pk][0], days_overdue=arrears[pk][1], status='OVERDUE') for pk, *values in current if tuple(values) != arrears[pk]]
+        Loan.objects.bulk_update(overdue_loans, ['overdue_amount', 'days_overdue', 'status'])
+        cleared = Loan.objects.filter(pk__in=loan_ids).exclude(pk__in=list(arrears)).exclude(overdue_amount=0, days_overdue=0, status='ACTIVE').update(overdue_amount=0, days_overdue=0, status='ACTIVE')
+        if overdue_loans or cleared:
+            ClientExposureService.refresh_loans(loan_ids)
+        DashboardMetricsService.invalidate()
+        return len(overdue_loans) + cleared
+
+    @classmethod
+    @transaction.atomic
+    def post_late_fees(cls, loan_ids, as_of_date, grace_periods, recorded_by):
+        from loans.models import Loan, LoanRepaymentSchedule, LoanTransaction
+        installments = list(LoanRepaymentSchedule.objects.select_for_update(of=('self',)).filter(cls.past_grace_filter(as_of_date, grace_periods), loan_id__in=loan_ids, late_fee_applied=False, status__in=cls.UNPAID_INSTALLMENT_STATUSES, total_paid__lt=F('total_amount')).values('pk', 'loan_id', 'installment_number', 'total_amount', 'total_paid', 'late_fee_amount', 'loan__loan_product__late_payment_fee_percent'))
+        if not installments:
+            return 0
+        transaction_date = timezone.make_aware(datetime.datetime.combine(as_of_date, datetime.time.min))
+        transactions, updated, loan_fees = ([], [], {})
+        for row in installments:
+            late_fee = ((row['total_amount'] - row['total_paid']) * row['loan__loan_product__late_payment_fee_percent'] / Decimal('100')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            updated.append(LoanRepaymentSchedule(pk=row['pk'], late_fee_applied=True, late_fee_amount=row['late_fee_amount'] + late_fee))
+            if late_fee <= Decimal('0'):
+                continue
+            transactions.append(LoanTransaction(reference_number=f'EOD-{as_of_date:%Y%m%d}', loan_id=row['loan_id'], installment_id=row['pk'], transaction_type='PENALTY_CHARGE', payment_method='SYSTEM', amount=late_fee, fee_amount=late_fee, transaction_date=transaction_date, value_date=as_of_date, notes=f"Late fee for installment #{row['installment_number']}", recorded_by=recorded_by))
+            loan_fees[row['loan_id']] = loan_fees.get(row['loan_id'], Decimal('0')) + late_fee
+        for loan_transaction, transaction_id in zip(transactions, LoanTransaction.generate_transaction_ids(len(transactions))):
+            loan_transaction.transaction_id = transaction_id
+        LoanTransaction.objects.bulk_create(transactions)
+        LoanRepaymentSchedule.objects.bulk_update(updated, ['late_fee_applied', 'late_fee_amount'])
+        if loan_fees:
+            Loan.objects.filter(pk__in=loan_fees).update(late_fee_amount=F('late_fee_amount') + Case(*[When(pk=loan_id, then=Value(fee)) for loan_id, fee in loan_fees.items()], output_field=DecimalField(max_digits=15, decimal_places=2)))
+        return len(transactions)
@@ -0,0 +1,73 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DEFERRED, Count, Max, Q, Sum
+from django.utils import timezone
+
+class ClientExposureService:
+    OPEN_STATUSES = ['ACTIVE', 'OVERDUE']
+    DEFAULTED_STATUSES = ['DEFAULTED']
+    PAYMENT_TYPES = ['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT', 'EARLY_REPAYMENT']
+    FIELDS = ['outstanding_balance', 'active_loan_count', 'defaulted_loan_count', 'overdue_amount', 'last_payment_date']
+    LOAN_FIELDS = ['client', 'status', 'remaining_balance', 'overdue_amount']
+    DEFAULT_CHUNK_SIZE = 1000
+
+    @classmethod
+    def compute(cls, client_ids):
+        """Exposure totals for the given clients from two grouped queries, whatever their loan count; clients without loans get zeros."""
+        from loans.models import Loan, LoanTransaction
+        zero = Decimal('0')
+        totals = {client_id: {'outstanding_balance': zero, 'active_loan_count': 0, 'defaulted_loan_count': 0, 'overdue_amount': zero, 'last_payment_date': None} for client_id in client_ids}
+        open_loans = Q(status__in=cls.OPEN_STATUSES)
+        for row in Loan.objects.filter(client_id__in=client_ids).order_by().values('client_id').annotate(outstanding_balance=Sum('remaining_balance', filter=open_loans), active_loan_count=Count('pk', filter=open_loans), defaulted_loan_count=Count('pk', filter=Q(status__in=cls.DEFAULTED_STATUSES)), overdue_amount=Sum('overdue_amount', filter=open_loans)):
+            totals[row.pop('client_id')].update({name: zero if value is None else value for name, value in row.items()})
+        for client_id, last_payment_date in LoanTransaction.objects.filter(loan__client_id__in=client_ids, transaction_type__in=cls.PAYMENT_TYPES).order_by().values_list('loan__client_id').annotate(last=Max('value_date')):
+            totals[client_id]['last_payment_date'] = last_payment_date
+        return totals
+
+    @classmethod
+    @transaction.atomic
+    def refresh(cls, client_ids):
+        """Recompute and store the exposure rows of the given clients; call it in the transaction that changed their loans. Returns the rows that moved."""
+        from loans.models import ClientExposure
+        client_ids = sorted(set(client_ids) - {None})
+        if not client_ids:
+            return []
+        ClientExposure.objects.bulk_create([ClientExposure(client_id=client_id) for client_id in client_ids], ignore_conflicts=True)
+        # Locking the rows in key order before reading the loans serializes concurrent refreshes of one client, so the later one sees the earlier one's commit.
+        current = {exposure.client_id: exposure for exposure in ClientExposure.objects.select_for_update().filter(client_id__in=client_ids).order_by('client_id')}
+        now = timezone.now()
+        changed = []
+        for client_id, values in cls.compute(client_ids).items():
+            exposure = current[client_id]
+            if any(getattr(exposure, name) != value for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(exposure, name, value)
+                exposure.updated_at = now
+                changed.append(exposure)
+        ClientExposure.objects.bulk_update(changed, cls.FIELDS + ['updated_at'])
+        return changed
+
+    @classmethod
+    def loan_state(cls, loan):
+        """The loan's values that feed its client's exposure row, read without loading deferred fields."""
+        return tuple(loan.__dict__.get(loan._meta.get_field(name).attname, DEFERRED) for name in cls.LOAN_FIELDS)
+
+    @classmethod
+    def refresh_loans(cls, loan_ids):
+        from loans.models import Loan
+        return cls.refresh(Loan.objects.filter(pk__in=list(loan_ids)).values_list('client_id', flat=True).distinct())
+
+    @classmethod
+    def reconcile(cls, chunk_size=None):
+        """Refresh every client's row in primary-key chunks, creating missing rows; returns how many were checked and how many had drifted."""
+        from client_accounts.models import ClientAccount
+        chunk_size = chunk_size or cls.DEFAULT_CHUNK_SIZE
+        checked = repaired = last_id = 0
+        while True:
+            ids = list(ClientAccount.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            checked += len(ids)
+            repaired += len(cls.refresh(ids))
+        return {'checked': checked, 'repaired': repaired}
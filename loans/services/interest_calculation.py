@@ -15,6 +15,11 @@ class InterestCalculationService:
         else:
             return max((end_date - start_date).days, 0)
 
+    @classmethod
+    def calculate_interest(cls, principal, annual_rate, term_days, method='ACTUAL_365', interest_type='FLAT'):
+        from loans.models import InterestCalculationService as LoanInterestCalculationService
+        return LoanInterestCalculationService.calculate_interest(principal, annual_rate, term_days, method=method, interest_type=interest_type)
+
     @classmethod
     def calculate_flat_interest(cls, principal: Decimal, annual_rate: Decimal, days: int, method: str='ACTUAL_365') -> Decimal:
         if days <= 0 or principal <= 0:
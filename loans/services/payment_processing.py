@@ -1,18 +1,173 @@
-from decimal import Decimal
+import datetime
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Q, Sum
+from django.db.models import Sum
+from .dashboard_metrics import DashboardMetricsService
+from .exposure import ClientExposureService
 
 class PaymentProcessingService:
+    ALLOCATION_STRATEGIES = ['AUTO', 'LATE_FEES_FIRST', 'PRINCIPAL_FIRST', 'INTEREST_FIRST']
+    UNPAID_STATUSES = ['PENDING', 'DUE', 'PARTIALLY_PAID', 'OVERDUE']
+    CENT = Decimal('0.01')
+    # bulk_update emits one CASE/WHEN statement per batch; capping it keeps each statement small on large imports.
+    UPDATE_BATCH_SIZE = 200
+    BALANCE_FIELDS = ['total_paid_amount', 'remaining_balance', 'overdue_amount', 'days_overdue', 'next_payment_date', 'status', 'closed_at']
 
     @classmethod
     @transaction.atomic
-    def process_payment(cls, loan, amount: Decimal, payment_date, payment_method: str, received_by, notes: str='') -> dict:
-        if amount <= Decimal('0'):
-            raise ValueError('Payment amount must be greater than zero')
-        allocation = {'principal': Decimal('0'), 'interest': Decimal('0'), 'late_fees': Decimal('0'), 'transactions': []}
-        return allocation
+    def process_payment(cls, loan, amount: Decimal, payment_date, payment_method: str, received_by, notes: str='', allocation_strategy: str='AUTO') -> dict:
+        result = cls.process_payments([{'loan': loan, 'amount': amount, 'payment_date': payment_date, 'payment_method': payment_method, 'notes': notes, 'allocation_strategy': allocation_strategy}], received_by)[0]
+        if isinstance(result, Exception):
+            raise result
+        for field in cls.BALANCE_FIELDS:
+            setattr(loan, field, getattr(result['loan'], field))
+        return result
+
+    @classmethod
+    @transaction.atomic
+    def process_payments(cls, payments, received_by) -> list:
+        from loans.models import Loan, LoanRepaymentSchedule, LoanTransaction
+        loans = Loan.objects.select_for_update().in_bulk({getattr(payment['loan'], 'pk', payment['loan']) for payment in payments})
+        schedules = {loan_id: [] for loan_id in loans}
+        for installment in LoanRepaymentSchedule.objects.select_for_update().filter(loan_id__in=list(loans), status__in=cls.UNPAID_STATUSES).order_by('due_date', 'installment_number'):
+            schedules[installment.loan_id].append(installment)
+        labels = {'LATE_FEE_PAYMENT': 'Late fee payment', 'PRINCIPAL_PAYMENT': 'Principal payment', 'INTEREST_PAYMENT': 'Interest payment', 'ADVANCE_PAYMENT': 'Advance payment', 'PRINCIPAL_REDUCTION': 'Principal reduction'}
+        component_fields = {'LATE_FEE_PAYMENT': 'fee_amount', 'INTEREST_PAYMENT': 'interest_amount'}
+        results, transactions, installments, touched = ([], [], {}, {})
+        for payment in payments:
+            loan = loans.get(getattr(payment['loan'], 'pk', payment['loan']))
+            amount = payment['amount']
+            allocation_strategy = payment.get('allocation_strategy', 'AUTO')
+            if loan is None:
+                results.append(ValueError('Loan not found'))
+                continue
+            if amount <= Decimal('0'):
+                results.append(ValueError('Payment amount must be greater than zero'))
+                continue
+            if allocation_strategy not in cls.ALLOCATION_STRATEGIES:
+                results.append(ValueError(f'Unknown allocation strategy: {allocation_strategy}'))
+                continue
+            if amount > loan.remaining_balance:
+                results.append(ValueError(f'Payment exceeds remaining balance: {loan.remaining_balance}'))
+                continue
+            payment_date = payment['payment_date']
+            plan = cls.plan_allocation(schedules[loan.pk], amount, payment_date, allocation_strategy)
+            transaction_date = payment_date if isinstance(payment_date, datetime.datetime) else timezone.make_aware(datetime.datetime.combine(payment_date, datetime.time.min))
+            loan_transactions = []
+            for installment, entry_type, entry_amount in plan['entries']:
+                transaction_type = entry_type if entry_type in component_fields else 'PRINCIPAL_PAYMENT'
+                loan_transactions.append(LoanTransaction(loan=loan, installment=installment, transaction_type=transaction_type, payment_method=payment['payment_method'], reference_number=payment.get('reference_number', ''), amount=entry_amount, transaction_date=transaction_date, value_date=payment_date, notes=f"{labels[entry_type]}: {payment.get('notes', '')}", recorded_by=received_by, **{component_fields.get(transaction_type, 'principal_amount'): entry_amount}))
+            transactions.extend(loan_transactions)
+            installments.update({installment.pk: installment for installment in plan['installments']})
+            cls.apply_balance_deltas(loan, schedules[loan.pk], plan['principal'] + plan['interest'])
+            touched[loan.pk] = loan
+            results.append({'loan': loan, 'late_fees': plan['late_fees'], 'principal': plan['principal'], 'interest': plan['interest'], 'transactions': loan_transactions, 'remaining_amount': plan['remaining_amount'], 'total_paid': amount})
+        for loan_transaction, transaction_id in zip(transactions, LoanTransaction.generate_transaction_ids(len(transactions))):
+            loan_transaction.transaction_id = transaction_id
+        LoanTransaction.objects.bulk_create(transactions)
+        LoanRepaymentSchedule.objects.bulk_update(installments.values(), ['paid_principal', 'paid_interest', 'paid_late_fee', 'total_paid', 'status', 'payment_date'], batch_size=cls.UPDATE_BATCH_SIZE)
+        Loan.objects.bulk_update(touched.values(), cls.BALANCE_FIELDS, batch_size=cls.UPDATE_BATCH_SIZE)
+        ClientExposureService.refresh({loan.client_id for loan in touched.values()})
+        DashboardMetricsService.invalidate()
+        return results
+
+    @classmethod
+    def plan_allocation(cls, installments, amount: Decimal, payment_date, allocation_strategy: str='AUTO') -> dict:
+        plan = {'entries': [], 'installments': [], 'late_fees': Decimal('0'), 'principal': Decimal('0'), 'interest': Decimal('0'), 'remaining_amount': Decimal('0')}
+        changed = {}
+        overdue = [i for i in installments if i.status in cls.UNPAID_STATUSES and (i.status == 'OVERDUE' or i.due_date < payment_date)]
+        current = [i for i in installments if i.status in cls.UNPAID_STATUSES and i.status != 'OVERDUE' and i.due_date >= payment_date]
+        remaining = amount
+
+        def record(installment, entry_type, entry_amount):
+            plan['entries'].append((installment, entry_type, entry_amount))
+            if installment is not None:
+                changed[installment.pk] = installment
+        if allocation_strategy in ['AUTO', 'LATE_FEES_FIRST']:
+            fees = [(i, i.late_fee_amount - i.paid_late_fee) for i in overdue if i.late_fee_amount - i.paid_late_fee > 0]
+            total_fees = sum((fee for _, fee in fees), Decimal('0'))
+            if total_fees > 0:
+                fee_payment = min(total_fees, remaining)
+                shares = [min(fee, (fee_payment * fee / total_fees).quantize(cls.CENT, rounding=ROUND_DOWN)) for _, fee in fees]
+                leftover = fee_payment - sum(shares, Decimal('0'))
+                for index, (installment, fee) in enumerate(fees):
+                    top_up = min(leftover, fee - shares[index])
+                    shares[index] += top_up
+                    leftover -= top_up
+                    if shares[index] <= 0:
+                        continue
+                    installment.paid_late_fee += shares[index]
+                    installment.total_paid += shares[index]
+                    plan['late_fees'] += shares[index]
+                    remaining -= shares[index]
+                    record(installment, 'LATE_FEE_PAYMENT', shares[index])
+        if allocation_strategy in ['AUTO', 'PRINCIPAL_FIRST', 'INTEREST_FIRST']:
+            for installment in overdue + current:
+                if remaining <= 0:
+                    break
+                principal_due = installment.principal_amount - installment.paid_principal
+                interest_due = installment.interest_amount - installment.paid_interest
+                payment = min(principal_due + interest_due, remaining)
+                if payment <= 0:
+                    continue
+                if allocation_strategy == 'PRINCIPAL_FIRST':
+                    principal_payment = min(payment, principal_due)
+                elif allocation_strategy == 'INTEREST_FIRST':
+                    principal_payment = payment - min(payment, interest_due)
+                else:
+                    principal_payment = (payment * installment.principal_amount / installment.total_amount).quantize(cls.CENT, rounding=ROUND_HALF_UP) if installment.total_amount else payment
+                    principal_payment = max(min(principal_payment, principal_due), payment - interest_due)
+                interest_payment = payment - principal_payment
+                if principal_payment > 0:
+                    record(installment, 'PRINCIPAL_PAYMENT', principal_payment)
+                if interest_payment > 0:
+                    record(installment, 'INTEREST_PAYMENT', interest_payment)
+                installment.paid_principal += principal_payment
+                installment.paid_interest += interest_payment
+                installment.total_paid += payment
+                if principal_payment + interest_payment >= principal_due + interest_due:
+                    installment.status = 'PAID'
+                    installment.payment_date = payment_date
+                plan['principal'] += principal_payment
+                plan['interest'] += interest_payment
+                remaining -= payment
+        plan['remaining_amount'] = remaining
+        if remaining > 0:
+            next_installment = next((i for i in installments if i.status in cls.UNPAID_STATUSES), None)
+            if next_installment is not None:
+                next_installment.paid_principal += remaining
+                next_installment.total_paid += remaining
+                record(next_installment, 'ADVANCE_PAYMENT', remaining)
+            else:
+                record(None, 'PRINCIPAL_REDUCTION', remaining)
+            plan['principal'] += remaining
+        plan['installments'] = list(changed.values())
+        return plan
+
+    @classmethod
+    def apply_balance_deltas(cls, loan, installments, repaid: Decimal):
+        today = timezone.now().date()
+        unpaid = [i for i in installments if i.status != 'PAID']
+        arrears = [i for i in unpaid if i.due_date < today and i.total_amount - i.paid_principal - i.paid_interest > 0]
+        loan.total_paid_amount += repaid
+        loan.remaining_balance = max(Decimal('0'), loan.remaining_balance - repaid)
+        loan.overdue_amount = sum((i.total_amount - i.paid_principal - i.paid_interest for i in arrears), Decimal('0'))
+        loan.days_overdue = (today - arrears[0].due_date).days if arrears else 0
+        loan.next_payment_date = min((i.due_date for i in unpaid), default=None)
+        if loan.remaining_balance <= Decimal('0'):
+            loan.status = 'CLOSED'
+            loan.closed_at = timezone.now()
+        elif loan.overdue_amount > Decimal('0') and loan.status == 'ACTIVE':
+            loan.status = 'OVERDUE'
+        elif loan.overdue_amount <= Decimal('0') and loan.status == 'OVERDUE':
+            loan.status = 'ACTIVE'
 
     @classmethod
     def update_loan_balances(cls, loan):
-        pass
\ No newline at end of file
+        from loans.models import LoanRepaymentSchedule
+        repaid = loan.transactions.filter(transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT'], is_reversed=False).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        loan.remaining_balance = loan.total_repayment_amount
+        loan.total_paid_amount = Decimal('0')
+        cls.apply_balance_deltas(loan, list(LoanRepaymentSchedule.objects.filter(loan=loan).order_by('due_date', 'installment_number')), repaid)
+        loan.save(update_fields=cls.BALANCE_FIELDS)
@@ -0,0 +1,82 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Sum, Q, Max
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+class PortfolioSnapshotService:
+    GROUP_FIELDS = ['loan_product', 'loan_officer', 'status']
+    OPEN_STATUSES = ['ACTIVE', 'OVERDUE']
+    AGING_BUCKETS = [('par_1_30', 1, 30), ('par_31_60', 31, 60), ('par_61_90', 61, 90), ('par_over_90', 91, None)]
+    COLLECTION_TYPES = {'collected_principal': ['PRINCIPAL_PAYMENT', 'EARLY_REPAYMENT'], 'collected_interest': ['INTEREST_PAYMENT'], 'collected_fees': ['LATE_FEE_PAYMENT']}
+    AMOUNT_FIELDS = ['principal_amount', 'outstanding_balance', 'overdue_amount', 'par_1_30', 'par_31_60', 'par_61_90', 'par_over_90', 'disbursed_amount', 'due_amount', 'collected_principal', 'collected_interest', 'collected_fees', 'collected_amount']
+    COUNT_FIELDS = ['loan_count', 'disbursed_count']
+    BALANCE_FIELDS = ['loan_count', 'principal_amount', 'outstanding_balance', 'overdue_amount', 'par_1_30', 'par_31_60', 'par_61_90', 'par_over_90']
+
+    @classmethod
+    def aging_filter(cls, low, high):
+        return Q(status__in=cls.OPEN_STATUSES, days_overdue__gte=low) & (Q(days_overdue__lte=high) if high else Q())
+
+    @classmethod
+    @transaction.atomic
+    def build(cls, snapshot_date):
+        """Write the snapshot rows for a day. Balances and aging can only be read from the book as it stands now, so a past day is
+        refused unless it is the latest snapshot, which keeps its stored balances and gets its disbursements, dues and collections recounted."""
+        from loans.models import Loan, LoanRepaymentSchedule, LoanTransaction, PortfolioDailySnapshot
+        today = timezone.now().date()
+        if snapshot_date > today:
+            raise ValueError(f'Cannot snapshot {snapshot_date}, it is in the future')
+        existing = PortfolioDailySnapshot.objects.filter(snapshot_date=snapshot_date)
+        if snapshot_date < today:
+            latest = cls.latest_date()
+            if snapshot_date != latest:
+                raise ValueError(f'Cannot snapshot {snapshot_date}: balances are only known as of today, and only the latest snapshot ({latest or "none yet"}) can be refreshed')
+            rows = {(row.loan_product_id, row.loan_officer_id, row.status): {name: getattr(row, name) for name in cls.BALANCE_FIELDS} for row in existing}
+        else:
+            book = {'loan_count': Count('pk'), 'principal_amount': Sum('principal_amount'), 'outstanding_balance': Sum('remaining_balance', filter=Q(status__in=cls.OPEN_STATUSES)), 'overdue_amount': Sum('overdue_amount'), **{name: Sum('remaining_balance', filter=cls.aging_filter(low, high)) for name, low, high in cls.AGING_BUCKETS}}
+            rows = {(row.pop('loan_product'), row.pop('loan_officer'), row.pop('status')): row for row in Loan.objects.values(*cls.GROUP_FIELDS).annotate(**book).order_by()}
+        loan_group = ['loan__loan_product', 'loan__loan_officer', 'loan__status']
+        disbursements = Loan.objects.filter(disbursement_date=snapshot_date).values(*cls.GROUP_FIELDS).annotate(disbursed_count=Count('pk'), disbursed_amount=Sum('principal_amount')).order_by()
+        dues = LoanRepaymentSchedule.objects.filter(due_date=snapshot_date).values(*loan_group).annotate(due_amount=Sum('total_amount')).order_by()
+        collections = LoanTransaction.objects.filter(value_date=snapshot_date, transaction_type__in=sum(cls.COLLECTION_TYPES.values(), [])).values(*loan_group).annotate(collected_amount=Sum('amount'), **{name: Sum('amount', filter=Q(transaction_type__in=types)) for name, types in cls.COLLECTION_TYPES.items()}).order_by()
+        for delta in disbursements:
+            rows.setdefault((delta.pop('loan_product'), delta.pop('loan_officer'), delta.pop('status')), {}).update(delta)
+        for delta in [*dues, *collections]:
+            rows.setdefault((delta.pop('loan__loan_product'), delta.pop('loan__loan_officer'), delta.pop('loan__status')), {}).update(delta)
+        existing.delete()
+        return PortfolioDailySnapshot.objects.bulk_create([PortfolioDailySnapshot(snapshot_date=snapshot_date, loan_product_id=product, loan_officer_id=officer, status=status, **{field: row.get(field) or 0 for field in cls.AMOUNT_FIELDS + cls.COUNT_FIELDS}) for (product, officer, status), row in rows.items()])
+
+    @staticmethod
+    def snapshots(loan_product=None, loan_officer=None):
+        from loans.models import PortfolioDailySnapshot
+        queryset = PortfolioDailySnapshot.objects.all()
+        if loan_product:
+            queryset = queryset.filter(loan_product=loan_product)
+        if loan_officer:
+            queryset = queryset.filter(loan_officer=loan_officer)
+        return queryset
+
+    @classmethod
+    def latest_date(cls, on_or_before=None):
+        from loans.models import PortfolioDailySnapshot
+        queryset = PortfolioDailySnapshot.objects.all()
+        if on_or_before:
+            queryset = queryset.filter(snapshot_date__lte=on_or_before)
+        return queryset.aggregate(latest=Max('snapshot_date'))['latest']
+
+    @classmethod
+    def totals(cls, queryset):
+        totals = queryset.aggregate(**{field: Sum(field) for field in cls.AMOUNT_FIELDS + cls.COUNT_FIELDS})
+        return {field: value or (0 if field in cls.COUNT_FIELDS else Decimal('0')) for field, value in totals.items()}
+
+    @classmethod
+    def monthly_trend(cls, start_date, end_date, loan_product=None, loan_officer=None):
+        queryset = cls.snapshots(loan_product, loan_officer).filter(snapshot_date__range=[start_date, end_date])
+        flows = {row['month']: row for row in queryset.annotate(month=TruncMonth('snapshot_date')).values('month').annotate(disbursed_amount=Sum('disbursed_amount'), disbursed_count=Sum('disbursed_count'), due_amount=Sum('due_amount'), collected_amount=Sum('collected_amount')).order_by('month')}
+        month_ends = queryset.annotate(month=TruncMonth('snapshot_date')).values('month').annotate(last=Max('snapshot_date')).values('last')
+        balances = {row['snapshot_date'].replace(day=1): row for row in queryset.filter(snapshot_date__in=month_ends).values('snapshot_date').annotate(outstanding_balance=Sum('outstanding_balance'), par_over_30=Sum('par_31_60') + Sum('par_61_90') + Sum('par_over_90'), loan_count=Sum('loan_count', filter=Q(status__in=cls.OPEN_STATUSES))).order_by('snapshot_date')}
+        trend = []
+        for month, row in flows.items():
+            balance = balances.get(month, {})
+            trend.append({'month': month, 'disbursed_amount': row['disbursed_amount'] or Decimal('0'), 'disbursed_count': row['disbursed_count'] or 0, 'due_amount': row['due_amount'] or Decimal('0'), 'collected_amount': row['collected_amount'] or Decimal('0'), 'outstanding_balance': balance.get('outstanding_balance') or Decimal('0'), 'par_over_30': balance.get('par_over_30') or Decimal('0'), 'active_loans': balance.get('loan_count') or 0})
+        return trend
@@ -6,21 +6,23 @@ from datetime import datetime, timedelta
 class ReportService:
 
     @staticmethod
-    def generate_portfolio_report(start_date=None, end_date=None, loan_product=None):
+    def generate_portfolio_report(start_date=None, end_date=None, loan_product=None, loan_officer=None):
         from loans.models import Loan
-        queryset = Loan.objects.all()
-        if start_date:
-            queryset = queryset.filter(disbursement_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(disbursement_date__lte=end_date)
-        if loan_product:
-            queryset = queryset.filter(loan_product=loan_product)
-        stats = queryset.aggregate(total_loans=Count('id'), total_principal=Sum('principal_amount'), total_outstanding=Sum('outstanding_balance'), avg_loan_size=Avg('principal_amount'))
-        status_breakdown = {}
-        for status_code, status_name in Loan.LOAN_STATUS:
-            count = queryset.filter(status=status_code).count()
-            status_breakdown[status_name] = count
-        return {'total_loans': stats['total_loans'] or 0, 'total_principal': stats['total_principal'] or Decimal('0.00'), 'total_outstanding': stats['total_outstanding'] or Decimal('0.00'), 'average_loan_size': stats['avg_loan_size'] or Decimal('0.00'), 'status_breakdown': status_breakdown, 'loans': queryset}
+        from .portfolio_snapshot import PortfolioSnapshotService
+        end_date = end_date or timezone.now().date()
+        start_date = start_date or (end_date - timedelta(days=365)).replace(day=1)
+        as_of = PortfolioSnapshotService.latest_date(end_date)
+        rows = list(PortfolioSnapshotService.snapshots(loan_product, loan_officer).filter(snapshot_date=as_of).select_related('loan_product', 'loan_officer')) if as_of else []
+        statuses = dict(Loan.LOAN_STATUS)
+        status_breakdown = {label: 0 for label in statuses.values()}
+        totals = {field: Decimal('0.00') for field in PortfolioSnapshotService.AMOUNT_FIELDS}
+        total_loans = 0
+        for row in rows:
+            status_breakdown[statuses[row.status]] += row.loan_count
+            total_loans += row.loan_count
+            for field in totals:
+                totals[field] += getattr(row, field)
+        return {'as_of_date': as_of, 'total_loans': total_loans, 'total_principal': totals['principal_amount'], 'total_outstanding': totals['outstanding_balance'], 'average_loan_size': (totals['principal_amount'] / total_loans).quantize(Decimal('0.01')) if total_loans else Decimal('0.00'), 'status_breakdown': status_breakdown, 'totals': totals, 'rows': rows, 'trend': PortfolioSnapshotService.monthly_trend(start_date, end_date, loan_product, loan_officer)}
 
     @staticmethod
     def generate_disbursement_report(start_date, end_date, loan_product=None):
@@ -84,4 +86,14 @@ class ReportService:
         if end_date:
             payments = payments.filter(payment_date__lte=end_date)
         payment_stats = payments.aggregate(total_paid=Sum('amount'), payment_count=Count('id'))
-        return {'client': client, 'period_start': start_date, 'period_end': end_date, 'total_loans': loan_stats['loan_count'] or 0, 'total_borrowed': loan_stats['total_borrowed'] or Decimal('0.00'), 'total_outstanding': loan_stats['total_outstanding'] or Decimal('0.00'), 'total_paid': payment_stats['total_paid'] or Decimal('0.00'), 'number_of_payments': payment_stats['payment_count'] or 0, 'loans': loans, 'payments': payments.order_by('-payment_date')}
\ No newline at end of file
+        return {'client': client, 'period_start': start_date, 'period_end': end_date, 'total_loans': loan_stats['loan_count'] or 0, 'total_borrowed': loan_stats['total_borrowed'] or Decimal('0.00'), 'total_outstanding': loan_stats['total_outstanding'] or Decimal('0.00'), 'total_paid': payment_stats['total_paid'] or Decimal('0.00'), 'number_of_payments': payment_stats['payment_count'] or 0, 'loans': loans, 'payments': payments.order_by('-payment_date')}
+
+    @staticmethod
+    def generate_repayment_collection_report(start_date, end_date):
+        from .collections import CollectionsAnalyticsService
+        analytics = CollectionsAnalyticsService.analytics(start_date, end_date)
+        by_officer = {}
+        for row in analytics['by_officer']:
+            name = f"{row['recorded_by__first_name']} {row['recorded_by__last_name']}".strip() or row['recorded_by__username']
+            by_officer[name] = by_officer.get(name, Decimal('0')) + row['total']
+        return {'period': analytics['period'], 'summary': {'total_collected': analytics['summary']['total_collected'], 'total_transactions': analytics['summary']['total_transactions'], 'average_collection': analytics['summary']['average_daily']}, 'by_method': {row['payment_method']: row['total'] for row in analytics['by_method']}, 'by_day': {row['date'].isoformat(): float(row['total']) for row in analytics['by_day']}, 'by_week': {row['week'].isoformat(): float(row['total']) for row in analytics['by_week']}, 'by_officer': by_officer, 'generated_at': timezone.now()}
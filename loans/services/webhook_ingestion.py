@@ -0,0 +1,75 @@
+from decimal import Decimal, InvalidOperation
+from django.db import transaction, DatabaseError, IntegrityError
+from django.utils import timezone
+from .payment_processing import PaymentProcessingService
+
+class PaymentWebhookService:
+    DEFAULT_BATCH_SIZE = 200
+    PAYABLE_STATUSES = ['ACTIVE', 'OVERDUE']
+
+    @classmethod
+    def record(cls, payload, provider='MOBILE_MONEY'):
+        from loans.models import LoanTransaction, PaymentWebhook
+        reference = str(payload.get('reference') or '').strip()
+        if not reference:
+            raise ValueError('reference is required')
+        try:
+            amount = Decimal(str(payload.get('amount', '0')))
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount {payload.get('amount')!r}")
+        if not amount.is_finite() or amount <= 0:
+            raise ValueError(f"Invalid amount {payload.get('amount')!r}")
+        if amount != amount.quantize(PaymentProcessingService.CENT):
+            raise ValueError(f"Invalid amount {payload.get('amount')!r}, more than 2 decimal places")
+        payment_method = str(payload.get('payment_method') or 'MOBILE_MONEY').upper()
+        if payment_method not in dict(LoanTransaction.PAYMENT_METHODS):
+            raise ValueError(f'Unknown payment method {payment_method!r}')
+        webhook = PaymentWebhook(provider=str(payload.get('provider') or provider)[:30], reference=reference[:100], loan_number=str(payload.get('loan_number') or '')[:50], amount=amount.quantize(PaymentProcessingService.CENT), payment_method=payment_method, payload=payload)
+        try:
+            with transaction.atomic():
+                webhook.save()
+        except IntegrityError:
+            return (PaymentWebhook.objects.get(provider=webhook.provider, reference=webhook.reference), False)
+        return (webhook, True)
+
+    @classmethod
+    @transaction.atomic
+    def process_batch(cls, recorded_by, batch_size=None):
+        from loans.models import Loan, PaymentWebhook
+        webhooks = list(PaymentWebhook.objects.select_for_update(skip_locked=True).filter(status='RECEIVED').order_by('pk')[:batch_size or cls.DEFAULT_BATCH_SIZE])
+        if not webhooks:
+            return {'processed': 0, 'failed': 0}
+        loans = {loan.loan_number: loan for loan in Loan.objects.filter(loan_number__in={webhook.loan_number for webhook in webhooks}).only('pk', 'loan_number', 'status')}
+        payable, payments = ([], [])
+        for webhook in webhooks:
+            webhook.attempts += 1
+            webhook.processed_at = timezone.now()
+            loan = loans.get(webhook.loan_number)
+            if loan is None:
+                webhook.status, webhook.error = ('FAILED', f'Loan {webhook.loan_number} not found')
+            elif loan.status not in cls.PAYABLE_STATUSES:
+                webhook.status, webhook.error, webhook.loan = ('FAILED', f'Loan {loan.loan_number} is {loan.status}', loan)
+            else:
+                webhook.loan = loan
+                payable.append(webhook)
+                payments.append({'loan': loan.pk, 'amount': webhook.amount, 'payment_date': timezone.localdate(webhook.received_at), 'payment_method': webhook.payment_method, 'reference_number': webhook.reference, 'notes': f'Auto payment via webhook: {webhook.reference}'})
+        try:
+            with transaction.atomic():
+                results = PaymentProcessingService.process_payments(payments, recorded_by)
+        except DatabaseError:
+            # One bad row must not hold up the rest: retry one savepoint per webhook and fail only the ones that still error.
+            results = []
+            for payment in payments:
+                try:
+                    with transaction.atomic():
+                        results.extend(PaymentProcessingService.process_payments([payment], recorded_by))
+                except DatabaseError as error:
+                    results.append(error)
+        for webhook, result in zip(payable, results):
+            webhook.status, webhook.error = ('FAILED', str(result)) if isinstance(result, Exception) else ('PROCESSED', '')
+        PaymentWebhook.objects.bulk_update(webhooks, ['status', 'error', 'loan', 'attempts', 'processed_at'])
+        return {'processed': sum((webhook.status == 'PROCESSED' for webhook in webhooks)), 'failed': sum((webhook.status == 'FAILED' for webhook in webhooks))}
+
+    @classmethod
+    def requeue(cls, queryset):
+        return queryset.filter(status='FAILED').update(status='RECEIVED', error='')
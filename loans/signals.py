@@ -0,0 +1,28 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.db.models import DEFERRED
+from django.dispatch import receiver
+from .models import Loan, LoanApplication, LoanTransaction
+from .services import ClientExposureService, DashboardMetricsService
+
+@receiver([post_save, post_delete], sender=Loan)
+@receiver([post_save, post_delete], sender=LoanApplication)
+@receiver([post_save, post_delete], sender=LoanTransaction)
+def invalidate_dashboard_metrics(sender, **kwargs):
+    DashboardMetricsService.invalidate()
+
+@receiver(post_init, sender=Loan)
+def remember_exposure_state(sender, instance, **kwargs):
+    instance._exposure_state = ClientExposureService.loan_state(instance)
+
+@receiver(post_save, sender=Loan)
+def refresh_client_exposure(sender, instance, created=False, update_fields=None, **kwargs):
+    previous, current = instance._exposure_state, ClientExposureService.loan_state(instance)
+    if not created and (previous == current or update_fields is not None and not set(update_fields) & set(ClientExposureService.LOAN_FIELDS)):
+        return
+    instance._exposure_state = current
+    # LOAN_FIELDS leads with the client, so a loan moved to another client refreshes both rows.
+    ClientExposureService.refresh([client_id for client_id in (instance.client_id, previous[0]) if client_id is not DEFERRED])
+
+@receiver(post_delete, sender=Loan)
+def refresh_deleted_loan_exposure(sender, instance, **kwargs):
+    ClientExposureService.refresh([instance.client_id])
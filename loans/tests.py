@@ -1 +1,608 @@
-from django.test import TestCase
\ No newline at end of file
+import datetime
+import io
+import json
+from decimal import Decimal, ROUND_HALF_UP
+from unittest import mock
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, DatabaseError
+from django.test import TestCase, SimpleTestCase
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from client_accounts.models import ClientAccount
+from core.models import JobLock
+from .models import InterestCalculationService, LoanProduct, LoanApplication, Loan, LoanRepaymentSchedule, LoanTransaction, LoanPayment, DisbursementBatch, PaymentWebhook, PortfolioDailySnapshot, ClientExposure
+from .services import CreditScoringService, PaymentProcessingService, BulkPaymentImportService, BulkDisbursementService, DashboardMetricsService, PortfolioSnapshotService, LoanAgingService, CollectionsAnalyticsService, ReportService, ClientExposureService, EndOfDayService, AmortizationService, BatchAmortizationService
+
+def legacy_reducing_interest(principal, annual_rate, term_days, method):
+    daily_rate = annual_rate / Decimal('100') / (Decimal('365') if method == 'ACTUAL_365' else Decimal('360'))
+    interest = Decimal('0')
+    remaining = principal
+    for day in range(term_days):
+        interest += remaining * daily_rate
+        remaining -= principal / Decimal(str(term_days))
+    return interest.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+class ReducingInterestRegressionTests(SimpleTestCase):
+    METHODS = ['ACTUAL_365', 'ACTUAL_360', '30_360']
+    TABLE = [('1000000.00', '24.00', 365, ['120328.77', '122000.00', '122000.00']), ('500000.00', '36.50', 30, ['7750.00', '7857.64', '7857.64']), ('2500000.00', '18.00', 90, ['56095.89', '56875.00', '56875.00']), ('750000.50', '30.00', 180, ['55787.71', '56562.54', '56562.54']), ('1000.00', '36.50', 9, ['5.00', '5.07', '5.07']), ('100000.00', '12.00', 1, ['32.88', '33.33', '33.33']), ('100000.00', '12.00', 0, ['0.00', '0.00', '0.00'])]
+
+    def test_regression_table(self):
+        for principal, rate, term_days, expected in self.TABLE:
+            for method, value in zip(self.METHODS, expected):
+                for interest_type in ['REDUCING_MONTHLY', 'REDUCING_DAILY']:
+                    with self.subTest(principal=principal, rate=rate, term_days=term_days, method=method, interest_type=interest_type):
+                        self.assertEqual(InterestCalculationService.calculate_interest(Decimal(principal), Decimal(rate), term_days, method=method, interest_type=interest_type), Decimal(value))
+
+    def test_matches_daily_loop(self):
+        for principal in [Decimal('0.01'), Decimal('1.01'), Decimal('999.99'), Decimal('12345.67'), Decimal('1000000'), Decimal('987654321.09')]:
+            for rate in [Decimal('0'), Decimal('1.00'), Decimal('24.00'), Decimal('36.50'), Decimal('59.99')]:
+                for term_days in [1, 2, 7, 30, 31, 90, 180, 365, 366, 730]:
+                    for method in self.METHODS:
+                        with self.subTest(principal=principal, rate=rate, term_days=term_days, method=method):
+                            self.assertEqual(InterestCalculationService.calculate_interest(principal, rate, term_days, method=method, interest_type='REDUCING_DAILY'), legacy_reducing_interest(principal, rate, term_days, method))
+
+class LoanFixtureMixin:
+
+    @classmethod
+    def create_loan(cls, suffix, installments=12, overdue=0, principal=Decimal('1000.00'), interest=Decimal('100.00')):
+        today = datetime.date.today()
+        application = LoanApplication.objects.create(application_id=f'APP-{suffix}', application_number=f'AN-{suffix}', client=cls.client_account, loan_product=cls.product, requested_amount=principal * installments, requested_term_days=installments * 30, purpose='Stock', loan_officer=cls.officer, created_by=cls.officer)
+        loan = Loan.objects.create(application=application, loan_number=f'LN-{suffix}', client=cls.client_account, loan_product=cls.product, principal_amount=principal * installments, interest_rate=Decimal('24.00'), term_days=installments * 30, disbursement_date=today - datetime.timedelta(days=30 * (overdue + 1)), total_repayment_amount=(principal + interest) * installments, remaining_balance=(principal + interest) * installments, status='OVERDUE' if overdue else 'ACTIVE', loan_officer=cls.officer)
+        LoanRepaymentSchedule.objects.bulk_create([LoanRepaymentSchedule(loan=loan, installment_number=n, due_date=today + datetime.timedelta(days=30 * (n - overdue)), principal_amount=principal, interest_amount=interest, total_amount=principal + interest, status='OVERDUE' if n <= overdue else 'PENDING', late_fee_amount=Decimal('55.00') if n <= overdue else Decimal('0')) for n in range(1, installments + 1)])
+        return loan
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.officer = User.objects.create_user('officer', password='secret', is_staff=True)
+        cls.client_account = ClientAccount.objects.create(account_type='SINGLE', person1_first_name='Jane', person1_last_name='Doe', person1_contact='0700000000', person1_address='Kampala', person1_area_code='256', person1_next_of_kin='John', person1_nin='CM000000000001', person1_gender='F', business_location='Kampala', business_sector='Retail', loan_officer=cls.officer, created_by=cls.officer)
+        cls.product = LoanProduct.objects.create(name='Business', code='BIZ', annual_interest_rate=Decimal('24.00'), created_by=cls.officer)
+
+class PaymentProcessingTests(LoanFixtureMixin, TestCase):
+
+    def pay(self, loan, amount):
+        with CaptureQueriesContext(connection) as queries:
+            allocation = PaymentProcessingService.process_payment(loan, amount, datetime.date.today(), 'CASH', self.officer, notes='Test')
+        return (allocation, len(queries))
+
+    def test_query_count_independent_of_installments_covered(self):
+        LoanTransaction.generate_transaction_ids()
+        _, single = self.pay(self.create_loan('A', overdue=10), Decimal('1155.00'))
+        allocation, catch_up = self.pay(self.create_loan('B', overdue=10), Decimal('11550.00'))
+        self.assertEqual(single, catch_up)
+        self.assertEqual(allocation['late_fees'], Decimal('550.00'))
+        self.assertEqual(allocation['principal'] + allocation['interest'], Decimal('11000.00'))
+
+    def test_installment_updates_are_batched_statements(self):
+        loan = self.create_loan('CB', overdue=10)
+        with mock.patch.object(PaymentProcessingService, 'UPDATE_BATCH_SIZE', 4), CaptureQueriesContext(connection) as queries:
+            PaymentProcessingService.process_payment(loan, Decimal('11550.00'), datetime.date.today(), 'CASH', self.officer)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "loans_loanrepaymentschedule"')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(loan.repayment_schedule.filter(status='PAID').count(), 10)
+
+    def test_catch_up_payment_settles_overdue_installments(self):
+        loan = self.create_loan('C', overdue=10)
+        self.pay(loan, Decimal('11550.00'))
+        loan.refresh_from_db()
+        self.assertEqual(loan.repayment_schedule.filter(status='PAID').count(), 10)
+        self.assertEqual(loan.transactions.count(), 30)
+        self.assertEqual(loan.remaining_balance, Decimal('2200.00'))
+        self.assertEqual(loan.total_paid_amount, Decimal('11000.00'))
+        self.assertEqual(loan.overdue_amount, Decimal('0'))
+        self.assertEqual(loan.status, 'ACTIVE')
+        self.assertEqual(loan.next_payment_date, loan.repayment_schedule.get(installment_number=11).due_date)
+
+    def test_partial_payment_splits_principal_and_interest_pro_rata(self):
+        loan = self.create_loan('D', overdue=1)
+        allocation, _ = self.pay(loan, Decimal('605.00'))
+        installment = loan.repayment_schedule.get(installment_number=1)
+        self.assertEqual((allocation['late_fees'], allocation['principal'], allocation['interest']), (Decimal('55.00'), Decimal('500.00'), Decimal('50.00')))
+        self.assertEqual((installment.paid_principal, installment.paid_interest, installment.total_paid, installment.status), (Decimal('500.00'), Decimal('50.00'), Decimal('605.00'), 'OVERDUE'))
+
+    def test_rejects_overpayment(self):
+        loan = self.create_loan('E', installments=1)
+        with self.assertRaises(ValueError):
+            PaymentProcessingService.process_payment(loan, Decimal('1100.01'), datetime.date.today(), 'CASH', self.officer)
+
+class BulkPaymentImportTests(LoanFixtureMixin, TestCase):
+
+    def csv(self, *rows):
+        return io.BytesIO('\n'.join(['loan_number,amount,transaction_reference'] + [','.join(row) for row in rows]).encode())
+
+    def test_dry_run_reports_row_errors_without_writing(self):
+        self.create_loan('F', installments=1)
+        report = BulkPaymentImportService.import_csv(self.csv(('LN-F', '600'), ('LN-F', '600'), ('LN-X', '10'), ('LN-F', 'abc')), self.officer)
+        self.assertEqual((report['rows'], report['valid'], report['total_amount']), (4, 1, Decimal('600')))
+        self.assertEqual([(error['row'], error['loan']) for error in report['errors']], [(3, 'LN-F'), (4, 'LN-X'), (5, 'LN-F')])
+        self.assertIn('exceeds remaining balance 500', report['errors'][0]['error'])
+        self.assertFalse(LoanTransaction.objects.exists())
+
+    def test_apply_posts_payments_with_queries_per_chunk(self):
+        LoanTransaction.generate_transaction_ids()
+        loans = [self.create_loan(f'G{n}', overdue=1) for n in range(3)]
+        rows = [(loan.loan_number, '605', f'R{n}') for n, loan in enumerate(loans)]
+        with CaptureQueriesContext(connection) as small:
+            BulkPaymentImportService.import_csv(self.csv(*rows[:1]), self.officer, dry_run=False)
+        with CaptureQueriesContext(connection) as large:
+            report = BulkPaymentImportService.import_csv(self.csv(*rows[1:] * 2), self.officer, dry_run=False)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual((report['applied'], report['total_amount'], report['errors']), (4, Decimal('2420'), []))
+        self.assertEqual(LoanPayment.objects.count(), 5)
+        loans[1].refresh_from_db()
+        self.assertEqual((loans[1].total_paid_amount, loans[1].remaining_balance), (Decimal('1155.00'), Decimal('12045.00')))
+
+    def test_apply_refuses_the_file_when_any_chunk_fails_validation(self):
+        loans = [self.create_loan(f'H{n}', overdue=1) for n in range(3)]
+        report = BulkPaymentImportService.import_csv(self.csv(('LN-H0', '605'), ('LN-H1', '605'), ('LN-H2', 'abc')), self.officer, dry_run=False, chunk_size=1)
+        self.assertEqual((report['refused'], report['applied'], report['valid']), (True, 0, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [4])
+        self.assertFalse(LoanTransaction.objects.exists())
+        loans[0].refresh_from_db()
+        self.assertEqual(loans[0].remaining_balance, Decimal('13200.00'))
+
+    def test_view_keeps_a_capped_error_report_in_the_session(self):
+        self.client.force_login(self.officer)
+        upload = self.csv(*[('LN-X', '10')] * 5).getvalue()
+        with mock.patch.object(BulkPaymentImportService, 'ERROR_REPORT_LIMIT', 2):
+            self.client.post(reverse('loans:process_bulk_payments'), {'csv_file': SimpleUploadedFile('payments.csv', upload, content_type='text/csv')})
+        self.assertEqual(len(self.client.session['bulk_payment_errors']), 2)
+        response = self.client.get(reverse('loans:download_bulk_payment_errors'))
+        self.assertEqual(len(response.content.decode().splitlines()), 3)
+
+class BulkDisbursementTests(LoanFixtureMixin, TestCase):
+
+    def approve(self, count, prefix):
+        return [LoanApplication.objects.create(application_number=f'AN-{prefix}{n}', client=self.client_account, loan_product=self.product, requested_amount=Decimal('6000.00'), requested_term_days=180, purpose='Stock', loan_officer=self.officer, created_by=self.officer, status='APPROVED', approved_amount=Decimal('6000.00'), approved_term_days=180, approved_interest_rate=Decimal('24.00'), processing_fee_amount=Decimal('60.00'), net_disbursement_amount=Decimal('5940.00'), total_interest_amount=Decimal('720.00'), total_repayment_amount=Decimal('6720.00')).pk for n in range(count)]
+
+    def disburse(self, application_ids, **options):
+        with CaptureQueriesContext(connection) as queries:
+            report = BulkDisbursementService.disburse_applications(application_ids, self.officer, datetime.date.today(), 'CASH', **options)
+        return (report, len(queries))
+
+    def test_query_count_independent_of_batch_size(self):
+        LoanTransaction.generate_transaction_ids()
+        Loan.generate_loan_numbers()
+        DisbursementBatch.objects.create(disbursement_date=datetime.date.today(), payment_method='CASH', created_by=self.officer)
+        _, small = self.disburse(self.approve(1, 'S'))
+        report, large = self.disburse(self.approve(6, 'L'))
+        self.assertEqual(small, large)
+        self.assertEqual((report['disbursed'], report['total_disbursed'], report['batch'].status), (6, Decimal('35640.00'), 'COMPLETED'))
+        loan = report['batch'].loans.order_by('pk').first()
+        self.assertEqual((loan.status, loan.first_payment_date, loan.maturity_date), ('ACTIVE', loan.repayment_schedule.get(installment_number=1).due_date, datetime.date.today() + datetime.timedelta(days=180)))
+        self.assertEqual(loan.transactions.get().reference_number, f'{loan.loan_number}')
+        self.assertEqual(LoanApplication.objects.filter(status='DISBURSED').count(), 7)
+
+    def test_failed_chunk_rolls_back_alone(self):
+        application_ids = self.approve(4, 'C')
+        create_transactions = BulkDisbursementService.create_transactions
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise DatabaseError('connection lost')
+            return create_transactions(*args, **kwargs)
+        with mock.patch.object(BulkDisbursementService, 'create_transactions', side_effect=flaky):
+            report, _ = self.disburse(application_ids + application_ids[:1], chunk_size=2)
+        self.assertEqual((report['disbursed'], report['batch'].status, report['batch'].failed_count), (2, 'PARTIAL', 2))
+        self.assertIn('Items 3-4 were not disbursed: connection lost', report['errors'])
+        self.assertEqual(Loan.objects.count(), 2)
+        self.assertEqual(LoanRepaymentSchedule.objects.count(), 2 * 6)
+        self.assertEqual(LoanApplication.objects.filter(status='APPROVED').count(), 2)
+
+    def test_unexpected_error_still_closes_the_batch(self):
+        application_ids = self.approve(4, 'U')
+        create_transactions = BulkDisbursementService.create_transactions
+        calls = []
+
+        def broken(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise KeyError('reference')
+            return create_transactions(*args, **kwargs)
+        with mock.patch.object(BulkDisbursementService, 'create_transactions', side_effect=broken), self.assertRaises(KeyError):
+            self.disburse(application_ids, chunk_size=2)
+        batch = DisbursementBatch.objects.get()
+        self.assertEqual((batch.status, batch.disbursed_count, batch.failed_count, batch.total_principal), ('PARTIAL', 2, 2, Decimal('12000.00')))
+        self.assertEqual(batch.errors, ["Items 3-4 were not disbursed: run aborted (KeyError: 'reference')"])
+        self.assertEqual(Loan.objects.filter(disbursement_batch=batch).count(), 2)
+
+class PaymentWebhookTests(LoanFixtureMixin, TestCase):
+
+    def deliver(self, reference, loan_number='LN-W', amount='605'):
+        return self.client.post(reverse('loans:api_webhook_payment'), json.dumps({'reference': reference, 'loan_number': loan_number, 'amount': amount}), content_type='application/json')
+
+    def drain(self):
+        call_command('process_webhooks', recorded_by='officer', stdout=io.StringIO())
+
+    def test_replayed_delivery_is_allocated_once(self):
+        loan = self.create_loan('W', overdue=1)
+        self.assertEqual(self.deliver('MM-1').status_code, 202)
+        self.assertEqual(self.deliver('MM-1').status_code, 200)
+        self.assertFalse(loan.transactions.exists())
+        self.drain()
+        self.assertEqual(self.deliver('MM-1').json()['status'], 'PROCESSED')
+        self.drain()
+        webhook = PaymentWebhook.objects.get()
+        self.assertEqual((webhook.status, webhook.loan_id, webhook.attempts), ('PROCESSED', loan.pk, 1))
+        self.assertEqual(loan.transactions.count(), 3)
+        self.assertEqual(set(loan.transactions.values_list('reference_number', flat=True)), {'MM-1'})
+        loan.refresh_from_db()
+        self.assertEqual(loan.remaining_balance, Decimal('12650.00'))
+
+    def test_invalid_and_unknown_deliveries(self):
+        self.assertEqual(self.deliver('', amount='5').status_code, 400)
+        self.assertEqual(self.deliver('MM-2', amount='abc').status_code, 400)
+        self.assertEqual(self.deliver('MM-3', loan_number='LN-NONE').status_code, 202)
+        self.drain()
+        self.assertEqual(PaymentWebhook.objects.values_list('status', 'error').get(), ('FAILED', 'Loan LN-NONE not found'))
+
+    def test_amounts_with_more_than_two_decimal_places_are_rejected(self):
+        response = self.deliver('MM-4', amount='605.005')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentWebhook.objects.exists())
+
+    def test_database_error_fails_only_the_webhook_that_raised_it(self):
+        good, bad = self.create_loan('W1', overdue=1), self.create_loan('W2', overdue=1)
+        self.deliver('MM-5', loan_number='LN-W1')
+        self.deliver('MM-6', loan_number='LN-W2')
+        process_payments = PaymentProcessingService.process_payments
+
+        def failing(payments, received_by):
+            if any(payment['loan'] == bad.pk for payment in payments):
+                LoanTransaction.objects.create(loan=bad, transaction_type='PRINCIPAL_PAYMENT', amount=Decimal('1'), recorded_by=received_by)
+                raise DatabaseError('deadlock detected')
+            return process_payments(payments, received_by)
+        with mock.patch.object(PaymentProcessingService, 'process_payments', side_effect=failing):
+            self.drain()
+        self.assertEqual(dict(PaymentWebhook.objects.values_list('reference', 'status')), {'MM-5': 'PROCESSED', 'MM-6': 'FAILED'})
+        self.assertEqual(PaymentWebhook.objects.values_list('error', 'attempts').get(reference='MM-6'), ('deadlock detected', 1))
+        self.assertEqual((good.transactions.count(), bad.transactions.count()), (3, 0))
+
+class LoanApplicationPagesTests(LoanFixtureMixin, TestCase):
+
+    def test_detail_and_review_pages_assess_from_savings_and_exposure(self):
+        ClientAccount.objects.filter(pk=self.client_account.pk).update(savings_balance=Decimal('200000.00'))
+        self.create_loan('AP')
+        application = LoanApplication.objects.create(application_number='AN-REVIEW', client=self.client_account, loan_product=self.product, requested_amount=Decimal('650000.00'), requested_term_days=180, purpose='Stock', loan_officer=self.officer, created_by=self.officer, status='SUBMITTED')
+        self.client.force_login(self.officer)
+        for name in ['loans:loan_application_detail', 'loans:loan_application_review']:
+            response = self.client.get(reverse(name, args=[application.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.context['max_loan_by_savings'], response.context['total_existing_debt'], response.context['available_amount'], response.context['recommended_amount']), (Decimal('600000.00'), Decimal('13200.00'), Decimal('586800.00'), Decimal('586000')))
+
+class BatchAmortizationTests(LoanFixtureMixin, TestCase):
+
+    def test_schedules_match_the_per_loan_path_to_the_cent(self):
+        products = [LoanProduct(name=f'{kind} {method}', interest_type=kind, interest_calculation_method=method) for kind, method in [('FLAT', 'ACTUAL_365'), ('FLAT', '30_360'), ('REDUCING_MONTHLY', 'ACTUAL_365')]]
+        start = datetime.date(2026, 1, 31)
+        loans = [Loan(loan_number=f'P{n}', loan_product=product, principal_amount=principal, interest_rate=rate, term_days=term, disbursement_date=start) for n, (product, principal, rate, term) in enumerate((product, principal, rate, term) for product in products for principal in [Decimal('1000.00'), Decimal('123456.78'), Decimal('1000.005')] for rate in [Decimal('0'), Decimal('5.00'), Decimal('24.37')] for term in [7, 30, 31, 90, 91, 365])]
+        expected = [AmortizationService.schedule_rows(loan) for loan in loans]
+        self.assertEqual(BatchAmortizationService.compute_schedules(loans), expected)
+        self.assertEqual([[BatchAmortizationService.decimal_row(row) for row in rows] for rows in BatchAmortizationService.compute_cents(loans)], expected)
+        thirty_days = {loan.loan_product.interest_type: rows for loan, rows in zip(loans, expected) if loan.term_days == 30 and loan.interest_rate == 0 and loan.principal_amount == Decimal('1000.00')}
+        self.assertEqual([row['due_date'] for row in thirty_days['FLAT']], [start + datetime.timedelta(days=7 * n) for n in range(1, 5)])
+        self.assertEqual([(row['due_date'], row['principal_amount'], row['interest_amount']) for row in thirty_days['REDUCING_MONTHLY']], [(datetime.date(2026, 2, 28), Decimal('1000.00'), Decimal('0.00'))])
+
+    def test_create_repayment_schedules_writes_rows_and_payment_dates(self):
+        loans = [self.create_loan('BA1', installments=3, overdue=2), self.create_loan('BA2', installments=3)]
+        LoanRepaymentSchedule.objects.filter(loan__in=loans).delete()
+        Loan.objects.filter(pk__in=[loan.pk for loan in loans]).update(status='ACTIVE')
+        loans = list(Loan.objects.filter(pk__in=[loan.pk for loan in loans]).order_by('loan_number'))
+        BatchAmortizationService.create_repayment_schedules(loans)
+        today = datetime.date.today()
+        for loan in Loan.objects.filter(pk__in=[loan.pk for loan in loans]).order_by('loan_number'):
+            expected = AmortizationService.schedule_rows(loan)
+            self.assertEqual([{field: getattr(entry, field) for field in ('installment_number', 'due_date', 'principal_amount', 'interest_amount', 'total_amount')} for entry in loan.repayment_schedule.order_by('installment_number')], expected)
+            first_due = expected[0]['due_date']
+            self.assertEqual((loan.first_payment_date, loan.next_payment_date, loan.maturity_date), (first_due, first_due, loan.disbursement_date + datetime.timedelta(days=loan.term_days)))
+            self.assertEqual((loan.status, loan.days_overdue), ('OVERDUE', (today - first_due).days) if today > first_due else ('ACTIVE', 0))
+        self.assertEqual(Loan.objects.filter(loan_number='LN-BA1').values_list('status', flat=True).get(), 'OVERDUE')
+        self.assertEqual(ClientExposure.objects.get(client=self.client_account).active_loan_count, 2)
+
+class EndOfDayTests(LoanFixtureMixin, TestCase):
+
+    def run_eod(self, days):
+        out = io.StringIO()
+        call_command('end_of_day', date=(datetime.date.today() + datetime.timedelta(days=days)).isoformat(), recorded_by='officer', stdout=out)
+        return out.getvalue()
+
+    def statuses(self, loan):
+        return list(loan.repayment_schedule.order_by('installment_number').values_list('status', flat=True))
+
+    def test_installments_go_due_then_overdue_once_the_grace_period_has_passed(self):
+        loan = self.create_loan('EOD1', installments=3)
+        self.run_eod(29)
+        self.assertEqual(self.statuses(loan), ['PENDING', 'PENDING', 'PENDING'])
+        self.run_eod(30)
+        self.assertEqual(self.statuses(loan), ['DUE', 'PENDING', 'PENDING'])
+        # The grace period is 5 days: day 35 is its last day and the installment only turns overdue on day 36.
+        self.run_eod(35)
+        self.assertEqual(self.statuses(loan), ['DUE', 'PENDING', 'PENDING'])
+        self.run_eod(36)
+        self.assertEqual(self.statuses(loan), ['OVERDUE', 'PENDING', 'PENDING'])
+        loan.refresh_from_db()
+        self.assertEqual((loan.status, loan.overdue_amount, loan.days_overdue), ('OVERDUE', Decimal('1100.00'), 6))
+
+    def test_arrears_are_cleared_once_nothing_is_past_due(self):
+        loan = self.create_loan('EOD2', installments=2)
+        Loan.objects.filter(pk=loan.pk).update(status='OVERDUE', overdue_amount=Decimal('500.00'), days_overdue=3)
+        self.assertEqual(EndOfDayService.update_loan_arrears([loan.pk], datetime.date.today()), 1)
+        loan.refresh_from_db()
+        self.assertEqual((loan.status, loan.overdue_amount, loan.days_overdue), ('ACTIVE', Decimal('0.00'), 0))
+        self.assertEqual(EndOfDayService.update_loan_arrears([loan.pk], datetime.date.today()), 0)
+
+    def test_late_fees_post_once_per_installment_across_reruns(self):
+        loan = self.create_loan('EOD3', installments=3)
+        fees = LoanTransaction.objects.filter(loan=loan, transaction_type='PENALTY_CHARGE')
+        self.run_eod(36)
+        self.run_eod(36)
+        self.assertEqual(list(fees.values_list('installment__installment_number', 'amount')), [(1, Decimal('55.00'))])
+        self.run_eod(66)
+        self.assertEqual(sorted(fees.values_list('installment__installment_number', 'amount')), [(1, Decimal('55.00')), (2, Decimal('55.00'))])
+        self.assertEqual(list(loan.repayment_schedule.order_by('installment_number').values_list('late_fee_applied', 'late_fee_amount')), [(True, Decimal('55.00')), (True, Decimal('55.00')), (False, Decimal('0.00'))])
+        loan.refresh_from_db()
+        self.assertEqual(loan.late_fee_amount, Decimal('110.00'))
+
+    def test_a_held_lock_skips_the_run(self):
+        loan = self.create_loan('EOD4', installments=1)
+        JobLock.objects.create(name='end-of-day', holder='elsewhere', locked_until=timezone.now() + datetime.timedelta(hours=1))
+        self.assertIn('running elsewhere, skipping', self.run_eod(36))
+        self.assertEqual(self.statuses(loan), ['PENDING'])
+        self.assertFalse(LoanTransaction.objects.filter(loan=loan).exists())
+
+class DashboardMetricsTests(LoanFixtureMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_metrics_are_cached_until_a_payment_is_posted(self):
+        loan = self.create_loan('D', overdue=1)
+        self.create_loan('E')
+        with self.assertNumQueries(3):
+            metrics = DashboardMetricsService.metrics()
+        self.assertEqual((metrics['total_loans'], metrics['active_loans'], metrics['overdue_loans'], metrics['total_portfolio'], metrics['payments_today']), (2, 1, 1, Decimal('26400.00'), Decimal('0')))
+        with self.assertNumQueries(0):
+            DashboardMetricsService.metrics()
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentProcessingService.process_payments([{'loan': loan.pk, 'amount': Decimal('500.00'), 'payment_date': datetime.date.today(), 'payment_method': 'CASH', 'notes': '', 'allocation_strategy': 'AUTO', 'reference_number': 'R-1'}], self.officer)
+        self.assertEqual(DashboardMetricsService.metrics()['payments_today'], Decimal('445.00'))
+
+    def test_summary_api_and_dashboard_share_the_metrics(self):
+        self.create_loan('F', overdue=1)
+        self.client.force_login(self.officer)
+        DashboardMetricsService.metrics()
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse('loans:dashboard_summary_api')).json()
+        self.assertEqual((data['overdue_loans'], data['total_portfolio']), (1, 13200.0))
+        self.assertFalse([query for query in queries if 'SUM(' in query['sql'] or 'COUNT(' in query['sql']])
+
+class PortfolioSnapshotTests(LoanFixtureMixin, TestCase):
+
+    def test_build_rolls_up_the_book_and_the_days_deltas(self):
+        today = datetime.date.today()
+        loan = self.create_loan('S1', overdue=1)
+        self.create_loan('S2')
+        PaymentProcessingService.process_payments([{'loan': loan.pk, 'amount': Decimal('500.00'), 'payment_date': today, 'payment_method': 'CASH', 'notes': '', 'allocation_strategy': 'AUTO', 'reference_number': 'S-1'}], self.officer)
+        call_command('snapshot_portfolio', stdout=io.StringIO())
+        call_command('snapshot_portfolio', stdout=io.StringIO())
+        rows = {row.status: row for row in PortfolioDailySnapshot.objects.filter(snapshot_date=today)}
+        self.assertEqual(set(rows), {'ACTIVE'})
+        self.assertEqual((rows['ACTIVE'].loan_count, rows['ACTIVE'].collected_amount, rows['ACTIVE'].collected_fees, rows['ACTIVE'].due_amount, rows['ACTIVE'].outstanding_balance), (2, Decimal('500.00'), Decimal('55.00'), Decimal('1100.00'), Decimal('25955.00')))
+
+    def test_monthly_trend_reads_month_end_snapshots(self):
+        self.create_loan('S3')
+        for day in [datetime.date(2026, 1, 15), datetime.date(2026, 1, 31), datetime.date(2026, 2, 10)]:
+            with mock.patch('loans.services.portfolio_snapshot.timezone.now', return_value=timezone.make_aware(datetime.datetime.combine(day, datetime.time(23)))):
+                PortfolioSnapshotService.build(day)
+        PortfolioDailySnapshot.objects.filter(snapshot_date=datetime.date(2026, 1, 15)).update(outstanding_balance=Decimal('1.00'), collected_amount=Decimal('10.00'))
+        with self.assertNumQueries(2):
+            trend = PortfolioSnapshotService.monthly_trend(datetime.date(2026, 1, 1), datetime.date(2026, 2, 28))
+        self.assertEqual([(month['month'], month['outstanding_balance'], month['collected_amount']) for month in trend], [(datetime.date(2026, 1, 1), Decimal('13200.00'), Decimal('10.00')), (datetime.date(2026, 2, 1), Decimal('13200.00'), Decimal('0'))])
+
+    def test_past_days_other_than_the_latest_snapshot_are_refused(self):
+        today = datetime.date.today()
+        loan = self.create_loan('S4')
+        with self.assertRaises(ValueError):
+            PortfolioSnapshotService.build(today - datetime.timedelta(days=1))
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        with mock.patch('loans.services.portfolio_snapshot.timezone.now', return_value=yesterday):
+            PortfolioSnapshotService.build(yesterday.date())
+        PaymentProcessingService.process_payments([{'loan': loan.pk, 'amount': Decimal('300.00'), 'payment_date': yesterday.date(), 'payment_method': 'CASH', 'notes': '', 'allocation_strategy': 'AUTO', 'reference_number': 'S-4'}], self.officer)
+        PortfolioSnapshotService.build(yesterday.date())
+        row = PortfolioDailySnapshot.objects.get(snapshot_date=yesterday.date())
+        self.assertEqual((row.outstanding_balance, row.collected_amount), (Decimal('13200.00'), Decimal('300.00')))
+        with self.assertRaises(ValueError):
+            PortfolioSnapshotService.build(today - datetime.timedelta(days=2))
+        with self.assertRaises(ValueError):
+            PortfolioSnapshotService.build(today + datetime.timedelta(days=1))
+
+class LoanAgingTests(LoanFixtureMixin, TestCase):
+
+    def create_aged_loans(self, days_overdue):
+        for index, days in enumerate(days_overdue):
+            loan = self.create_loan(f'AG{len(days_overdue)}-{index}', installments=1)
+            Loan.objects.filter(pk=loan.pk).update(days_overdue=days, status='OVERDUE' if days else 'ACTIVE')
+
+    def test_summary_buckets_par_and_officers_are_grouped_queries(self):
+        self.create_aged_loans([0, 10, 45, 75, 120])
+        with self.assertNumQueries(1):
+            summary = LoanAgingService.summary(LoanAgingService.open_loans())
+        self.assertEqual([(bucket['name'], bucket['count'], bucket['amount']) for bucket in summary['buckets']], [('1-30', 1, Decimal('1100.00')), ('31-60', 1, Decimal('1100.00')), ('61-90', 1, Decimal('1100.00')), ('90+', 1, Decimal('1100.00'))])
+        self.assertEqual((summary['overdue_count'], summary['outstanding'], summary['par_30_ratio'], summary['par_60_ratio'], summary['par_90_ratio']), (4, Decimal('5500.00'), Decimal('60.00'), Decimal('40.00'), Decimal('20.00')))
+        with self.assertNumQueries(1):
+            officers = LoanAgingService.by_officer(LoanAgingService.open_loans())
+        self.assertEqual([(row['loan_officer'], row['overdue_count'], row['loan_count'], row['par_30_ratio']) for row in officers], [(self.officer.pk, 4, 5, Decimal('60.00'))])
+        self.assertEqual(list(LoanAgingService.annotate_buckets(LoanAgingService.open_loans()).order_by('days_overdue').values_list('aging_bucket', flat=True)), ['current', '1-30', '31-60', '61-90', '90+'])
+
+    def test_report_query_count_does_not_grow_with_the_book(self):
+        self.client.force_login(User.objects.create_superuser('aging-admin', password='secret'))
+        counts = []
+        for days_overdue in [[15, 40], [15, 40, 70, 95] * 6]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('loans:overdue_loans_report'), {'days_overdue': '1-30'})
+            counts.append(len(queries))
+            self.create_aged_loans(days_overdue)
+        response = self.client.get(reverse('loans:overdue_loans_report'), {'days_overdue': '31-60'})
+        self.assertEqual((response.context['summary']['total_overdue'], response.context['overdue_loans'].paginator.count, response.context['distribution_data']), (26, 7, [7, 7, 6, 6]))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('loans:overdue_loans_report'), {'days_overdue': '1-30'})
+        self.assertEqual(counts[1], len(queries))
+        csv_rows = b''.join(self.client.get(reverse('loans:overdue_loans_report'), {'export': 'csv', 'days_overdue': '90+'}).streaming_content).decode().splitlines()
+        self.assertEqual((len(csv_rows), csv_rows[1].split(',')[7]), (7, '95'))
+
+class CollectionsAnalyticsTests(LoanFixtureMixin, TestCase):
+
+    def test_series_and_splits_cost_three_queries_for_any_range(self):
+        today = datetime.date.today()
+        loan = self.create_loan('C1')
+        LoanTransaction.objects.bulk_create([LoanTransaction(transaction_id=f'TXN-C{index}', loan=loan, transaction_type=kind, payment_method=method, amount=Decimal(amount), value_date=today - datetime.timedelta(days=days), recorded_by=self.officer) for index, (kind, method, amount, days) in enumerate([('PRINCIPAL_PAYMENT', 'CASH', '100.00', 0), ('INTEREST_PAYMENT', 'MOBILE_MONEY', '50.00', 0), ('LATE_FEE_PAYMENT', 'CASH', '25.00', 3), ('PRINCIPAL_PAYMENT', 'CASH', '400.00', 200), ('DISBURSEMENT', 'CASH', '999.00', 1)])])
+        for days in [6, 364]:
+            with self.assertNumQueries(3):
+                analytics = CollectionsAnalyticsService.analytics(today - datetime.timedelta(days=days), today, today)
+            self.assertEqual(len(analytics['by_day']), days + 1)
+        self.assertEqual((analytics['summary']['total_collected'], analytics['summary']['total_transactions'], analytics['today'], analytics['by_day'][-1]['total']), (Decimal('575.00'), 4, {'total': Decimal('150.00'), 'count': 2}, Decimal('150.00')))
+        self.assertEqual(sum((week['total'] for week in analytics['by_week']), Decimal('0')), Decimal('575.00'))
+        self.assertEqual([(row['payment_method'], row['total'], row['count']) for row in analytics['by_method']], [('CASH', Decimal('525.00'), 3), ('MOBILE_MONEY', Decimal('50.00'), 1)])
+        report = ReportService.generate_repayment_collection_report(today - datetime.timedelta(days=6), today)
+        self.assertEqual((report['summary']['total_collected'], report['by_method'], report['by_day'][today.isoformat()]), (Decimal('175.00'), {'CASH': Decimal('125.00'), 'MOBILE_MONEY': Decimal('50.00')}, 150.0))
+        self.client.force_login(self.officer)
+        response = self.client.get(reverse('loans:collections_report'), {'period': 'year'})
+        self.assertEqual((response.status_code, response.context['today_collections']), (200, Decimal('150.00')))
+
+
+class CreditScoringTests(LoanFixtureMixin, TestCase):
+
+    @staticmethod
+    def ladder_score(age_days, savings, requested, debt, income, collateral):
+        # The per-application elif ladders the batch scorer replaces.
+        score = 100
+        score += 20 if age_days > 365 else 15 if age_days > 180 else 10 if age_days > 90 else 5 if age_days > 30 else 0
+        savings_percent = savings / requested * 100 if requested > 0 else 0
+        score += 30 if savings_percent >= 50 else 20 if savings_percent >= 30 else 10 if savings_percent >= 20 else 5 if savings_percent >= 10 else 0
+        ratio = (debt + requested) / income if income > 0 else 0
+        score -= 40 if ratio > Decimal('0.8') else 25 if ratio > Decimal('0.6') else 10 if ratio > Decimal('0.4') else 0
+        if collateral:
+            collateral_ratio = collateral / requested if requested > 0 else 0
+            score += 25 if collateral_ratio >= Decimal('1.5') else 15 if collateral_ratio >= Decimal('1.2') else 5 if collateral_ratio >= 1 else 0
+        return max(0, min(100, score))
+
+    def test_vectorized_rules_match_the_ladders_on_boundaries(self):
+        cases = [(age, savings, requested, debt, income, collateral) for age in [0, 31, 91, 366] for savings, requested in [(Decimal('500.00'), Decimal('1000.00')), (Decimal('99.99'), Decimal('1000.00')), (Decimal('0'), Decimal('0'))] for debt, income in [(Decimal('0'), Decimal('0')), (Decimal('600.00'), Decimal('2000.00')), (Decimal('200.00'), Decimal('2000.00')), (Decimal('4000.00'), Decimal('1000.00'))] for collateral in [None, Decimal('1000.00'), Decimal('1199.99'), Decimal('1500.00')]]
+        features = CreditScoringService.features([(requested, collateral, None, savings) for _, savings, requested, _, _, collateral in cases])
+        features['age_days'] = features['age_days'] + [case[0] for case in cases]
+        features['debt'] = features['debt'] + [CreditScoringService._cents(case[3]) for case in cases]
+        features['income'] = features['income'] + [CreditScoringService._cents(case[4]) for case in cases]
+        scores = CreditScoringService.score_features(features)
+        self.assertEqual(scores.tolist(), [self.ladder_score(*case) for case in cases])
+        self.assertEqual(CreditScoringService.risk_ratings(scores).tolist(), [CreditScoringService.determine_risk_rating(Decimal(score)) for score in scores.tolist()])
+        self.assertEqual(set(CreditScoringService.risk_ratings(scores).tolist()), {'A', 'B'})
+
+    def test_rescore_updates_pending_applications_in_constant_queries(self):
+        def applications(start, count, status):
+            return LoanApplication.objects.bulk_create([LoanApplication(application_id=f'CS-{index}', application_number=f'CSN-{index}', client=self.client_account, loan_product=self.product, requested_amount=Decimal('1000.00'), requested_term_days=90, purpose='Stock', status=status, loan_officer=self.officer, created_by=self.officer) for index in range(start, start + count)])
+        applications(0, 2, 'DRAFT')
+        queries = []
+        for start, count, scored in [(10, 3, 3), (20, 40, 43)]:
+            applications(start, count, 'SUBMITTED')
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(CreditScoringService.score_pending(), {'scored': scored, 'updated': count})
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(set(LoanApplication.objects.filter(status='SUBMITTED').values_list('credit_score', 'risk_rating')), {(Decimal('100.00'), 'A')})
+        self.assertFalse(LoanApplication.objects.filter(status='DRAFT', credit_score__isnull=False).exists())
+        out = io.StringIO()
+        call_command('rescore_applications', batch_size=10, stdout=out)
+        self.assertIn('43 applications scored, 0 changed', out.getvalue())
+        application = LoanApplication(client=self.client_account, loan_product=self.product, requested_amount=Decimal('500.00'), requested_term_days=30)
+        self.assertEqual((application.refresh_credit_score(), application.risk_rating), (Decimal('100'), 'A'))
+
+class ClientExposureTests(LoanFixtureMixin, TestCase):
+
+    def exposure(self):
+        return ClientExposure.objects.values_list('outstanding_balance', 'active_loan_count', 'defaulted_loan_count', 'overdue_amount', 'last_payment_date').get(client=self.client_account)
+
+    def test_payments_and_status_changes_keep_the_row_current(self):
+        today = datetime.date.today()
+        loan = self.create_loan('X1', overdue=1)
+        other = self.create_loan('X2')
+        self.assertEqual(self.exposure(), (Decimal('26400.00'), 2, 0, Decimal('0'), None))
+        PaymentProcessingService.process_payments([{'loan': loan.pk, 'amount': Decimal('500.00'), 'payment_date': today, 'payment_method': 'CASH', 'notes': '', 'allocation_strategy': 'AUTO', 'reference_number': 'X-1'}], self.officer)
+        self.assertEqual(self.exposure(), (Decimal('25955.00'), 2, 0, Decimal('0'), today))
+        other.status = 'DEFAULTED'
+        other.save()
+        self.assertEqual(self.exposure(), (Decimal('12755.00'), 1, 1, Decimal('0'), today))
+        self.assertEqual(ClientAccount.objects.select_related('exposure').get(pk=self.client_account.pk).total_loan_balance, Decimal('12755.00'))
+
+    def test_reconcile_repairs_drift_and_creates_missing_rows(self):
+        self.create_loan('X3')
+        ClientExposure.objects.filter(client=self.client_account).update(outstanding_balance=Decimal('1.00'), active_loan_count=9)
+        ClientAccount.objects.filter(pk=self.client_account.pk).update(savings_balance=Decimal('500000.00'))
+        spare = ClientAccount.objects.create(account_type='SINGLE', person1_first_name='Sam', person1_last_name='Roe', person1_contact='0700000001', person1_address='Kampala', person1_area_code='256', person1_next_of_kin='Ann', person1_nin='CM000000000002', person1_gender='M', business_location='Kampala', business_sector='Retail', loan_officer=self.officer, created_by=self.officer)
+        out = io.StringIO()
+        call_command('reconcile_exposure', stdout=out)
+        self.assertIn('2 clients checked, 1 repaired', out.getvalue())
+        self.assertEqual(self.exposure()[:2], (Decimal('13200.00'), 1))
+        self.assertEqual(ClientExposure.objects.get(client=spare).outstanding_balance, Decimal('0'))
+        self.assertEqual(ClientExposureService.refresh([self.client_account.pk, spare.pk]), [])
+
+    def test_saves_that_leave_exposure_fields_alone_skip_the_refresh(self):
+        loan = self.create_loan('X4')
+        for save in [lambda: loan.save(update_fields=['next_payment_date']), loan.save, lambda: Loan.objects.only('pk', 'client').get(pk=loan.pk).save(update_fields=['late_fee_amount'])]:
+            with CaptureQueriesContext(connection) as queries:
+                save()
+            self.assertFalse([query for query in queries if 'loans_clientexposure' in query['sql']])
+        loan.status = 'DEFAULTED'
+        loan.save(update_fields=['status'])
+        self.assertEqual(self.exposure()[1:3], (0, 1))
+
+    def test_admin_status_actions_refresh_exposure(self):
+        loans = [self.create_loan('X5'), self.create_loan('X6')]
+        loan_admin = admin.site._registry[Loan]
+        with mock.patch.object(loan_admin, 'message_user'):
+            loan_admin.mark_as_defaulted(None, Loan.objects.filter(pk=loans[0].pk, status='ACTIVE'))
+            loan_admin.mark_as_closed(None, Loan.objects.filter(pk=loans[1].pk, status='ACTIVE'))
+        self.assertEqual(self.exposure()[:3], (Decimal('0'), 0, 1))
+
+class ClientEligibilityTests(LoanFixtureMixin, TestCase):
+
+    def create_clients(self, count):
+        ClientAccount.objects.bulk_create([ClientAccount(account_number=f'EL-{ClientAccount.objects.count()}-{n}', account_type='SINGLE', person1_first_name='Client', person1_last_name=str(n), person1_contact='0700000000', person1_address='Kampala', person1_area_code='256', person1_next_of_kin='Kin', person1_nin=f'EL{ClientAccount.objects.count()}-{n}', person1_gender='F', business_location='Kampala', business_sector='Retail', account_status='ACTIVE', savings_balance=Decimal('200000.00'), loan_officer=self.officer, created_by=self.officer) for n in range(count)])
+
+    def test_batch_costs_the_same_queries_for_any_number_of_clients(self):
+        ClientAccount.objects.filter(pk=self.client_account.pk).update(account_status='ACTIVE', savings_balance=Decimal('10000.00'))
+        self.create_loan('E1')
+        self.client.force_login(self.officer)
+        counts = []
+        for count in [2, 40]:
+            self.create_clients(count)
+            ids = ','.join(str(pk) for pk in ClientAccount.objects.values_list('pk', flat=True))
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('loans:api_batch_eligibility'), {'ids': ids})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        entries = {entry['id']: entry for entry in response.json()}
+        self.assertEqual(len(entries), 43)
+        self.assertEqual((entries[self.client_account.pk]['debt'], entries[self.client_account.pk]['eligible'], entries[self.client_account.pk]['available'], entries[self.client_account.pk]['ok']), (13200.0, 30000.0, 16800.0, False))
+        self.assertTrue(all(entry['ok'] and entry['available'] == 600000.0 for pk, entry in entries.items() if pk != self.client_account.pk))
+        self.assertEqual(self.client.get(reverse('loans:api_batch_eligibility'), {'ids': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('loans:api_client_eligibility', args=[self.client_account.pk])).json()['available_amount'], 16800.0)
+
+    def test_officer_variant_revalidates_against_client_versions(self):
+        loan = self.create_loan('E2')
+        self.create_clients(3)
+        self.client.force_login(self.officer)
+        url = reverse('loans:api_officer_eligibility', args=[self.officer.pk])
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()), 4)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        PaymentProcessingService.process_payments([{'loan': loan.pk, 'amount': Decimal('500.00'), 'payment_date': datetime.date.today(), 'payment_method': 'CASH', 'notes': '', 'allocation_strategy': 'AUTO', 'reference_number': 'E-1'}], self.officer)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([entry['id'] for entry, before in zip(changed.json(), response.json()) if entry['v'] != before['v']], [self.client_account.pk])
+        self.assertEqual(self.client.get(reverse('loans:api_officer_eligibility', args=[self.officer.pk + 1])).json(), [])
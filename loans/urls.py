@@ -33,6 +33,8 @@ urlpatterns = [
     path('clients/<int:client_id>/eligibility/', views.client_eligibility_check, name='client_eligibility_check'), 
     path('api/calculate-repayment/', views.api_calculate_repayment, name='api_calculate_repayment'), 
     path('api/clients/<int:client_id>/eligibility/', views.api_client_eligibility, name='api_client_eligibility'), 
+    path('api/clients/eligibility/', views.api_batch_eligibility, name='api_batch_eligibility'), 
+    path('api/officers/<int:officer_id>/eligibility/', views.api_batch_eligibility, name='api_officer_eligibility'), 
     path('api/webhook/payment/', views.api_webhook_payment, name='api_webhook_payment'), path('reports/portfolio/', views.loan_portfolio_report, name='loan_portfolio_report'), 
     path('reports/overdue/', views.overdue_loans_report, name='overdue_loans_report'), path('reports/collections/', views.collections_report, name='collections_report'), 
     path('quick-payment/', views.quick_payment, name='quick_payment'), 
@@ -50,6 +52,7 @@ urlpatterns = [
     path('payments/bulk/process/', views.process_bulk_payments, name='process_bulk_payments'),
     path('payments/bulk/save/', views.save_bulk_payments, name='save_bulk_payments'),
     path('payments/bulk/template/', views.download_bulk_template, name='download_bulk_template'),
+    path('payments/bulk/errors/', views.download_bulk_payment_errors, name='download_bulk_payment_errors'),
     path('disbursements/bulk/', views.bulk_disbursement, name='bulk_disbursement'),
     path('disbursements/bulk/process/', views.process_bulk_disbursement, name='process_bulk_disbursement'),
     path('disbursements/bulk/upload/', views.upload_bulk_disbursement, name='upload_bulk_disbursement'),
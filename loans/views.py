@@ -12,18 +12,22 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.template.loader import render_to_string
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.contrib.auth import get_user_model
 User = get_user_model()
+import io
 import json
 import csv
 import xlwt
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from .models import LoanProduct, LoanApplication, Loan, LoanTransaction, LoanRepaymentSchedule, Guarantor, LoanPayment, LoanApplicationDocument
 from client_accounts.models import ClientAccount
+from core.exports import stream_rows, streaming_csv_response
+from core.pagination import KeysetPaginator
 from .forms import LoanProductForm, LoanApplicationForm, LoanApprovalForm, LoanDisbursementForm, LoanPaymentForm, GuarantorForm, LoanCalculatorForm, LoanSearchForm, BulkPaymentForm
-from .services import InterestCalculationService, CreditScoringService, PaymentProcessingService, AmortizationService
+from .services import InterestCalculationService, CreditScoringService, PaymentProcessingService, AmortizationService, BulkPaymentImportService, BulkDisbursementService, PaymentWebhookService, DashboardMetricsService, PortfolioSnapshotService, ReportService, LoanAgingService, CollectionsAnalyticsService, ClientEligibilityService
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
@@ -155,30 +159,20 @@ class LoanDashboardView(LoginRequiredMixin, StaffRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_loans'] = Loan.objects.count()
-        context['active_loans'] = Loan.objects.filter(status='ACTIVE').count()
-        context['overdue_loans'] = Loan.objects.filter(status='OVERDUE').count()
-        context['pending_applications'] = LoanApplication.objects.filter(status__in=['SUBMITTED', 'UNDER_REVIEW']).count()
-        context['total_portfolio'] = Loan.objects.filter(status__in=['ACTIVE', 'OVERDUE']).aggregate(total=Sum('remaining_balance'))['total'] or Decimal('0')
-        context['total_disbursed'] = Loan.objects.aggregate(total=Sum('principal_amount'))['total'] or Decimal('0')
-        context['total_interest_earned'] = LoanTransaction.objects.filter(transaction_type='INTEREST_PAYMENT').aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        context['total_collections_today'] = LoanTransaction.objects.filter(transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT'], value_date=timezone.now().date()).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        context.update(DashboardMetricsService.metrics())
+        context['total_collections_today'] = context['payments_today']
         context['recent_applications'] = LoanApplication.objects.filter(status__in=['SUBMITTED', 'UNDER_REVIEW']).select_related('client', 'loan_product', 'loan_officer').order_by('-application_date')[:10]
         context['upcoming_payments'] = LoanRepaymentSchedule.objects.filter(status__in=['PENDING', 'DUE'], due_date__lte=timezone.now().date() + timedelta(days=7), due_date__gte=timezone.now().date()).select_related('loan', 'loan__client').order_by('due_date')[:10]
         context['overdue_list'] = Loan.objects.filter(status='OVERDUE').select_related('client', 'loan_product').order_by('-days_overdue')[:10]
         if self.request.user.is_superuser:
             context['officer_performance'] = User.objects.filter(groups__name='Loan Officers').annotate(total_loans=Count('assigned_applications'), total_disbursed=Sum('assigned_applications__loan__principal_amount')).order_by('-total_disbursed')[:5]
-        today = timezone.now().date()
-        context['applications_today'] = LoanApplication.objects.filter(application_date__date=today).count()
-        context['disbursements_today'] = Loan.objects.filter(disbursement_date=today).aggregate(total=Sum('principal_amount'))['total'] or Decimal('0')
-        context['payments_today'] = LoanTransaction.objects.filter(value_date=today, transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT']).aggregate(total=Sum('amount'))['total'] or Decimal('0')
         return context
 
 @login_required
 @staff_required
 def dashboard_summary_api(request):
-    today = timezone.now().date()
-    data = {'total_portfolio': float(Loan.objects.filter(status__in=['ACTIVE', 'OVERDUE']).aggregate(total=Sum('remaining_balance'))['total'] or Decimal('0')), 'overdue_amount': float(Loan.objects.filter(status='OVERDUE').aggregate(total=Sum('overdue_amount'))['total'] or Decimal('0')), 'today_collections': float(LoanTransaction.objects.filter(transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT'], value_date=today).aggregate(total=Sum('amount'))['total'] or Decimal('0')), 'pending_applications': LoanApplication.objects.filter(status__in=['SUBMITTED', 'UNDER_REVIEW']).count(), 'active_loans': Loan.objects.filter(status='ACTIVE').count(), 'overdue_loans': Loan.objects.filter(status='OVERDUE').count(), 'timestamp': timezone.now().isoformat()}
+    metrics = DashboardMetricsService.metrics()
+    data = {'total_portfolio': float(metrics['total_portfolio']), 'overdue_amount': float(metrics['overdue_amount']), 'today_collections': float(metrics['payments_today']), 'pending_applications': metrics['pending_applications'], 'active_loans': metrics['active_loans'], 'overdue_loans': metrics['overdue_loans'], 'timestamp': timezone.now().isoformat()}
     return JsonResponse(data)
 
 class LoanProductListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
@@ -307,16 +301,7 @@ class LoanApplicationCreateView(LoginRequiredMixin, LoanOfficerRequiredMixin, Cr
             application.created_by = self.request.user
             application.status = 'SUBMITTED'
             application.submitted_date = timezone.now()
-            if hasattr(application, 'calculate_credit_score'):
-                application.credit_score = application.calculate_credit_score()
-                if application.credit_score >= 80:
-                    application.risk_rating = 'A'
-                elif application.credit_score >= 60:
-                    application.risk_rating = 'B'
-                elif application.credit_score >= 40:
-                    application.risk_rating = 'C'
-                else:
-                    application.risk_rating = 'D'
+            application.refresh_credit_score()
             application.save()
             form.save_m2m()
             if 'collateral_documents' in form.cleaned_data:
@@ -336,15 +321,20 @@ class LoanApplicationDetailView(LoginRequiredMixin, LoanOfficerRequiredMixin, De
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        application = self.get_object()
-        if hasattr(application.client, 'monthly_income') and application.client.monthly_income:
-            context['debt_to_income_ratio'] = (application.requested_amount + sum((loan.remaining_balance for loan in application.client.loans.filter(status__in=['ACTIVE', 'OVERDUE'])))) / application.client.monthly_income
-        context['similar_applications'] = LoanApplication.objects.filter(loan_product=application.loan_product, status='APPROVED', client__monthly_income__range=[application.client.monthly_income * Decimal('0.8') if application.client.monthly_income else Decimal('0'), application.client.monthly_income * Decimal('1.2') if application.client.monthly_income else Decimal('1000000')]).exclude(pk=application.pk)[:5]
-        if application.client.current_balance:
-            recommended_amount = min(application.requested_amount, application.client.current_balance * Decimal('3'), application.client.monthly_income * Decimal('6') if application.client.monthly_income else Decimal('1000000'))
-            context['recommended_amount'] = recommended_amount.quantize(Decimal('1000'), rounding=ROUND_HALF_UP)
+        application = self.object
+        context.update(application_eligibility(application))
+        context['similar_applications'] = LoanApplication.objects.filter(loan_product=application.loan_product, status='APPROVED', requested_amount__range=[application.requested_amount * Decimal('0.8'), application.requested_amount * Decimal('1.2')]).exclude(pk=application.pk).select_related('client')[:5]
         return context
 
+def application_eligibility(application):
+    """Savings, debt and the savings-based caps behind an application, from the client's exposure row."""
+    client = ClientAccount.objects.select_related('exposure').get(pk=application.client_id)
+    total_existing_debt = client.total_loan_balance
+    assessment = ClientEligibilityService.assess(client.savings_balance, total_existing_debt)
+    # Rounded down to the thousand so the recommendation never exceeds what the client can still borrow.
+    recommended_amount = min(application.requested_amount, assessment['available_amount']) // 1000 * 1000
+    return {'savings_balance': client.savings_balance, 'total_existing_debt': total_existing_debt, 'recommended_amount': recommended_amount, **assessment}
+
 class LoanApplicationUpdateView(LoginRequiredMixin, LoanOfficerRequiredMixin, UpdateView):
     model = LoanApplication
     form_class = LoanApplicationForm
@@ -358,16 +348,8 @@ class LoanApplicationUpdateView(LoginRequiredMixin, LoanOfficerRequiredMixin, Up
     def form_valid(self, form):
         with transaction.atomic():
             application = form.save(commit=False)
-            if 'requested_amount' in form.changed_data:
-                application.credit_score = application.calculate_credit_score()
-                if application.credit_score >= 80:
-                    application.risk_rating = 'A'
-                elif application.credit_score >= 60:
-                    application.risk_rating = 'B'
-                elif application.credit_score >= 40:
-                    application.risk_rating = 'C'
-                else:
-                    application.risk_rating = 'D'
+            if {'requested_amount', 'collateral_value', 'client'} & set(form.changed_data):
+                application.refresh_credit_score()
             application.save()
             form.save_m2m()
             messages.success(self.request, f'Loan application {application.application_number} updated successfully!')
@@ -405,12 +387,7 @@ def loan_application_review(request, pk):
     else:
         form = LoanApprovalForm(instance=application)
     existing_loans = Loan.objects.filter(client=application.client, status__in=['ACTIVE', 'OVERDUE']).select_related('loan_product')
-    total_existing_debt = sum((loan.remaining_balance for loan in existing_loans))
-    max_loan_by_savings = application.client.current_balance * Decimal('3')
-    max_loan_by_income = Decimal('0')
-    if hasattr(application.client, 'monthly_income') and application.client.monthly_income:
-        max_loan_by_income = application.client.monthly_income * Decimal('6')
-    context = {'application': application, 'form': form, 'existing_loans': existing_loans, 'total_existing_debt': total_existing_debt, 'max_loan_by_savings': max_loan_by_savings, 'max_loan_by_income': max_loan_by_income, 'recommended_amount': min(application.requested_amount, max_loan_by_savings, max_loan_by_income)}
+    context = {'application': application, 'form': form, 'existing_loans': existing_loans, **application_eligibility(application)}
     return render(request, 'loans/loanapplication_review.html', context)
 
 @login_required
@@ -463,44 +440,13 @@ def loan_disbursement_create(request, application_id):
 @staff_required
 def bulk_loan_disbursement(request):
     if request.method == 'POST':
-        loan_ids = request.POST.getlist('loan_ids')
-        payment_method = request.POST.get('payment_method', 'BANK_TRANSFER')
-        disbursement_date = request.POST.get('disbursement_date', timezone.now().date())
+        loan_ids = [pk for pk in request.POST.getlist('loan_ids') if pk.isdigit()]
+        disbursement_date = parse_disbursement_date(request.POST.get('disbursement_date'))
         reference_prefix = request.POST.get('reference_prefix', '')
-        loans = Loan.objects.filter(pk__in=loan_ids, status='PENDING_DISBURSEMENT').select_related('application', 'client', 'loan_product')
-        disbursed_count = 0
-        errors = []
-        for loan in loans:
-            try:
-                with transaction.atomic():
-                    loan.disbursement_date = disbursement_date
-                    loan.status = 'ACTIVE'
-                    if disbursement_date and loan.term_days:
-                        loan.maturity_date = disbursement_date + timedelta(days=loan.term_days)
-                    if not loan.repayment_schedule.exists():
-                        amortization_service = AmortizationService()
-                        schedule_data = amortization_service.generate_amortization_schedule(loan)
-                        for installment_data in schedule_data:
-                            LoanRepaymentSchedule.objects.create(loan=loan, installment_number=installment_data['installment_number'], due_date=installment_data['due_date'], principal_amount=installment_data['principal_amount'], interest_amount=installment_data['interest_amount'], total_amount=installment_data['total_amount'], status='PENDING')
-                    first_installment = loan.repayment_schedule.order_by('due_date').first()
-                    if first_installment:
-                        loan.first_payment_date = first_installment.due_date
-                        loan.next_payment_date = first_installment.due_date
-                    loan.save()
-                    LoanTransaction.objects.create(loan=loan, transaction_type='DISBURSEMENT', payment_method=payment_method, amount=loan.application.net_disbursement_amount, principal_amount=loan.principal_amount, fee_amount=loan.processing_fee_amount, notes=f'Bulk loan disbursement', recorded_by=request.user, reference_number=f'{reference_prefix}-{loan.loan_number}' if reference_prefix else loan.loan_number)
-                    if loan.application:
-                        loan.application.status = 'DISBURSED'
-                        loan.application.save()
-                    disbursed_count += 1
-            except Exception as e:
-                errors.append(f'Loan {loan.loan_number}: {str(e)}')
-        if disbursed_count > 0:
-            messages.success(request, f'{disbursed_count} loans disbursed successfully!')
-        if errors:
-            messages.error(request, f"Errors: {', '.join(errors[:5])}" + ('...' if len(errors) > 5 else ''))
+        report = BulkDisbursementService.disburse_loans(loan_ids, request.user, disbursement_date, request.POST.get('payment_method', 'BANK_TRANSFER'), reference_prefix=f'{reference_prefix}-' if reference_prefix else '', notes='')
+        bulk_disbursement_report(request, report)
         return redirect('loans:loan_list')
-    pending_loans = Loan.objects.filter(status='PENDING_DISBURSEMENT').select_related('client', 'loan_product').order_by('created_at')
-    return render(request, 'loans/bulk_disbursement.html', {'pending_loans': pending_loans})
+    return bulk_disbursement(request)
 
 class LoanListView(LoginRequiredMixin, LoanOfficerRequiredMixin, ListView):
     model = Loan
@@ -785,17 +731,12 @@ def loan_calculator(request):
 @login_required
 @loan_officer_required
 def client_eligibility_check(request, client_id):
-    client = get_object_or_404(ClientAccount, pk=client_id)
+    client = get_object_or_404(ClientAccount.objects.select_related('exposure'), pk=client_id)
     existing_loans = Loan.objects.filter(client=client, status__in=['ACTIVE', 'OVERDUE'])
-    total_existing_debt = sum((loan.remaining_balance for loan in existing_loans))
-    max_loan_by_savings = client.current_balance * Decimal('3')
-    max_loan_by_income = Decimal('0')
-    if hasattr(client, 'monthly_income') and client.monthly_income:
-        max_loan_by_income = client.monthly_income * Decimal('6')
-    eligible_amount = min(max_loan_by_savings, max_loan_by_income)
-    available_amount = max(Decimal('0'), eligible_amount - total_existing_debt)
-    recommended_products = LoanProduct.objects.filter(is_active=True, min_loan_amount__lte=available_amount, max_loan_amount__gte=available_amount).order_by('annual_interest_rate')
-    context = {'client': client, 'existing_loans': existing_loans, 'total_existing_debt': total_existing_debt, 'max_loan_by_savings': max_loan_by_savings, 'max_loan_by_income': max_loan_by_income, 'eligible_amount': eligible_amount, 'available_amount': available_amount, 'recommended_products': recommended_products}
+    total_existing_debt = client.total_loan_balance
+    assessment = ClientEligibilityService.assess(client.savings_balance, total_existing_debt)
+    recommended_products = LoanProduct.objects.filter(is_active=True, min_loan_amount__lte=assessment['available_amount'], max_loan_amount__gte=assessment['available_amount']).order_by('annual_interest_rate')
+    context = {'client': client, 'existing_loans': existing_loans, 'total_existing_debt': total_existing_debt, 'recommended_products': recommended_products, **assessment}
     return render(request, 'loans/client_eligibility.html', context)
 
 @login_required
@@ -825,36 +766,55 @@ def api_calculate_repayment(request):
 @require_http_methods(['GET'])
 def api_client_eligibility(request, client_id):
     try:
-        client = get_object_or_404(ClientAccount, pk=client_id)
-        existing_loans = Loan.objects.filter(client=client, status__in=['ACTIVE', 'OVERDUE'])
-        total_existing_debt = sum((loan.remaining_balance for loan in existing_loans))
-        max_loan_by_savings = client.current_balance * Decimal('3')
-        max_loan_by_income = Decimal('0')
-        if hasattr(client, 'monthly_income') and client.monthly_income:
-            max_loan_by_income = client.monthly_income * Decimal('6')
-        eligible_amount = min(max_loan_by_savings, max_loan_by_income)
-        available_amount = max(Decimal('0'), eligible_amount - total_existing_debt)
-        return JsonResponse({'client_id': client_id, 'client_name': client.full_account_name, 'current_savings': float(client.current_balance), 'monthly_income': float(client.monthly_income) if client.monthly_income else 0, 'existing_debt': float(total_existing_debt), 'max_loan_by_savings': float(max_loan_by_savings), 'max_loan_by_income': float(max_loan_by_income), 'eligible_amount': float(eligible_amount), 'available_amount': float(available_amount), 'debt_to_income_ratio': float(total_existing_debt / client.monthly_income if client.monthly_income else 0)})
+        client = get_object_or_404(ClientAccount.objects.select_related('exposure'), pk=client_id)
+        total_existing_debt = client.total_loan_balance
+        assessment = ClientEligibilityService.assess(client.savings_balance, total_existing_debt)
+        return JsonResponse({'client_id': client_id, 'client_name': client.full_account_name, 'current_savings': float(client.savings_balance), 'monthly_income': 0, 'existing_debt': float(total_existing_debt), 'debt_to_income_ratio': 0, **{name: float(value) for name, value in assessment.items()}})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
+@login_required
+@require_http_methods(['GET'])
+def api_batch_eligibility(request, officer_id=None):
+    clients = ClientAccount.objects.all()
+    if get_user_role(request) in (UserProfile.ROLE_STAFF, UserProfile.ROLE_LOAN_OFFICER):
+        clients = clients.filter(loan_officer=request.user)
+    page = None
+    if officer_id is not None:
+        page = KeysetPaginator(ClientEligibilityService.rows(clients.filter(loan_officer_id=officer_id)), ['id'], ClientEligibilityService.MAX_CLIENTS).get_page(request.GET.get('cursor'), request.GET)
+        rows = page.object_list
+    else:
+        try:
+            ids = {int(value) for value in ','.join(request.GET.getlist('ids')).split(',') if value.strip()}
+        except ValueError:
+            return JsonResponse({'error': 'ids must be comma-separated integers'}, status=400)
+        if not ids or len(ids) > ClientEligibilityService.MAX_CLIENTS:
+            return JsonResponse({'error': f'Pass between 1 and {ClientEligibilityService.MAX_CLIENTS} ids'}, status=400)
+        rows = ClientEligibilityService.rows(clients.filter(pk__in=ids))
+    entries = [ClientEligibilityService.summarize(row) for row in rows]
+    response = JsonResponse(entries, safe=False, json_dumps_params={'separators': (',', ':')})
+    if page is not None:
+        links = [f'<{request.build_absolute_uri(page.next_link)}>; rel="next"'] if page.has_next() else []
+        links += [f'<{request.build_absolute_uri(page.previous_link)}>; rel="prev"'] if page.has_previous() else []
+        if links:
+            response['Link'] = ', '.join(links)
+        response['X-Next-Cursor'] = page.next_cursor or ''
+    # Browsers revalidate with If-None-Match and get a bodiless 304 while none of the clients' versions moved.
+    response['ETag'] = ClientEligibilityService.etag(entries)
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
 @csrf_exempt
 @require_http_methods(['POST'])
 def api_webhook_payment(request):
     try:
         data = json.loads(request.body)
-        loan_number = data.get('loan_number')
-        amount = Decimal(data.get('amount', '0'))
-        reference = data.get('reference')
-        payment_method = data.get('payment_method', 'MOBILE_MONEY')
-        loan = get_object_or_404(Loan, loan_number=loan_number)
-        with transaction.atomic():
-            payment_service = PaymentProcessingService()
-            allocation = payment_service.process_payment(loan=loan, amount=amount, payment_date=timezone.now().date(), payment_method=payment_method, received_by=None, notes=f'Auto payment via webhook: {reference}', allocation_strategy='AUTO')
-            LoanTransaction.objects.create(loan=loan, transaction_type='PRINCIPAL_PAYMENT' if allocation['principal'] > 0 else 'INTEREST_PAYMENT', payment_method=payment_method, amount=amount, principal_amount=allocation['principal'], interest_amount=allocation['interest'], fee_amount=allocation['late_fees'], notes=f'Auto payment: {reference}', recorded_by=None, reference_number=reference)
-        return JsonResponse({'success': True, 'message': 'Payment processed'})
-    except Exception as e:
+        if not isinstance(data, dict):
+            raise ValueError('Payload must be a JSON object')
+        webhook, created = PaymentWebhookService.record(data)
+    except ValueError as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'message': 'Payment queued' if created else 'Duplicate delivery', 'reference': webhook.reference, 'status': webhook.status}, status=202 if created else 200)
 
 @login_required
 @staff_required
@@ -871,6 +831,8 @@ def loan_portfolio_report(request):
     if date_from and date_to:
         loans = loans.filter(disbursement_date__range=[date_from, date_to])
     export_format = request.GET.get('export')
+    if export_format not in ('csv', 'excel'):
+        return portfolio_report(request)
     if export_format == 'csv':
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="loan_portfolio.csv"'
@@ -906,31 +868,12 @@ def loan_portfolio_report(request):
 @login_required
 @staff_required
 def overdue_loans_report(request):
-    overdue_loans = Loan.objects.filter(status='OVERDUE').select_related('client', 'loan_product').order_by('-days_overdue')
-    aging = {'1_30_days': Decimal('0'), '31_60_days': Decimal('0'), '61_90_days': Decimal('0'), 'over_90_days': Decimal('0')}
-    for loan in overdue_loans:
-        days = loan.days_overdue
-        amount = loan.overdue_amount
-        if days <= 30:
-            aging['1_30_days'] += amount
-        elif days <= 60:
-            aging['31_60_days'] += amount
-        elif days <= 90:
-            aging['61_90_days'] += amount
-        else:
-            aging['over_90_days'] += amount
-    export_format = request.GET.get('export')
-    if export_format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="overdue_loans.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['Loan Number', 'Client', 'Phone', 'Disbursement Date', 'Principal', 'Overdue Amount', 'Days Overdue', 'Last Payment Date', 'Loan Officer'])
-        for loan in overdue_loans:
-            last_payment = loan.transactions.filter(transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT']).order_by('-transaction_date').first()
-            writer.writerow([loan.loan_number, loan.client.full_account_name, loan.client.phone_number, loan.disbursement_date, loan.principal_amount, loan.overdue_amount, loan.days_overdue, last_payment.transaction_date if last_payment else '', f'{loan.loan_officer.first_name} {loan.loan_officer.last_name}'])
-        return response
-    context = {'overdue_loans': overdue_loans, 'total_overdue': overdue_loans.count(), 'total_overdue_amount': sum((loan.overdue_amount for loan in overdue_loans)), 'aging_analysis': aging}
-    return render(request, 'loans/overdue_report.html', context)
+    if request.GET.get('export') != 'csv':
+        return overdue_report(request)
+    loans = overdue_loans_in_range(request, filter_overdue_loans(request, LoanAgingService.open_loans())).annotate(last_payment=Max('transactions__transaction_date', filter=Q(transactions__transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT']))).order_by('-days_overdue', 'pk')
+    fields = ['loan_number', 'client__account_type', 'client__person1_first_name', 'client__person1_last_name', 'client__person2_first_name', 'client__person2_last_name', 'client__person1_contact', 'disbursement_date', 'principal_amount', 'remaining_balance', 'overdue_amount', 'days_overdue', 'last_payment', 'loan_officer__first_name', 'loan_officer__last_name']
+    rows = ((number, ClientAccount.format_account_name(*names), phone, disbursed, principal, balance, overdue, days, last_payment or '', f'{officer_first} {officer_last}') for number, *names, phone, disbursed, principal, balance, overdue, days, last_payment, officer_first, officer_last in stream_rows(loans, fields))
+    return streaming_csv_response('overdue_loans.csv', ['Loan Number', 'Client', 'Phone', 'Disbursement Date', 'Principal', 'Outstanding', 'Overdue Amount', 'Days Overdue', 'Last Payment Date', 'Loan Officer'], rows)
 
 @login_required
 @loan_officer_required
@@ -1061,190 +1004,82 @@ def portfolio_report(request):
         start_date = (timezone.now() - timedelta(days=365)).date()
         end_date = timezone.now().date()
     
-    # Base queryset
-    loans = LoanApplication.objects.filter(
-        application_date__range=[start_date, end_date]
-    ).select_related('client_account', 'loan_officer')
-    
-    # Apply filters
+    report = ReportService.generate_portfolio_report(start_date, end_date, loan_product=loan_type, loan_officer=loan_officer_id)
+    totals = report['totals']
+    rows = report['rows']
+    loans = Loan.objects.select_related('client', 'loan_product', 'loan_officer').order_by('-disbursement_date', '-pk')
     if loan_officer_id:
         loans = loans.filter(loan_officer_id=loan_officer_id)
-    
     if loan_type:
-        loans = loans.filter(loan_type=loan_type)
-    
-    # Calculate summary statistics
-    total_loans = loans.count()
-    active_loans = loans.filter(status__in=['ACTIVE', 'APPROVED', 'DISBURSED']).count()
-    total_portfolio = loans.aggregate(total=Sum('loan_amount'))['total'] or Decimal('0.00')
-    total_outstanding = loans.aggregate(total=Sum('remaining_balance'))['total'] or Decimal('0.00')
-    
-    # Calculate NPL ratio (Non-Performing Loans > 90 days)
-    npl_amount = loans.filter(
-        status='ACTIVE',
-        days_overdue__gt=90
-    ).aggregate(total=Sum('remaining_balance'))['total'] or Decimal('0.00')
-    
-    npl_ratio = (npl_amount / total_outstanding * 100) if total_outstanding > 0 else Decimal('0.00')
-    
-    # Calculate collection rate
-    total_repayments = LoanRepayment.objects.filter(
-        loan__in=loans,
-        payment_date__range=[start_date, end_date]
-    ).aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00')
-    
-    total_due = loans.filter(status='ACTIVE').aggregate(
-        total=Sum('remaining_balance') + Sum('total_interest')
-    )['total'] or Decimal('0.00')
-    
-    collection_rate = (total_repayments / total_due * 100) if total_due > 0 else Decimal('0.00')
-    
-    # Status distribution
-    status_distribution = []
-    for status_code, status_name in LoanApplication.STATUS_CHOICES:
-        status_loans = loans.filter(status=status_code)
-        count = status_loans.count()
-        total_amount = status_loans.aggregate(total=Sum('loan_amount'))['total'] or Decimal('0.00')
-        
-        if count > 0:
-            percentage = (total_amount / total_portfolio * 100) if total_portfolio > 0 else Decimal('0.00')
-            avg_size = total_amount / count
-            
-            status_distribution.append({
-                'status': status_code,
-                'status_display': status_name,
-                'count': count,
-                'total_amount': total_amount,
-                'percentage': percentage,
-                'avg_size': avg_size,
-                'badge_color': {
-                    'PENDING': 'secondary',
-                    'APPROVED': 'info',
-                    'DISBURSED': 'primary',
-                    'ACTIVE': 'success',
-                    'COMPLETED': 'success',
-                    'DEFAULTED': 'danger',
-                    'WRITTEN_OFF': 'dark',
-                }.get(status_code, 'secondary')
-            })
-    
-    # Performance metrics
-    par_30 = loans.filter(
-        status='ACTIVE',
-        days_overdue__gt=30,
-        days_overdue__lte=60
-    ).aggregate(total=Sum('remaining_balance'))['total'] or Decimal('0.00')
-    
-    par_60 = loans.filter(
-        status='ACTIVE',
-        days_overdue__gt=60
-    ).aggregate(total=Sum('remaining_balance'))['total'] or Decimal('0.00')
-    
-    write_offs = loans.filter(
-        status='WRITTEN_OFF',
-        application_date__range=[start_date, end_date]
-    ).aggregate(total=Sum('loan_amount'))['total'] or Decimal('0.00')
-    
-    # Prepare chart data
-    status_labels = [s['status_display'] for s in status_distribution]
-    status_data = [float(s['total_amount']) for s in status_distribution]
-    status_colors = [f'#{hash(s["status_display"]) % 0xFFFFFF:06x}' for s in status_distribution]
-    
-    # Disbursement trend (last 12 months)
-    disbursement_months = []
-    disbursement_amounts = []
-    for i in range(11, -1, -1):
-        month_date = (timezone.now() - timedelta(days=30*i)).replace(day=1)
-        month_start = month_date.replace(day=1)
-        month_end = (month_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        month_amount = loans.filter(
-            disbursement_date__range=[month_start, month_end]
-        ).aggregate(total=Sum('loan_amount'))['total'] or Decimal('0.00')
-        
-        disbursement_months.append(month_date.strftime('%b %Y'))
-        disbursement_amounts.append(float(month_amount))
-    
-    # Loan type distribution
-    loan_types_data = loans.values('loan_type').annotate(
-        count=Count('id'),
-        total=Sum('loan_amount')
-    ).order_by('-total')
-    
-    loan_type_labels = [dict(LoanApplication.LOAN_TYPE_CHOICES).get(item['loan_type'], item['loan_type']) 
-                        for item in loan_types_data]
-    loan_type_data = [float(item['total']) for item in loan_types_data]
-    
-    # Risk ratings (if available)
-    risk_ratings = []
-    # Add your risk rating logic here
-    
-    # Officer performance
+        loans = loans.filter(loan_product_id=loan_type)
+    total_outstanding = totals['outstanding_balance']
+    total_portfolio = totals['principal_amount']
+    trend = report['trend']
+    total_due = sum((month['due_amount'] for month in trend), Decimal('0.00'))
+    total_collected = sum((month['collected_amount'] for month in trend), Decimal('0.00'))
+    badge_colors = {'PENDING_DISBURSEMENT': 'secondary', 'ACTIVE': 'success', 'OVERDUE': 'warning', 'DEFAULTED': 'danger', 'CLOSED': 'primary', 'WRITTEN_OFF': 'dark'}
+    by_status, by_product, by_officer = ({}, {}, {})
+    for row in rows:
+        status = by_status.setdefault(row.status, {'count': 0, 'total_amount': Decimal('0.00')})
+        status['count'] += row.loan_count
+        status['total_amount'] += row.principal_amount
+        by_product[row.loan_product.name] = by_product.get(row.loan_product.name, Decimal('0.00')) + row.principal_amount
+        officer = by_officer.setdefault(row.loan_officer_id, {'name': row.loan_officer.get_full_name() or row.loan_officer.username, 'loan_count': 0, 'portfolio': Decimal('0.00'), 'outstanding': Decimal('0.00'), 'npl': Decimal('0.00')})
+        officer['loan_count'] += row.loan_count
+        officer['portfolio'] += row.principal_amount
+        officer['outstanding'] += row.outstanding_balance
+        officer['npl'] += row.par_over_90
+    status_distribution = [{'status': code, 'status_display': label, 'count': by_status[code]['count'], 'total_amount': by_status[code]['total_amount'], 'percentage': by_status[code]['total_amount'] / total_portfolio * 100 if total_portfolio > 0 else Decimal('0.00'), 'avg_size': by_status[code]['total_amount'] / by_status[code]['count'], 'badge_color': badge_colors.get(code, 'secondary')} for code, label in Loan.LOAN_STATUS if by_status.get(code, {}).get('count')]
+    officer_collections = {row['loan_officer']: row for row in PortfolioSnapshotService.snapshots(loan_type, loan_officer_id).filter(snapshot_date__range=[start_date, end_date]).values('loan_officer').annotate(due=Sum('due_amount'), collected=Sum('collected_amount')).order_by()}
     officer_performance = []
-    officers = User.objects.filter(loan_applications__in=loans).distinct()
-    for officer in officers:
-        officer_loans = loans.filter(loan_officer=officer)
-        officer_portfolio = officer_loans.aggregate(total=Sum('loan_amount'))['total'] or Decimal('0.00')
-        officer_npl = officer_loans.filter(status='ACTIVE', days_overdue__gt=90).aggregate(
-            total=Sum('remaining_balance'))['total'] or Decimal('0.00')
-        officer_npl_ratio = (officer_npl / officer_portfolio * 100) if officer_portfolio > 0 else Decimal('0.00')
-        
-        officer_performance.append({
-            'name': officer.get_full_name() or officer.username,
-            'loan_count': officer_loans.count(),
-            'portfolio': officer_portfolio,
-            'npl_ratio': officer_npl_ratio,
-            'collection_rate': Decimal('95.5')  # Replace with actual calculation
-        })
-    
+    for officer_id, officer in sorted(by_officer.items(), key=lambda item: -item[1]['portfolio']):
+        collections = officer_collections.get(officer_id, {})
+        officer_performance.append({'name': officer['name'], 'loan_count': officer['loan_count'], 'portfolio': officer['portfolio'], 'npl_ratio': officer['npl'] / officer['outstanding'] * 100 if officer['outstanding'] > 0 else Decimal('0.00'), 'collection_rate': collections['collected'] / collections['due'] * 100 if collections.get('due') else Decimal('0.00')})
+    par_30 = totals['par_31_60'] + totals['par_61_90'] + totals['par_over_90']
+    par_60 = totals['par_61_90'] + totals['par_over_90']
+    write_offs = by_status.get('WRITTEN_OFF', {}).get('total_amount', Decimal('0.00'))
     context = {
         'start_date': start_date,
         'end_date': end_date,
+        'as_of_date': report['as_of_date'],
         'selected_officer': int(loan_officer_id) if loan_officer_id else None,
         'selected_type': loan_type,
         'loan_officers': User.objects.filter(groups__name='Loan Officer').distinct(),
-        'loan_types': LoanApplication.LOAN_TYPE_CHOICES,
-        
+        'loan_types': [(str(pk), name) for pk, name in LoanProduct.objects.order_by('name').values_list('pk', 'name')],
         'summary': {
-            'total_loans': total_loans,
-            'active_loans': active_loans,
+            'total_loans': report['total_loans'],
+            'active_loans': sum(row.loan_count for row in rows if row.status in PortfolioSnapshotService.OPEN_STATUSES),
             'total_portfolio': total_portfolio,
             'total_outstanding': total_outstanding,
-            'npl_ratio': npl_ratio,
-            'collection_rate': collection_rate,
-            'avg_loan_size': total_portfolio / total_loans if total_loans > 0 else Decimal('0.00'),
+            'npl_ratio': totals['par_over_90'] / total_outstanding * 100 if total_outstanding > 0 else Decimal('0.00'),
+            'collection_rate': total_collected / total_due * 100 if total_due > 0 else Decimal('0.00'),
+            'avg_loan_size': report['average_loan_size'],
         },
-        
         'status_distribution': status_distribution,
         'performance': {
             'par_30': par_30,
-            'par_30_percentage': (par_30 / total_outstanding * 100) if total_outstanding > 0 else Decimal('0.00'),
+            'par_30_percentage': par_30 / total_outstanding * 100 if total_outstanding > 0 else Decimal('0.00'),
             'par_60': par_60,
-            'par_60_percentage': (par_60 / total_outstanding * 100) if total_outstanding > 0 else Decimal('0.00'),
+            'par_60_percentage': par_60 / total_outstanding * 100 if total_outstanding > 0 else Decimal('0.00'),
             'write_offs': write_offs,
-            'write_offs_percentage': (write_offs / total_portfolio * 100) if total_portfolio > 0 else Decimal('0.00'),
+            'write_offs_percentage': write_offs / total_portfolio * 100 if total_portfolio > 0 else Decimal('0.00'),
         },
-        
-        'status_labels': status_labels,
-        'status_data': status_data,
-        'status_colors': status_colors,
-        'disbursement_months': disbursement_months,
-        'disbursement_amounts': disbursement_amounts,
-        'loan_type_labels': loan_type_labels,
-        'loan_type_data': loan_type_data,
-        
-        'risk_ratings': risk_ratings,
+        'status_labels': json.dumps([status['status_display'] for status in status_distribution]),
+        'status_data': json.dumps([float(status['total_amount']) for status in status_distribution]),
+        'status_colors': json.dumps([f'#{hash(status["status_display"]) % 0xFFFFFF:06x}' for status in status_distribution]),
+        'disbursement_months': json.dumps([month['month'].strftime('%b %Y') for month in trend]),
+        'disbursement_amounts': json.dumps([float(month['disbursed_amount']) for month in trend]),
+        'loan_type_labels': json.dumps(list(by_product)),
+        'loan_type_data': json.dumps([float(amount) for amount in by_product.values()]),
+        'risk_ratings': [],
         'officer_performance': officer_performance,
-        
-        'loans': loans[:100],  # Limit to 100 for performance
+        'loans': loans[:100],
         'generated_at': timezone.now(),
     }
     
     # Handle exports
     if request.GET.get('export') == 'csv':
         return export_portfolio_csv(loans, context)
-    elif request.GET.get('export') == 'pdf':
-        return export_portfolio_pdf(context)
     
     return render(request, 'loans/portfolio_report.html', context)
 
@@ -1294,12 +1129,12 @@ def export_portfolio_csv(queryset, context):
     
     for loan in queryset:
         writer.writerow([
-            loan.id,
-            loan.client_account.full_account_name,
+            loan.loan_number,
+            loan.client.full_account_name,
             loan.loan_officer.get_full_name() or loan.loan_officer.username,
-            loan.get_loan_type_display(),
+            loan.loan_product.name,
             loan.disbursement_date.strftime('%Y-%m-%d') if loan.disbursement_date else '',
-            f"${loan.loan_amount:.2f}",
+            f"${loan.principal_amount:.2f}",
             f"${loan.remaining_balance:.2f}",
             loan.get_status_display(),
             loan.days_overdue or 0
@@ -1307,130 +1142,70 @@ def export_portfolio_csv(queryset, context):
     
     return response
 
+OVERDUE_AMOUNT_RANGES = {'0-1000': (None, 1000), '1001-5000': (1001, 5000), '5001-10000': (5001, 10000), '10000+': (10000, None)}
+
+def filter_overdue_loans(request, loans):
+    """Apply the overdue report's officer, risk and amount filters in the database."""
+    loan_officer_id = request.GET.get('loan_officer')
+    risk_filter = request.GET.get('risk_rating')
+    amount_range = OVERDUE_AMOUNT_RANGES.get(request.GET.get('amount_range'))
+    if loan_officer_id and loan_officer_id.isdigit():
+        loans = loans.filter(loan_officer_id=loan_officer_id)
+    if risk_filter:
+        loans = loans.filter(application__risk_rating=risk_filter)
+    if amount_range:
+        low, high = amount_range
+        loans = loans.filter(**{key: value for key, value in [('remaining_balance__gte', low), ('remaining_balance__lte', high)] if value is not None})
+    return loans
+
+def overdue_loans_in_range(request, book):
+    loans = book.filter(days_overdue__gt=0)
+    days_range = LoanAgingService.bucket_range(request.GET.get('days_overdue'))
+    return loans.filter(LoanAgingService.bucket_filter(*days_range)) if days_range else loans
+
 @login_required
 @role_required([UserProfile.ROLE_ADMIN, UserProfile.ROLE_MANAGER, UserProfile.ROLE_LOAN_OFFICER, UserProfile.ROLE_ACCOUNTANT])
 def overdue_report(request):
     """Generate overdue loans report"""
-    
-    # Get filters from request
     days_filter = request.GET.get('days_overdue', '')
     loan_officer_id = request.GET.get('loan_officer')
-    risk_filter = request.GET.get('risk_rating')
-    amount_filter = request.GET.get('amount_range')
-    
-    # Base queryset - get active loans with overdue payments
-    loans = LoanApplication.objects.filter(
-        status='ACTIVE',
-        remaining_balance__gt=0
-    ).select_related('client_account', 'loan_officer')
-    
-    # Calculate days overdue for each loan (you need to implement this logic)
-    # This is a simplified version - adjust based on your model structure
-    for loan in loans:
-        # Calculate days overdue based on your payment schedule
-        # This is placeholder logic
-        loan.days_overdue = getattr(loan, 'days_overdue', 0) or 0
-    
-    # Apply filters
-    if days_filter:
-        if days_filter == '1-30':
-            loans = [l for l in loans if 1 <= l.days_overdue <= 30]
-        elif days_filter == '31-60':
-            loans = [l for l in loans if 31 <= l.days_overdue <= 60]
-        elif days_filter == '61-90':
-            loans = [l for l in loans if 61 <= l.days_overdue <= 90]
-        elif days_filter == '90+':
-            loans = [l for l in loans if l.days_overdue >= 90]
-    
-    if loan_officer_id:
-        loans = [l for l in loans if l.loan_officer_id == int(loan_officer_id)]
-    
-    if risk_filter:
-        loans = [l for l in loans if l.risk_rating == risk_filter]
-    
-    # Apply amount filter (simplified)
-    if amount_filter:
-        if amount_filter == '0-1000':
-            loans = [l for l in loans if l.remaining_balance <= 1000]
-        elif amount_filter == '1001-5000':
-            loans = [l for l in loans if 1001 <= l.remaining_balance <= 5000]
-        elif amount_filter == '5001-10000':
-            loans = [l for l in loans if 5001 <= l.remaining_balance <= 10000]
-        elif amount_filter == '10000+':
-            loans = [l for l in loans if l.remaining_balance >= 10000]
-    
-    # Convert back to queryset for pagination
-    loan_ids = [loan.id for loan in loans]
-    overdue_loans = LoanApplication.objects.filter(id__in=loan_ids).order_by('-days_overdue')
-    
-    # Calculate summary statistics
-    total_overdue = len(loans)
-    total_amount = sum(loan.remaining_balance for loan in loans)
-    avg_days_overdue = sum(loan.days_overdue for loan in loans) / total_overdue if total_overdue > 0 else 0
-    
-    # Calculate PAR (Portfolio at Risk) by days
-    par_30 = len([l for l in loans if l.days_overdue > 30])
-    par_60 = len([l for l in loans if l.days_overdue > 60])
-    npl_count = len([l for l in loans if l.days_overdue > 90])
-    
-    # Distribution data for chart
-    distribution_data = [
-        len([l for l in loans if 1 <= l.days_overdue <= 30]),
-        len([l for l in loans if 31 <= l.days_overdue <= 60]),
-        len([l for l in loans if 61 <= l.days_overdue <= 90]),
-        len([l for l in loans if l.days_overdue > 90])
-    ]
-    
-    # Officer analysis
-    officer_analysis = []
-    officers = User.objects.filter(loan_applications__in=overdue_loans).distinct()
-    for officer in officers:
-        officer_loans = [l for l in loans if l.loan_officer_id == officer.id]
-        if officer_loans:
-            officer_analysis.append({
-                'name': officer.get_full_name() or officer.username,
-                'count': len(officer_loans),
-                'amount': sum(l.remaining_balance for l in officer_loans),
-                'avg_days': sum(l.days_overdue for l in officer_loans) / len(officer_loans),
-                'risk_score': min(100, sum(l.days_overdue for l in officer_loans) / len(officer_loans) * 10)
-            })
-    
-    # Recovery stats
-    recovery_stats = {
-        'immediate': len([l for l in loans if l.days_overdue >= 60]),
-        'followup': len([l for l in loans if 30 <= l.days_overdue < 60]),
-        'contact_attempts': 0  # You need to implement contact tracking
-    }
-    
-    # Pagination
-    paginator = Paginator(overdue_loans, 25)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+    # Summary and officer figures cover the filtered open book so PAR keeps its denominator; the aging filter narrows the list only.
+    book = filter_overdue_loans(request, LoanAgingService.open_loans())
+    summary = LoanAgingService.summary(book)
+    officer_analysis = [{'name': f"{row['loan_officer__first_name']} {row['loan_officer__last_name']}".strip() or row['loan_officer__username'], 'count': row['overdue_count'], 'amount': row['overdue_balance'], 'avg_days': row['avg_days'], 'par_30_ratio': row['par_30_ratio'], 'risk_score': min(100, row['avg_days'] * 10)} for row in LoanAgingService.by_officer(book)]
+    overdue_loans = LoanAgingService.annotate_buckets(overdue_loans_in_range(request, book)).select_related('client', 'loan_product', 'loan_officer', 'application').order_by('-days_overdue', 'pk')
+    page_obj = Paginator(overdue_loans, 25).get_page(request.GET.get('page'))
+    last_payments = dict(LoanTransaction.objects.filter(loan__in=[loan.pk for loan in page_obj], transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT']).values_list('loan').annotate(last=Max('transaction_date')).order_by())
+    for loan in page_obj:
+        loan.last_payment_date = last_payments.get(loan.pk)
     context = {
         'overdue_loans': page_obj,
         'summary': {
-            'total_overdue': total_overdue,
-            'total_amount': total_amount,
-            'avg_days_overdue': avg_days_overdue,
-            'par_30': par_30,
-            'par_60': par_60,
-            'npl_count': npl_count,
-            'recovery_rate': 0,  # Implement based on your recovery logic
+            'total_overdue': summary['overdue_count'],
+            'total_amount': summary['overdue_balance'],
+            'avg_days_overdue': summary['avg_days'],
+            'par_30': summary['par_30_count'],
+            'par_60': summary['par_60_count'],
+            'npl_count': summary['par_90_count'],
+            'par_30_ratio': summary['par_30_ratio'],
+            'par_60_ratio': summary['par_60_ratio'],
+            'par_90_ratio': summary['par_90_ratio'],
+            'outstanding': summary['outstanding'],
+            'recovery_rate': 0,
         },
+        'aging_analysis': summary['buckets'],
         'days_filter': days_filter,
-        'selected_officer': int(loan_officer_id) if loan_officer_id else None,
-        'risk_filter': risk_filter,
-        'amount_filter': amount_filter,
+        'selected_officer': int(loan_officer_id) if loan_officer_id and loan_officer_id.isdigit() else None,
+        'risk_filter': request.GET.get('risk_rating'),
+        'amount_filter': request.GET.get('amount_range'),
         'loan_officers': User.objects.filter(groups__name='Loan Officer').distinct(),
         'collection_officers': User.objects.filter(groups__name='Collection Officer').distinct(),
-        'distribution_data': distribution_data,
+        'distribution_data': [bucket['count'] for bucket in summary['buckets']],
         'officer_analysis': officer_analysis,
-        'recovery_stats': recovery_stats,
+        'recovery_stats': {'immediate': summary['par_60_count'], 'followup': summary['par_30_count'] - summary['par_60_count'], 'contact_attempts': 0},
         'user_role': get_user_role(request),
         'generated_at': timezone.now(),
     }
-    
     return render(request, 'loans/overdue_report.html', context)
 
 
@@ -1476,138 +1251,33 @@ def collections_report(request):
         if isinstance(end_date, str):
             end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
     
-    # Get payments using LoanTransaction (your actual model)
-    payments = LoanTransaction.objects.filter(
-        transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT'],
-        value_date__range=[start_date, end_date]
-    ).select_related('loan', 'loan__client', 'recorded_by').order_by('-value_date')
-    
-    # Calculate statistics - using 'amount' field (correct field name)
-    total_collections = payments.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    # Today's collections
-    today_collections = LoanTransaction.objects.filter(
-        transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT'],
-        value_date=today
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    # This week collections
-    week_start = today - timedelta(days=today.weekday())
-    week_collections = LoanTransaction.objects.filter(
-        transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT'],
-        value_date__gte=week_start
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    # This month collections
-    month_collections = LoanTransaction.objects.filter(
-        transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT'],
-        value_date__month=today.month,
-        value_date__year=today.year
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    # Payment method breakdown
-    by_method = payments.values('payment_method').annotate(
-        total=Sum('amount'),
-        count=Count('id')
-    ).order_by('-total')
-    
-    # Calculate percentages for payment methods
-    for method in by_method:
-        if total_collections > 0:
-            method['percentage'] = (method['total'] / total_collections) * 100
-        else:
-            method['percentage'] = 0
-    
-    # By officer breakdown
-    by_officer = payments.values('recorded_by__username').annotate(
-        total=Sum('amount'),
-        count=Count('id')
-    ).order_by('-total')
-    
-    # Daily totals for chart
-    daily_totals = {}
-    current_date = start_date
-    while current_date <= end_date:
-        daily_total = payments.filter(value_date=current_date).aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('0')
-        daily_totals[current_date.isoformat()] = float(daily_total)
-        current_date += timedelta(days=1)
-    
-    # Calculate average daily collection
-    days_in_period = (end_date - start_date).days + 1
-    average_daily = total_collections / days_in_period if days_in_period > 0 else Decimal('0')
-    
-    # Pagination
-    page = request.GET.get('page', 1)
-    paginator = Paginator(payments, 50)  # 50 items per page
-    
-    try:
-        payments_page = paginator.page(page)
-    except PageNotAnInteger:
-        payments_page = paginator.page(1)
-    except EmptyPage:
-        payments_page = paginator.page(paginator.num_pages)
-    
-    # Recent payments for activity feed
-    recent_payments = LoanTransaction.objects.filter(
-        transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT']
-    ).order_by('-value_date')[:10]
-    
-    # Handle CSV export
-    export_format = request.GET.get('export')
-    if export_format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="collections_{start_date}_to_{end_date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Date', 'Loan Number', 'Client', 'Payment Method', 'Amount', 'Type', 'Recorded By'])
-        
-        for payment in payments:
-            writer.writerow([
-                payment.value_date,
-                payment.loan.loan_number,
-                payment.loan.client.full_account_name,
-                payment.payment_method,
-                payment.amount,
-                payment.transaction_type,
-                payment.recorded_by.username if payment.recorded_by else 'N/A'
-            ])
-        
-        return response
-    
-    # Prepare context
+    payments = CollectionsAnalyticsService.payments(start_date, end_date).select_related('loan', 'loan__client', 'recorded_by').order_by('-value_date', '-pk')
+    if request.GET.get('export') == 'csv':
+        fields = ['value_date', 'loan__loan_number', 'loan__client__account_type', 'loan__client__person1_first_name', 'loan__client__person1_last_name', 'loan__client__person2_first_name', 'loan__client__person2_last_name', 'payment_method', 'amount', 'transaction_type', 'recorded_by__username']
+        rows = ((value_date, loan_number, ClientAccount.format_account_name(*names), method, amount, transaction_type, username or 'N/A') for value_date, loan_number, *names, method, amount, transaction_type, username in stream_rows(payments, fields))
+        return streaming_csv_response(f'collections_{start_date}_to_{end_date}.csv', ['Date', 'Loan Number', 'Client', 'Payment Method', 'Amount', 'Type', 'Recorded By'], rows)
+    analytics = CollectionsAnalyticsService.analytics(start_date, end_date, today)
     context = {
-        'payments': payments_page,
-        'start_date': start_date.isoformat() if isinstance(start_date, date) else start_date,
-        'end_date': end_date.isoformat() if isinstance(end_date, date) else end_date,
+        'payments': Paginator(payments, 50).get_page(request.GET.get('page')),
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
         'period': period,
-        'total_collections': total_collections,
-        'today_collections': today_collections,
-        'week_collections': week_collections,
-        'month_collections': month_collections,
-        'payment_count': payments.count(),
-        'today_count': LoanTransaction.objects.filter(
-            transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT'],
-            value_date=today
-        ).count(),
-        'week_count': LoanTransaction.objects.filter(
-            transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT'],
-            value_date__gte=week_start
-        ).count(),
-        'month_count': LoanTransaction.objects.filter(
-            transaction_type__in=['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT'],
-            value_date__month=today.month,
-            value_date__year=today.year
-        ).count(),
-        'by_method': by_method,
-        'method_breakdown': by_method,  # Alias for template compatibility
-        'by_officer': by_officer,
-        'daily_totals': daily_totals,
-        'average_daily': average_daily,
-        'recent_payments': recent_payments,
+        'total_collections': analytics['summary']['total_collected'],
+        'payment_count': analytics['summary']['total_transactions'],
+        'today_collections': analytics['today']['total'],
+        'today_count': analytics['today']['count'],
+        'week_collections': analytics['week']['total'],
+        'week_count': analytics['week']['count'],
+        'month_collections': analytics['month']['total'],
+        'month_count': analytics['month']['count'],
+        'by_method': analytics['by_method'],
+        'method_breakdown': analytics['by_method'],
+        'by_officer': analytics['by_officer'],
+        'daily_totals': {row['date'].isoformat(): float(row['total']) for row in analytics['by_day']},
+        'weekly_totals': {row['week'].isoformat(): float(row['total']) for row in analytics['by_week']},
+        'average_daily': analytics['summary']['average_daily'],
+        'recent_payments': LoanTransaction.objects.filter(transaction_type__in=CollectionsAnalyticsService.COLLECTION_TYPES).select_related('loan__client', 'recorded_by').order_by('-value_date', '-pk')[:10],
     }
-    
     return render(request, 'loans/collections_report.html', context)
 
 @login_required
@@ -1645,210 +1315,69 @@ def export_collections_csv(request):
 @login_required
 def bulk_payment(request):
     """View for bulk payment processing"""
-    # Get active loans for dropdown
-    active_loans = LoanApplication.objects.filter(
-        status='DISBURSED'
-    ).select_related('client_account')
-    
-    # Prepare loan data for JavaScript
-    loans_data = []
-    for loan in active_loans:
-        loans_data.append({
-            'id': loan.id,
-            'number': loan.application_number,
-            'client': loan.client_account.full_account_name,
-            'balance': float(loan.get_balance_remaining()),
-            'balance_formatted': f"{loan.get_balance_remaining():,.2f} UGX"
-        })
-    
-    context = {
-        'active_loans': active_loans,
-        'active_loans_json': json.dumps(loans_data),
-        'today': timezone.now().date(),
-    }
+    active_loans = Loan.objects.filter(status__in=BulkPaymentImportService.PAYABLE_STATUSES).select_related('client').order_by('loan_number')
+    loans_data = [{'id': loan.id, 'number': loan.loan_number, 'client': loan.client.full_account_name, 'balance': float(loan.remaining_balance), 'balance_formatted': f'{loan.remaining_balance:,.2f} UGX'} for loan in active_loans]
+    context = {'active_loans': active_loans, 'active_loans_json': json.dumps(loans_data), 'today': timezone.now().date(), 'error_count': len(request.session.get('bulk_payment_errors', []))}
     return render(request, 'loans/bulk_payment.html', context)
 
 @login_required
-@transaction.atomic
+@require_http_methods(["POST"])
 def process_bulk_payments(request):
-    """Process uploaded CSV file for bulk payments"""
-    if request.method == 'POST' and request.FILES.get('csv_file'):
-        csv_file = request.FILES['csv_file']
-        
-        # Read CSV file
-        try:
-            # Try different encodings
-            content = csv_file.read().decode('utf-8')
-        except UnicodeDecodeError:
-            try:
-                content = csv_file.read().decode('latin-1')
-            except UnicodeDecodeError:
-                content = csv_file.read().decode('cp1252')
-        
-        io_string = io.StringIO(content)
-        
-        # Parse CSV
-        reader = csv.DictReader(io_string)
-        required_columns = ['loan_application_number', 'payment_amount']
-        
-        # Validate columns
-        if not all(col in reader.fieldnames for col in required_columns):
-            messages.error(request, f'CSV must contain columns: {", ".join(required_columns)}')
-            return redirect('bulk_payment')
-        
-        # Process rows
-        success_count = 0
-        error_rows = []
-        
-        for i, row in enumerate(reader, start=2):  # start=2 for Excel row numbers
-            try:
-                # Get loan application
-                app_number = row['loan_application_number'].strip()
-                loan_app = LoanApplication.objects.get(application_number=app_number)
-                
-                # Validate loan status
-                if loan_app.status != 'DISBURSED':
-                    error_rows.append(f"Row {i}: Loan {app_number} is not active")
-                    continue
-                
-                # Get payment amount
-                payment_amount = Decimal(row['payment_amount'].replace(',', ''))
-                
-                # Check if payment exceeds balance
-                balance = loan_app.get_balance_remaining()
-                if payment_amount > balance:
-                    error_rows.append(f"Row {i}: Payment {payment_amount} exceeds balance {balance}")
-                    continue
-                
-                # Get optional fields
-                transaction_ref = row.get('transaction_reference', '').strip()
-                notes = row.get('notes', '').strip()
-                payment_method = request.POST.get('default_payment_method', 'CASH')
-                payment_date_str = request.POST.get('payment_date')
-                
-                # Create payment
-                payment = LoanPayment(
-                    loan_application=loan_app,
-                    payment_amount=payment_amount,
-                    payment_method=payment_method,
-                    received_by=request.user,
-                    transaction_reference=transaction_ref,
-                    notes=notes
-                )
-                
-                # Set custom payment date if provided
-                if payment_date_str:
-                    payment_date = timezone.datetime.strptime(payment_date_str, '%Y-%m-%d').date()
-                    payment.payment_date = timezone.make_aware(
-                        timezone.datetime.combine(payment_date, timezone.datetime.min.time())
-                    )
-                
-                # Save payment
-                payment.full_clean()
-                payment.save()
-                success_count += 1
-                
-            except LoanApplication.DoesNotExist:
-                error_rows.append(f"Row {i}: Loan application {row['loan_application_number']} not found")
-            except ValidationError as e:
-                error_rows.append(f"Row {i}: Validation error - {e}")
-            except (ValueError, KeyError) as e:
-                error_rows.append(f"Row {i}: Data error - {e}")
-        
-        # Show results
-        if success_count > 0:
-            messages.success(request, f'Successfully processed {success_count} payments')
-        
-        if error_rows:
-            messages.warning(request, f'{len(error_rows)} rows had errors. See details below.')
-            for error in error_rows[:10]:  # Show first 10 errors
-                messages.info(request, error)
-            if len(error_rows) > 10:
-                messages.info(request, f'... and {len(error_rows) - 10} more errors')
-        
-        return redirect('payments_list')
-    
-    return redirect('bulk_payment')
+    """Validate or apply a CSV of payments, streamed and processed in chunks"""
+    csv_file = request.FILES.get('csv_file')
+    if csv_file is None or not csv_file.name.lower().endswith('.csv'):
+        messages.error(request, 'Please upload a CSV file.')
+        return redirect('loans:bulk_payment')
+    try:
+        payment_date = datetime.strptime(request.POST['payment_date'], '%Y-%m-%d').date() if request.POST.get('payment_date') else None
+        report = BulkPaymentImportService.import_csv(csv_file, request.user, payment_method=request.POST.get('default_payment_method', 'CASH'), payment_date=payment_date, dry_run=bool(request.POST.get('validate_only')))
+    except (ValueError, UnicodeDecodeError) as e:
+        messages.error(request, f'Error processing file: {e}')
+        return redirect('loans:bulk_payment')
+    bulk_payment_report(request, report)
+    return redirect('loans:bulk_payment')
 
 @login_required
-@transaction.atomic
+@require_http_methods(["POST"])
 def save_bulk_payments(request):
     """Save multiple payments from manual entry form"""
-    if request.method == 'POST':
-        payment_date_str = request.POST.get('payment_date')
-        payment_method = request.POST.get('payment_method', 'CASH')
-        
-        success_count = 0
-        errors = []
-        
-        # Find all payment entries
-        i = 1
-        while True:
-            loan_key = f'loan_application_{i}'
-            if loan_key not in request.POST:
-                break
-            
-            loan_id = request.POST.get(loan_key)
-            if not loan_id:
-                i += 1
-                continue
-            
-            try:
-                loan_app = LoanApplication.objects.get(id=loan_id)
-                
-                # Get payment data
-                amount_key = f'payment_amount_{i}'
-                ref_key = f'transaction_ref_{i}'
-                notes_key = f'notes_{i}'
-                
-                payment_amount = Decimal(request.POST.get(amount_key, 0))
-                
-                if payment_amount <= 0:
-                    i += 1
-                    continue
-                
-                # Create payment
-                payment = LoanPayment(
-                    loan_application=loan_app,
-                    payment_amount=payment_amount,
-                    payment_method=payment_method,
-                    received_by=request.user,
-                    transaction_reference=request.POST.get(ref_key, ''),
-                    notes=request.POST.get(notes_key, '')
-                )
-                
-                # Set custom payment date
-                if payment_date_str:
-                    payment_date = timezone.datetime.strptime(payment_date_str, '%Y-m-%d').date()
-                    payment.payment_date = timezone.make_aware(
-                        timezone.datetime.combine(payment_date, timezone.datetime.min.time())
-                    )
-                
-                payment.full_clean()
-                payment.save()
-                success_count += 1
-                
-            except LoanApplication.DoesNotExist:
-                errors.append(f"Entry {i}: Loan not found")
-            except ValidationError as e:
-                errors.append(f"Entry {i}: {e}")
-            except (ValueError, KeyError) as e:
-                errors.append(f"Entry {i}: Data error - {e}")
-            
-            i += 1
-        
-        # Show results
-        if success_count > 0:
-            messages.success(request, f'Successfully saved {success_count} payments')
-        
-        if errors:
-            messages.warning(request, f'{len(errors)} entries had errors')
-            for error in errors[:5]:
-                messages.info(request, error)
-        
-        return redirect('payments_list')
-    
-    return redirect('bulk_payment')
+    entries = []
+    i = 1
+    while f'loan_application_{i}' in request.POST:
+        if request.POST.get(f'loan_application_{i}'):
+            entries.append({'row': i, 'loan': request.POST[f'loan_application_{i}'], 'amount': request.POST.get(f'payment_amount_{i}', '').strip(), 'reference_number': request.POST.get(f'transaction_ref_{i}', '').strip(), 'notes': request.POST.get(f'notes_{i}', '').strip(), 'payment_method': '', 'payment_date': ''})
+        i += 1
+    loan_numbers = dict(Loan.objects.filter(pk__in=[entry['loan'] for entry in entries if entry['loan'].isdigit()]).values_list('pk', 'loan_number'))
+    for entry in entries:
+        entry['loan'] = loan_numbers.get(int(entry['loan']), entry['loan']) if entry['loan'].isdigit() else entry['loan']
+    try:
+        payment_date = datetime.strptime(request.POST['payment_date'], '%Y-%m-%d').date() if request.POST.get('payment_date') else None
+    except ValueError:
+        messages.error(request, 'Invalid payment date.')
+        return redirect('loans:bulk_payment')
+    bulk_payment_report(request, BulkPaymentImportService.run(entries, request.user, payment_method=request.POST.get('payment_method', 'CASH'), payment_date=payment_date, dry_run=False))
+    return redirect('loans:bulk_payment')
+
+def bulk_payment_report(request, report):
+    # The session row is loaded on every request, so it only keeps the head of a large error report.
+    request.session['bulk_payment_errors'] = report['errors'][:BulkPaymentImportService.ERROR_REPORT_LIMIT]
+    if report['refused']:
+        messages.error(request, f"No payments were posted: {len(report['errors'])} of {report['rows']} row(s) failed validation. Fix them and upload the file again.")
+    elif report['dry_run']:
+        messages.info(request, f"Validated {report['rows']} rows in {report['elapsed']:.1f}s: {report['valid']} valid payments totalling {report['total_amount']:,.2f}. No payments were posted.")
+    elif report['applied']:
+        messages.success(request, f"Successfully processed {report['applied']} payment(s) totalling {report['total_amount']:,.2f} in {report['elapsed']:.1f}s.")
+    if report['errors']:
+        messages.warning(request, f"{len(report['errors'])} row(s) had errors: " + '; '.join(f"Row {error['row']}: {error['error']}" for error in report['errors'][:5]) + ('...' if len(report['errors']) > 5 else ''))
+    if len(report['errors']) > BulkPaymentImportService.ERROR_REPORT_LIMIT:
+        messages.info(request, f"The downloadable error report holds the first {BulkPaymentImportService.ERROR_REPORT_LIMIT} errors; use the import_payments command with --errors for the full list.")
+
+@login_required
+def download_bulk_payment_errors(request):
+    """Download the per-row error report of the last bulk payment import"""
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="bulk_payment_errors.csv"'
+    return BulkPaymentImportService.write_error_report(request.session.get('bulk_payment_errors', []), response)
 
 @login_required
 def download_bulk_template(request):
@@ -1861,22 +1390,22 @@ def download_bulk_template(request):
     writer = csv.writer(response)
     
     if template_type == 'simple':
-        writer.writerow(['loan_application_number', 'payment_amount', 'transaction_reference'])
-        writer.writerow(['AN1234', '150000', 'TRX001'])
-        writer.writerow(['AN5678', '75000', 'TRX002'])
-        writer.writerow(['AN9012', '200000', ''])
+        writer.writerow(['loan_number', 'amount', 'transaction_reference'])
+        writer.writerow(['LN-202401-00001', '150000', 'TRX001'])
+        writer.writerow(['LN-202401-00002', '75000', 'TRX002'])
+        writer.writerow(['LN-202401-00003', '200000', ''])
     
     elif template_type == 'detailed':
         writer.writerow([
-            'loan_application_number',
-            'payment_amount',
+            'loan_number',
+            'amount',
             'payment_method',
             'transaction_reference',
             'notes',
             'payment_date'
         ])
         writer.writerow([
-            'AN1234',
+            'LN-202401-00001',
             '150000',
             'CASH',
             'TRX001',
@@ -1886,13 +1415,13 @@ def download_bulk_template(request):
     
     elif template_type == 'sample':
         # Add sample data for existing loans
-        writer.writerow(['loan_application_number', 'payment_amount', 'transaction_reference'])
+        writer.writerow(['loan_number', 'amount', 'transaction_reference'])
         
         # Get some real loan numbers for sample
-        loans = LoanApplication.objects.filter(status='DISBURSED')[:3]
+        loans = Loan.objects.filter(status__in=BulkPaymentImportService.PAYABLE_STATUSES)[:3]
         for loan in loans:
             writer.writerow([
-                loan.application_number,
+                loan.loan_number,
                 '50000',
                 f'SMP{loan.id}'
             ])
@@ -1900,339 +1429,72 @@ def download_bulk_template(request):
     return response
 
 
-@login_required
-@require_http_methods(["POST"])
-def process_bulk_payments(request):
-    """Process bulk payments from CSV file"""
-    
-    if 'csv_file' not in request.FILES:
-        messages.error(request, 'Please upload a CSV file.')
-        return redirect('loans:bulk_payment')
-    
-    csv_file = request.FILES['csv_file']
-    
-    # Check file extension
-    if not csv_file.name.endswith('.csv'):
-        messages.error(request, 'File must be in CSV format.')
-        return redirect('loans:bulk_payment')
-    
-    try:
-        # Read CSV file
-        decoded_file = csv_file.read().decode('utf-8')
-        io_string = io.StringIO(decoded_file)
-        reader = csv.DictReader(io_string)
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        # Process each row
-        with transaction.atomic():
-            for row_num, row in enumerate(reader, start=2):  # Start at 2 (after header)
-                try:
-                    # Get loan by loan number
-                    loan_number = row.get('loan_number', '').strip()
-                    amount = row.get('amount', '').strip()
-                    payment_method = row.get('payment_method', 'CASH').strip().upper()
-                    payment_date = row.get('payment_date', '').strip()
-                    
-                    # Validate required fields
-                    if not loan_number or not amount:
-                        errors.append(f"Row {row_num}: Missing required fields")
-                        error_count += 1
-                        continue
-                    
-                    # Get loan
-                    try:
-                        loan = Loan.objects.get(loan_number=loan_number)
-                    except Loan.DoesNotExist:
-                        errors.append(f"Row {row_num}: Loan {loan_number} not found")
-                        error_count += 1
-                        continue
-                    
-                    # Convert amount
-                    try:
-                        payment_amount = Decimal(amount)
-                    except:
-                        errors.append(f"Row {row_num}: Invalid amount format")
-                        error_count += 1
-                        continue
-                    
-                    # Parse date
-                    if payment_date:
-                        try:
-                            from datetime import datetime
-                            payment_date_obj = datetime.strptime(payment_date, '%Y-%m-%d').date()
-                        except:
-                            payment_date_obj = timezone.now().date()
-                    else:
-                        payment_date_obj = timezone.now().date()
-                    
-                    # Create transaction
-                    LoanTransaction.objects.create(
-                        loan=loan,
-                        transaction_type='PRINCIPAL_PAYMENT',
-                        amount=payment_amount,
-                        payment_method=payment_method,
-                        value_date=payment_date_obj,
-                        recorded_by=request.user,
-                        description=f'Bulk payment import - Row {row_num}'
-                    )
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {row_num}: {str(e)}")
-                    error_count += 1
-        
-        # Show results
-        if success_count > 0:
-            messages.success(request, f'Successfully processed {success_count} payment(s).')
-        
-        if error_count > 0:
-            error_message = f'{error_count} payment(s) failed:<br>'
-            error_message += '<br>'.join(errors[:10])  # Show first 10 errors
-            if len(errors) > 10:
-                error_message += f'<br>...and {len(errors) - 10} more errors'
-            messages.warning(request, error_message)
-        
-    except Exception as e:
-        messages.error(request, f'Error processing file: {str(e)}')
-    
-    return redirect('loans:bulk_payment')
-
-
-
-
 @login_required
 def bulk_disbursement(request):
     """View for bulk loan disbursement"""
-    # Get approved loans ready for disbursement
-    approved_loans = LoanApplication.objects.filter(
-        status='APPROVED'
-    ).select_related('client_account', 'loan_product').order_by('application_date')
-    
-    # Get recent disbursements for reference
-    recent_disbursements = LoanApplication.objects.filter(
-        status='DISBURSED'
-    ).select_related('client_account').order_by('-disbursement_date')[:10]
-    
-    # Prepare loan data for calculations
-    loans_data = []
-    for loan in approved_loans:
-        loans_data.append({
-            'id': loan.id,
-            'number': loan.application_number,
-            'client': loan.client_account.full_account_name,
-            'amount': float(loan.loan_amount),
-            'interest': float(loan.interest_amount),
-            'total': float(loan.total_amount)
-        })
-    
-    context = {
-        'approved_loans': approved_loans,
-        'recent_disbursements': recent_disbursements,
-        'approved_loans_json': json.dumps(loans_data),
-        'today': timezone.now().date(),
-    }
+    approved_loans = LoanApplication.objects.filter(status='APPROVED', loan__isnull=True).select_related('client', 'loan_product').order_by('approval_date')
+    recent_disbursements = Loan.objects.filter(disbursement_date__isnull=False).select_related('client', 'disbursed_by', 'disbursement_batch').order_by('-disbursement_date', '-pk')[:10]
+    loans_data = [{'id': loan.id, 'number': loan.application_number, 'client': loan.client.full_account_name, 'amount': float(loan.approved_amount or 0), 'interest': float(loan.total_interest_amount), 'total': float(loan.total_repayment_amount)} for loan in approved_loans]
+    context = {'approved_loans': approved_loans, 'recent_disbursements': recent_disbursements, 'approved_loans_json': json.dumps(loans_data), 'today': timezone.now().date()}
     return render(request, 'loans/bulk_disbursement.html', context)
 
+def parse_disbursement_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return timezone.now().date()
+
+def bulk_disbursement_report(request, report, validate_only=False):
+    if validate_only:
+        messages.info(request, f"Validation passed for {report['valid']} of {report['requested']} loans")
+    elif report['disbursed']:
+        messages.success(request, f"Successfully disbursed {report['disbursed']} loans ({report['total_disbursed']:,.2f} UGX) in batch {report['batch'].batch_number}")
+    if report['errors']:
+        messages.warning(request, f"{len(report['errors'])} errors occurred")
+        for error in report['errors'][:5]:
+            messages.error(request, error)
+        if len(report['errors']) > 5:
+            messages.info(request, f"... and {len(report['errors']) - 5} more errors")
+
 @login_required
-@transaction.atomic
+@require_http_methods(["POST"])
 def process_bulk_disbursement(request):
     """Process multiple loan disbursements"""
-    if request.method == 'POST':
-        loan_ids = request.POST.getlist('loan_ids')
-        disbursement_date_str = request.POST.get('disbursement_date')
-        disbursement_method = request.POST.get('disbursement_method', 'CASH')
-        transaction_prefix = request.POST.get('transaction_prefix', 'DISB-')
-        disbursement_notes = request.POST.get('disbursement_notes', '')
-        
-        if not loan_ids:
-            messages.error(request, 'Please select at least one loan to disburse.')
-            return redirect('bulk_disbursement')
-        
-        success_count = 0
-        errors = []
-        
-        # Parse disbursement date
-        try:
-            disbursement_date = datetime.strptime(disbursement_date_str, '%Y-%m-%d').date()
-            disbursement_datetime = timezone.make_aware(
-                datetime.combine(disbursement_date, datetime.min.time())
-            )
-        except (ValueError, TypeError):
-            disbursement_datetime = timezone.now()
-        
-        for i, loan_id in enumerate(loan_ids):
-            try:
-                loan = LoanApplication.objects.get(id=loan_id)
-                
-                # Validate loan is approved
-                if loan.status != 'APPROVED':
-                    errors.append(f"Loan {loan.application_number} is not approved (status: {loan.status})")
-                    continue
-                
-                # Check if already disbursed
-                if loan.disbursement_date:
-                    errors.append(f"Loan {loan.application_number} was already disbursed on {loan.disbursement_date.date()}")
-                    continue
-                
-                # Generate transaction reference
-                transaction_ref = f"{transaction_prefix}{loan.application_number}"
-                
-                # Update loan for disbursement
-                loan.status = 'DISBURSED'
-                loan.disbursement_date = disbursement_datetime
-                loan.disbursed_by = request.user
-                loan.disbursed_amount = loan.loan_amount
-                loan.transaction_reference = transaction_ref
-                loan.disbursement_notes = disbursement_notes
-                
-                # Set due date based on loan period
-                loan.due_date = loan.calculate_due_date()
-                
-                # Save the loan
-                loan.save()
-                success_count += 1
-                
-                # Log the action
-                messages.info(request, f"✓ Disbursed {loan.application_number}: {loan.loan_amount} UGX to {loan.client_account.full_account_name}")
-                
-            except LoanApplication.DoesNotExist:
-                errors.append(f"Loan with ID {loan_id} not found")
-            except ValidationError as e:
-                errors.append(f"Loan {loan_id}: {e}")
-            except Exception as e:
-                errors.append(f"Error processing loan {loan_id}: {str(e)}")
-        
-        # Show results
-        if success_count > 0:
-            messages.success(request, f'Successfully disbursed {success_count} loans')
-        
-        if errors:
-            messages.warning(request, f'{len(errors)} errors occurred')
-            for error in errors[:5]:  # Show first 5 errors
-                messages.error(request, error)
-            if len(errors) > 5:
-                messages.info(request, f'... and {len(errors) - 5} more errors')
-        
-        return redirect('loan_applications_list')
-    
-    return redirect('bulk_disbursement')
+    loan_ids = [pk for pk in request.POST.getlist('loan_ids') if pk.isdigit()]
+    if not loan_ids:
+        messages.error(request, 'Please select at least one loan to disburse.')
+        return redirect('loans:bulk_disbursement')
+    disbursement_date = parse_disbursement_date(request.POST.get('disbursement_date'))
+    report = BulkDisbursementService.disburse_applications(loan_ids, request.user, disbursement_date, request.POST.get('disbursement_method', 'CASH'), reference_prefix=request.POST.get('transaction_prefix', 'DISB-'), notes=request.POST.get('disbursement_notes', ''))
+    bulk_disbursement_report(request, report)
+    return redirect('loans:bulk_disbursement')
 
 @login_required
-@transaction.atomic
+@require_http_methods(["POST"])
 def upload_bulk_disbursement(request):
     """Process CSV upload for bulk disbursement"""
-    if request.method == 'POST' and request.FILES.get('csv_file'):
-        csv_file = request.FILES['csv_file']
-        
-        # Read CSV file
-        try:
-            content = csv_file.read().decode('utf-8')
-        except UnicodeDecodeError:
-            try:
-                content = csv_file.read().decode('latin-1')
-            except UnicodeDecodeError:
-                content = csv_file.read().decode('cp1252')
-        
-        io_string = io.StringIO(content)
-        
-        # Parse CSV
-        reader = csv.DictReader(io_string)
-        required_columns = ['loan_application_number']
-        
-        # Validate columns
-        if not all(col in reader.fieldnames for col in required_columns):
-            messages.error(request, f'CSV must contain column: {", ".join(required_columns)}')
-            return redirect('bulk_disbursement')
-        
-        # Get form data
-        disbursement_date_str = request.POST.get('disbursement_date')
-        disbursement_method = request.POST.get('disbursement_method', 'CASH')
-        transaction_prefix = request.POST.get('transaction_prefix', 'DISB-')
-        validate_only = request.POST.get('validate_only') == 'on'
-        
-        # Parse disbursement date
-        try:
-            disbursement_date = datetime.strptime(disbursement_date_str, '%Y-%m-%d').date()
-            disbursement_datetime = timezone.make_aware(
-                datetime.combine(disbursement_date, datetime.min.time())
-            )
-        except (ValueError, TypeError):
-            disbursement_datetime = timezone.now()
-        
-        # Process rows
-        success_count = 0
-        error_rows = []
-        
-        for i, row in enumerate(reader, start=2):  # start=2 for Excel row numbers
-            try:
-                # Get loan application
-                app_number = row['loan_application_number'].strip()
-                loan = LoanApplication.objects.get(application_number=app_number)
-                
-                # Validate loan
-                if loan.status != 'APPROVED':
-                    error_rows.append(f"Row {i}: Loan {app_number} is not approved (status: {loan.status})")
-                    continue
-                
-                if loan.disbursement_date:
-                    error_rows.append(f"Row {i}: Loan {app_number} already disbursed")
-                    continue
-                
-                # Get transaction reference from CSV or generate
-                transaction_ref = row.get('transaction_reference', '').strip()
-                if not transaction_ref:
-                    transaction_ref = f"{transaction_prefix}{app_number}"
-                
-                # Get specific notes for this loan
-                specific_notes = row.get('disbursement_notes', '').strip()
-                
-                if not validate_only:
-                    # Update loan for disbursement
-                    loan.status = 'DISBURSED'
-                    loan.disbursement_date = disbursement_datetime
-                    loan.disbursed_by = request.user
-                    loan.disbursed_amount = loan.loan_amount
-                    loan.transaction_reference = transaction_ref
-                    loan.disbursement_notes = specific_notes or request.POST.get('general_notes', '')
-                    
-                    # Set due date
-                    loan.due_date = loan.calculate_due_date()
-                    
-                    # Save the loan
-                    loan.save()
-                
-                success_count += 1
-                
-            except LoanApplication.DoesNotExist:
-                error_rows.append(f"Row {i}: Loan application {app_number} not found")
-            except ValidationError as e:
-                error_rows.append(f"Row {i}: Validation error - {e}")
-            except Exception as e:
-                error_rows.append(f"Row {i}: Error - {str(e)}")
-        
-        # Show results
-        if validate_only:
-            if success_count > 0:
-                messages.info(request, f'Validation passed for {success_count} loans')
-            if error_rows:
-                messages.warning(request, f'{len(error_rows)} validation errors found')
-                for error in error_rows[:10]:
-                    messages.info(request, error)
-        else:
-            if success_count > 0:
-                messages.success(request, f'Successfully disbursed {success_count} loans')
-            if error_rows:
-                messages.warning(request, f'{len(error_rows)} errors occurred')
-                for error in error_rows[:5]:
-                    messages.error(request, error)
-        
-        return redirect('loan_applications_list')
-    
-    return redirect('bulk_disbursement')
+    csv_file = request.FILES.get('csv_file')
+    if csv_file is None:
+        messages.error(request, 'Please upload a CSV file.')
+        return redirect('loans:bulk_disbursement')
+    try:
+        rows = list(csv.DictReader(io.TextIOWrapper(csv_file.file, encoding='utf-8-sig', newline='')))
+    except (UnicodeDecodeError, csv.Error) as e:
+        messages.error(request, f'Error reading file: {e}')
+        return redirect('loans:bulk_disbursement')
+    if not rows or 'loan_application_number' not in rows[0]:
+        messages.error(request, 'CSV must contain column: loan_application_number')
+        return redirect('loans:bulk_disbursement')
+    numbers = {(row.get('loan_application_number') or '').strip(): row for row in rows}
+    applications = dict(LoanApplication.objects.filter(application_number__in=numbers).values_list('application_number', 'pk'))
+    details = {applications[number]: {'reference': (row.get('transaction_reference') or '').strip(), 'notes': (row.get('disbursement_notes') or '').strip()} for number, row in numbers.items() if number in applications}
+    disbursement_date = parse_disbursement_date(request.POST.get('disbursement_date'))
+    validate_only = request.POST.get('validate_only') == 'on'
+    report = BulkDisbursementService.disburse_applications(list(details), request.user, disbursement_date, request.POST.get('disbursement_method', 'CASH'), reference_prefix=request.POST.get('transaction_prefix', 'DISB-'), details=details, notes=request.POST.get('general_notes', ''), validate_only=validate_only)
+    report['errors'] = [f'Loan application {number or "(blank)"} not found' for number in numbers if number not in applications] + report['errors']
+    report['requested'] += len(numbers) - len(details)
+    bulk_disbursement_report(request, report, validate_only)
+    return redirect('loans:bulk_disbursement')
 
 @login_required
 def download_disbursement_template(request):
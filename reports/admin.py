@@ -13,7 +13,7 @@ from .utils import generate_periodic_report
 class SystemReportAdmin(admin.ModelAdmin):
     list_display = ['report_type', 'report_date', 'total_accounts', 'total_savings', 'total_loans_disbursed', 'total_loans_pending', 'total_loans_approved', 'total_loans_completed', 'total_loans_defaulted', 'total_interest_earned', 'generated_by', 'generated_at']
     list_filter = ['report_type', 'report_date', 'generated_by']
-    readonly_fields = ['generated_at', 'chart_image', 'staff_loan_counts', 'staff_savings_counts']
+    readonly_fields = ['generated_at', 'chart_image', 'staff_loan_counts', 'staff_savings_counts', 'staff_metrics']
     actions = ['generate_daily_report', 'generate_weekly_report', 'generate_monthly_report', 'export_to_csv']
 
     def report_details(self, obj):
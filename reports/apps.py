@@ -3,6 +3,3 @@ from django.apps import AppConfig
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
-
-def ready(self):
-    import reports.signals
\ No newline at end of file
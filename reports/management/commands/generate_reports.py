@@ -0,0 +1,40 @@
+import datetime
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.models import JobLock
+from reports.models import SystemReport
+from reports.utils import generate_periodic_report
+
+class Command(BaseCommand):
+    help = 'Build the periodic SystemReport once per period; meant to be run from cron on any number of hosts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=[code for code, label in SystemReport.REPORT_TYPES], default='DAILY')
+        parser.add_argument('--date', help='Report date (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--force', action='store_true', help='Rebuild the report even if one already exists for the date')
+        parser.add_argument('--no-chart', action='store_true', help='Skip rendering the chart image')
+        parser.add_argument('--generated-by', help='Username recorded on the report, left empty by default')
+
+    def handle(self, *args, **options):
+        try:
+            report_date = datetime.date.fromisoformat(options['date']) if options['date'] else timezone.now().date()
+        except ValueError:
+            raise CommandError(f"Invalid --date {options['date']!r}, expected YYYY-MM-DD")
+        generated_by = None
+        if options['generated_by']:
+            generated_by = User.objects.filter(username=options['generated_by']).first()
+            if generated_by is None:
+                raise CommandError(f"Unknown user {options['generated_by']!r}")
+        period = options['period']
+        with JobLock.hold(f'report:{period}:{report_date}') as acquired:
+            if not acquired:
+                self.stdout.write(f'{period} report for {report_date} is being built elsewhere, skipping')
+                return
+            if not options['force'] and SystemReport.objects.filter(report_type=period, report_date=report_date).exists():
+                self.stdout.write(f'{period} report for {report_date} already exists')
+                return
+            started = time.perf_counter()
+            report = generate_periodic_report(user=generated_by, period=period, report_date=report_date, render_chart=not options['no_chart'])
+        self.stdout.write(self.style.SUCCESS(f'{period} report for {report_date} built (id {report.pk}) in {time.perf_counter() - started:.2f}s'))
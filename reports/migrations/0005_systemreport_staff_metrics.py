@@ -0,0 +1,6 @@
+import django.core.serializers.json
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('reports', '0004_alter_systemreport_options_activitylog_extra_info_and_more')]
+    operations = [migrations.AddField(model_name='systemreport', name='staff_metrics', field=models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder))]
@@ -0,0 +1,6 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('reports', '0005_systemreport_staff_metrics')]
+    operations = [migrations.AlterField(model_name='activitylog', name='timestamp', field=models.DateTimeField(default=django.utils.timezone.now, editable=False))]
@@ -0,0 +1,5 @@
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+    dependencies = [('reports', '0006_activitylog_timestamp_default')]
+    operations = [migrations.AddIndex(model_name='activitylog', index=models.Index(fields=['timestamp'], name='reports_act_timesta_5dc48a_idx')), migrations.AddIndex(model_name='activitylog', index=models.Index(fields=['user', 'timestamp'], name='reports_act_user_id_8be292_idx'))]
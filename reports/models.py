@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
 from decimal import Decimal
@@ -10,10 +11,13 @@ def report_chart_path(instance, filename):
 class ActivityLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     action = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     extra_info = models.JSONField(default=dict, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['timestamp']), models.Index(fields=['user', 'timestamp'])]
+
     def __str__(self):
         return f'{self.user.username} - {self.action} ({self.timestamp})'
 
@@ -34,6 +38,7 @@ class SystemReport(models.Model):
     total_interest_earned = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     staff_loan_counts = models.JSONField(default=dict)
     staff_savings_counts = models.JSONField(default=dict)
+    staff_metrics = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
     chart_image = models.ImageField(upload_to=report_chart_path, null=True, blank=True)
     pdf_file = models.FileField(upload_to='reports/pdfs/', null=True, blank=True)
     total_guarantors = models.IntegerField(default=0)
@@ -1 +1,75 @@
-from django.test import TestCase
\ No newline at end of file
+import datetime
+import io
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from client_accounts.models import ClientAccount, SavingsTransaction
+from loans.models import LoanApplication, LoanProduct
+from core.models import JobLock
+from .models import SystemReport
+from .utils import generate_periodic_report, render_report_chart
+
+class GenerateReportsCommandTests(TestCase):
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('generate_reports', '--date', '2026-01-05', '--no-chart', *args, stdout=out)
+        return out.getvalue()
+
+    def test_builds_the_daily_report_once(self):
+        self.run_command()
+        self.assertIn('already exists', self.run_command())
+        self.run_command('--force')
+        self.assertEqual(SystemReport.objects.filter(report_type='DAILY', report_date=datetime.date(2026, 1, 5)).count(), 1)
+
+    def test_skips_while_another_host_holds_the_lock(self):
+        self.assertTrue(JobLock.acquire('report:DAILY:2026-01-05', 'other-host:1', datetime.timedelta(minutes=5)))
+        self.assertIn('being built elsewhere', self.run_command())
+        self.assertFalse(SystemReport.objects.exists())
+        JobLock.release('report:DAILY:2026-01-05', 'other-host:1')
+        self.run_command()
+        self.assertTrue(SystemReport.objects.exists())
+
+    def test_renders_chart_headless(self):
+        self.assertTrue(render_report_chart('DAILY', {'1': 3}, {'1': 2, '2': 4}).startswith(b'\x89PNG'))
+
+
+class StaffMetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', is_staff=True)
+        cls.account = ClientAccount.objects.create(account_type='SINGLE', person1_first_name='Jane', person1_last_name='Doe', person1_contact='0700000000', person1_address='Kampala', person1_area_code='256', person1_next_of_kin='John', person1_nin='CM000000000001', person1_gender='F', business_location='Kampala', business_sector='Retail', loan_officer=cls.manager, created_by=cls.manager)
+        cls.product = LoanProduct.objects.create(name='Business', code='BIZ', annual_interest_rate=Decimal('24.00'), created_by=cls.manager)
+
+    def add_staff(self, start, count):
+        staff = User.objects.bulk_create([User(username=f'staff{n}', is_staff=True) for n in range(start, start + count)])
+        LoanApplication.objects.bulk_create([LoanApplication(application_id=f'APP-{user.username}', application_number=f'AN-{user.username}', client=self.account, loan_product=self.product, requested_amount=Decimal('1000'), requested_term_days=30, purpose='Stock', loan_officer=user, created_by=user) for user in staff])
+        SavingsTransaction.objects.bulk_create([SavingsTransaction(client_account=self.account, transaction_type='DEPOSIT', amount=Decimal('50'), processed_by=user, reference_number=f'SV-{user.username}') for user in staff])
+
+    def test_report_query_count_does_not_grow_with_staff(self):
+        self.add_staff(0, 2)
+        with CaptureQueriesContext(connection) as few:
+            generate_periodic_report(period='MONTHLY', render_chart=False)
+        self.add_staff(2, 20)
+        with CaptureQueriesContext(connection) as many:
+            report = generate_periodic_report(period='MONTHLY', render_chart=False)
+        self.assertEqual(len(many), len(few))
+        self.assertLessEqual(len(many), 12)
+        self.assertEqual(len(report.staff_loan_counts), 22)
+        staff = User.objects.get(username='staff21')
+        report.refresh_from_db()
+        metrics = report.staff_metrics[str(staff.pk)]
+        self.assertEqual((metrics['loans_count'], metrics['savings_count'], Decimal(metrics['deposit_amount']), Decimal(metrics['collected_amount'])), (1, 1, Decimal('50'), Decimal('0')))
+
+    def test_period_figures_stop_at_the_report_date(self):
+        self.add_staff(0, 3)
+        for reference, day in [('SV-staff0', 3), ('SV-staff1', 5), ('SV-staff2', 10)]:
+            SavingsTransaction.objects.filter(reference_number=reference).update(transaction_date=timezone.make_aware(datetime.datetime(2026, 1, day, 12)))
+        report = generate_periodic_report(period='MONTHLY', report_date=datetime.date(2026, 1, 5), render_chart=False)
+        self.assertEqual((report.report_date, report.total_transactions), (datetime.date(2026, 1, 5), 2))
+        self.assertEqual(sum(Decimal(metrics['deposit_amount']) for metrics in report.staff_metrics.values()), Decimal('100'))
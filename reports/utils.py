@@ -1,58 +1,83 @@
 from .models import SystemReport, ActivityLog
 from client_accounts.models import ClientAccount, SavingsTransaction
-from loans.models import LoanApplication, LoanPayment, Guarantor
-from django.contrib.auth.models import User
+from loans.models import Loan, LoanApplication, LoanPayment, LoanTransaction, Guarantor, PortfolioDailySnapshot
 from decimal import Decimal
 from django.utils import timezone
-# import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import io
 from django.core.files.base import ContentFile
-from django.db import models
+from django.db.models import Count, Q, Sum
+from core import audit
 
-def generate_periodic_report(user=None, period='DAILY'):
-    today = timezone.now().date()
-    if period == 'DAILY':
-        start_date = today
-    elif period == 'WEEKLY':
-        start_date = today - timezone.timedelta(days=today.weekday())
+PENDING_APPLICATION_STATUSES = ['SUBMITTED', 'UNDER_REVIEW']
+APPROVED_APPLICATION_STATUSES = ['APPROVED', 'CONDITIONALLY_APPROVED']
+COLLECTION_TYPES = ['PRINCIPAL_PAYMENT', 'INTEREST_PAYMENT', 'LATE_FEE_PAYMENT', 'EARLY_REPAYMENT']
+
+def period_start(period, today):
+    if period == 'WEEKLY':
+        return today - timezone.timedelta(days=today.weekday())
     elif period == 'MONTHLY':
-        start_date = today.replace(day=1)
+        return today.replace(day=1)
     elif period == 'YEARLY':
-        start_date = today.replace(month=1, day=1)
-    else:
-        start_date = today
-    accounts = ClientAccount.objects.all()
-    loans = LoanApplication.objects.all()
-    total_savings = accounts.aggregate(total=models.Sum('savings_balance'))['total'] or Decimal('0')
-    total_loans_disbursed = loans.filter(status='DISBURSED').aggregate(total=models.Sum('loan_amount'))['total'] or Decimal('0')
-    total_loans_pending = loans.filter(status='PENDING').count()
-    total_loans_approved = loans.filter(status='APPROVED').count()
-    total_loans_completed = loans.filter(status='COMPLETED').count()
-    total_loans_defaulted = loans.filter(status='DEFAULTED').count()
-    total_interest_earned = LoanPayment.objects.filter(payment_date__gte=start_date).aggregate(total=models.Sum('payment_amount'))['total'] or Decimal('0')
-    total_guarantors = Guarantor.objects.count()
-    total_savings_transactions = SavingsTransaction.objects.filter(transaction_date__gte=start_date).count()
-    total_loan_payments = LoanPayment.objects.filter(payment_date__gte=start_date).count()
-    total_transactions = total_savings_transactions + total_loan_payments
-    staff_loan_counts = {str(u.id): loans.filter(loan_officer=u).count() for u in User.objects.all()}
-    staff_savings_counts = {str(u.id): SavingsTransaction.objects.filter(processed_by=u).count() for u in User.objects.all()}
-    fig, ax = plt.subplots(figsize=(8, 5))
-    ax.bar(staff_loan_counts.keys(), staff_loan_counts.values(), label='Loans', color='#4CAF50')
-    ax.bar(staff_savings_counts.keys(), staff_savings_counts.values(), bottom=list(staff_loan_counts.values()), label='Savings', color='#2196F3')
+        return today.replace(month=1, day=1)
+    return today
+
+def collect_staff_metrics(start_date, end_date):
+    # One grouped query per source, keyed by user id: all-time counts plus amounts for the period.
+    metrics = {}
+
+    def merge(rows, *fields):
+        for user, *values in rows:
+            entry = metrics.setdefault(str(user), {'loans_count': 0, 'disbursed_amount': Decimal('0'), 'collected_amount': Decimal('0'), 'savings_count': 0, 'deposit_amount': Decimal('0')})
+            entry.update({field: value for field, value in zip(fields, values) if value is not None})
+    merge(LoanApplication.objects.values_list('loan_officer').annotate(count=Count('pk'), amount=Sum('loan__principal_amount', filter=Q(loan__disbursement_date__range=[start_date, end_date]))).order_by(), 'loans_count', 'disbursed_amount')
+    merge(LoanTransaction.objects.filter(transaction_type__in=COLLECTION_TYPES, value_date__range=[start_date, end_date]).values_list('recorded_by').annotate(amount=Sum('amount')).order_by(), 'collected_amount')
+    merge(SavingsTransaction.objects.filter(processed_by__isnull=False).values_list('processed_by').annotate(count=Count('pk'), amount=Sum('amount', filter=Q(transaction_type='DEPOSIT', is_reversed=False, transaction_date__date__range=[start_date, end_date]))).order_by(), 'savings_count', 'deposit_amount')
+    return metrics
+
+def collect_report_figures(period, report_date):
+    # Every period figure covers start_date..report_date, so a report rebuilt for a past date ignores activity after it.
+    start_date = period_start(period, report_date)
+    accounts = ClientAccount.objects.aggregate(total=Count('pk'), active=Count('pk', filter=Q(account_status=ClientAccount.STATUS_ACTIVE)), savings=Sum('savings_balance'))
+    applications = LoanApplication.objects.aggregate(pending=Count('pk', filter=Q(status__in=PENDING_APPLICATION_STATUSES)), approved=Count('pk', filter=Q(status__in=APPROVED_APPLICATION_STATUSES)))
+    loans = PortfolioDailySnapshot.objects.filter(snapshot_date=report_date).aggregate(rows=Count('pk'), disbursed=Sum('principal_amount', filter=~Q(status='PENDING_DISBURSEMENT')), completed=Sum('loan_count', filter=Q(status='CLOSED')), defaulted=Sum('loan_count', filter=Q(status='DEFAULTED')))
+    if not loans['rows']:
+        loans = Loan.objects.aggregate(disbursed=Sum('principal_amount', filter=Q(disbursement_date__lte=report_date)), completed=Count('pk', filter=Q(status='CLOSED')), defaulted=Count('pk', filter=Q(status='DEFAULTED')))
+    payments = LoanPayment.objects.filter(payment_date__date__range=[start_date, report_date]).aggregate(interest=Sum('interest_amount'), count=Count('pk'))
+    savings_transactions = SavingsTransaction.objects.filter(transaction_date__date__range=[start_date, report_date]).count()
+    staff_metrics = collect_staff_metrics(start_date, report_date)
+    staff_loan_counts = {user: metrics['loans_count'] for user, metrics in staff_metrics.items() if metrics['loans_count']}
+    staff_savings_counts = {user: metrics['savings_count'] for user, metrics in staff_metrics.items() if metrics['savings_count']}
+    return {'total_accounts': accounts['total'], 'active_accounts': accounts['active'], 'total_savings': accounts['savings'] or Decimal('0'), 'total_loans_disbursed': loans['disbursed'] or Decimal('0'), 'total_loans_pending': applications['pending'], 'total_loans_approved': applications['approved'], 'total_loans_completed': loans['completed'] or 0, 'total_loans_defaulted': loans['defaulted'] or 0, 'total_interest_earned': payments['interest'] or Decimal('0'), 'total_guarantors': Guarantor.objects.count(), 'total_transactions': savings_transactions + payments['count'], 'staff_loan_counts': staff_loan_counts, 'staff_savings_counts': staff_savings_counts, 'staff_metrics': staff_metrics}
+
+def render_report_chart(period, staff_loan_counts, staff_savings_counts):
+    # Figure renders through the Agg canvas without pyplot's global state, so it is safe in workers and headless hosts.
+    staff = sorted(set(staff_loan_counts) | set(staff_savings_counts), key=int)
+    loan_counts = [staff_loan_counts.get(user, 0) for user in staff]
+    fig = Figure(figsize=(8, 5))
+    ax = fig.subplots()
+    ax.bar(staff, loan_counts, label='Loans', color='#4CAF50')
+    ax.bar(staff, [staff_savings_counts.get(user, 0) for user in staff], bottom=loan_counts, label='Savings', color='#2196F3')
     ax.set_xlabel('Staff ID')
     ax.set_ylabel('Count')
     ax.set_title(f'{period} Staff Performance')
     ax.legend()
     ax.grid(axis='y', linestyle='--', alpha=0.7)
+    fig.tight_layout()
     buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    report = SystemReport.objects.create(report_type=period, report_date=today, generated_by=user, total_accounts=accounts.count(), active_accounts=accounts.filter(is_active=True).count(), total_savings=total_savings, total_loans_disbursed=total_loans_disbursed, total_loans_pending=total_loans_pending, total_loans_approved=total_loans_approved, total_loans_completed=total_loans_completed, total_loans_defaulted=total_loans_defaulted, total_interest_earned=total_interest_earned, total_guarantors=total_guarantors, total_transactions=total_transactions, staff_loan_counts=staff_loan_counts, staff_savings_counts=staff_savings_counts)
-    report.chart_image.save(f'{period}_{today}.png', ContentFile(buf.read()))
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+def generate_periodic_report(user=None, period='DAILY', report_date=None, render_chart=True):
+    report_date = report_date or timezone.now().date()
+    figures = collect_report_figures(period, report_date)
+    report = SystemReport.objects.filter(report_type=period, report_date=report_date).order_by('-generated_at').first() or SystemReport(report_type=period, report_date=report_date)
+    for field, value in figures.items():
+        setattr(report, field, value)
+    report.generated_by = user
     report.save()
+    if render_chart:
+        report.chart_image.save(f'{period}_{report_date}.png', ContentFile(render_report_chart(period, figures['staff_loan_counts'], figures['staff_savings_counts'])))
     if user:
-        ActivityLog.objects.create(user=user, action=f'Generated {period} report')
-    buf.close()
-    plt.close()
-    return report
\ No newline at end of file
+        audit.record(ActivityLog, user=user, action=f'Generated {period} report')
+    return report
@@ -1,16 +1,17 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, FileResponse
+from django.http import FileResponse
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from io import BytesIO
-import csv
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Image
 from .models import SystemReport, ActivityLog
-from .utils import generate_periodic_report
+from .utils import generate_periodic_report, collect_staff_metrics, period_start
+from django.db.models import Count, Q
 from client_accounts.models import ClientAccount, SavingsTransaction
-from loans.models import LoanApplication, LoanPayment
+from loans.models import Loan, LoanApplication, LoanPayment
+from core.exports import choice_labels, stream_rows, streaming_csv_response
 
 @login_required
 def owner_monitoring(request):
@@ -59,8 +60,17 @@ def top_savers_report(request):
 
 @login_required
 def staff_performance_report(request):
-    reports = SystemReport.objects.order_by('-report_date')
-    return render(request, 'reports/staff/performance.html', {'reports': reports})
+    period = request.GET.get('period', 'MONTHLY')
+    today = timezone.now().date()
+    start_date = period_start(period, today)
+    metrics = collect_staff_metrics(start_date, today)
+    reports_count = dict(SystemReport.objects.filter(generated_by__isnull=False).values_list('generated_by').annotate(count=Count('pk')).order_by())
+    staff_list = list(request.user.__class__.objects.filter(Q(is_staff=True) | Q(pk__in=[int(user) for user in metrics])).order_by('username'))
+    for staff in staff_list:
+        for field, value in metrics.get(str(staff.pk), {}).items():
+            setattr(staff, field, value)
+        staff.reports_count = reports_count.get(staff.pk, 0)
+    return render(request, 'reports/staff/performance.html', {'staff_list': staff_list, 'period': period, 'start_date': start_date})
 
 @login_required
 def staff_loans_report(request):
@@ -89,47 +99,24 @@ def profit_loss_report(request):
 
 @login_required
 def export_loans_csv(request):
-    loans = LoanApplication.objects.all()
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="loans.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['ID', 'Client', 'Amount', 'Status', 'Disbursed Date'])
-    for loan in loans:
-        writer.writerow([loan.id, loan.client, loan.loan_amount, loan.status, loan.disbursed_date])
-    return response
+    statuses = choice_labels(Loan, 'status')
+    rows = stream_rows(Loan.objects.order_by('-disbursement_date', '-pk'), ['loan_number', 'client__account_type', 'client__person1_first_name', 'client__person1_last_name', 'client__person2_first_name', 'client__person2_last_name', 'principal_amount', 'remaining_balance', 'status', 'disbursement_date'])
+    return streaming_csv_response('loans.csv', ['Loan Number', 'Client', 'Principal', 'Balance', 'Status', 'Disbursed Date'], ([number, ClientAccount.format_account_name(*name), principal, balance, statuses.get(status, status), disbursed] for number, *name, principal, balance, status, disbursed in rows))
 
 @login_required
 def export_savings_csv(request):
-    accounts = ClientAccount.objects.all()
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="savings.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['ID', 'Client', 'Balance'])
-    for account in accounts:
-        writer.writerow([account.id, account.client, account.savings_balance])
-    return response
+    rows = stream_rows(ClientAccount.objects.order_by('pk'), ['pk', 'account_number', 'account_type', 'person1_first_name', 'person1_last_name', 'person2_first_name', 'person2_last_name', 'savings_balance'])
+    return streaming_csv_response('savings.csv', ['ID', 'Account Number', 'Client', 'Balance'], ([pk, number, ClientAccount.format_account_name(*name), balance] for pk, number, *name, balance in rows))
 
 @login_required
 def export_staff_csv(request):
-    users = request.user.__class__.objects.all()
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="staff.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['ID', 'Username', 'Email'])
-    for user in users:
-        writer.writerow([user.id, user.username, user.email])
-    return response
+    return streaming_csv_response('staff.csv', ['ID', 'Username', 'Email'], stream_rows(request.user.__class__.objects.order_by('pk'), ['id', 'username', 'email']))
 
 @login_required
 def export_financial_csv(request):
-    reports = SystemReport.objects.order_by('-report_date')
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="financial_reports.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Report Type', 'Date', 'Total Accounts', 'Active Accounts', 'Total Savings', 'Loans Disbursed', 'Pending', 'Approved', 'Completed', 'Defaulted', 'Interest Earned', 'Guarantors', 'Transactions'])
-    for report in reports:
-        writer.writerow([report.get_report_type_display(), report.report_date, report.total_accounts, report.active_accounts, report.total_savings, report.total_loans_disbursed, report.total_loans_pending, report.total_loans_approved, report.total_loans_completed, report.total_loans_defaulted, report.total_interest_earned, getattr(report, 'total_guarantors', 0), getattr(report, 'total_transactions', 0)])
-    return response
+    report_types = choice_labels(SystemReport, 'report_type')
+    rows = stream_rows(SystemReport.objects.order_by('-report_date'), ['report_type', 'report_date', 'total_accounts', 'active_accounts', 'total_savings', 'total_loans_disbursed', 'total_loans_pending', 'total_loans_approved', 'total_loans_completed', 'total_loans_defaulted', 'total_interest_earned', 'total_guarantors', 'total_transactions'])
+    return streaming_csv_response('financial_reports.csv', ['Report Type', 'Date', 'Total Accounts', 'Active Accounts', 'Total Savings', 'Loans Disbursed', 'Pending', 'Approved', 'Completed', 'Defaulted', 'Interest Earned', 'Guarantors', 'Transactions'], ([report_types.get(report_type, report_type), *values] for report_type, *values in rows))
 
 @login_required
 def export_financial_pdf(request):
@@ -234,14 +221,8 @@ def export_profit_loss_pdf(request):
 
 @login_required
 def export_loans_defaults_csv(request):
-    loans = LoanApplication.objects.filter(status='DEFAULTED')
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="loan_defaults.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['ID', 'Client', 'Amount', 'Status', 'Disbursed Date', 'Default Date'])
-    for loan in loans:
-        writer.writerow([loan.id, loan.client, loan.loan_amount, loan.status, loan.disbursed_date, timezone.now().date()]) # Placeholder
-    return response
+    rows = stream_rows(Loan.objects.filter(status='DEFAULTED').order_by('-days_overdue', 'pk'), ['loan_number', 'client__account_type', 'client__person1_first_name', 'client__person1_last_name', 'client__person2_first_name', 'client__person2_last_name', 'principal_amount', 'remaining_balance', 'disbursement_date', 'overdue_amount', 'days_overdue'])
+    return streaming_csv_response('loan_defaults.csv', ['Loan Number', 'Client', 'Principal', 'Balance', 'Disbursed Date', 'Overdue Amount', 'Days Overdue'], ([number, ClientAccount.format_account_name(*name), principal, balance, disbursed, overdue, days] for number, *name, principal, balance, disbursed, overdue, days in rows))
 
 @login_required
 def export_loans_defaults_pdf(request):